@@ -24,6 +24,10 @@ if __name__ == '__main__':
         'pytest',
     ]
 
+    arrow_requirements = [
+        'pyarrow',
+    ]
+
     doc_requirements = [
         'sphinx>=3.0.0',
         'sphinx-autodoc-typehints',
@@ -52,6 +56,7 @@ if __name__ == '__main__':
         install_requires=install_requirements,
         tests_require=test_requirements,
         extras_require={
+            'arrow': arrow_requirements,
             'docs': doc_requirements,
             'test': test_requirements,
             'dev': doc_requirements + test_requirements
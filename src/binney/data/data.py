@@ -1,18 +1,20 @@
+from copy import deepcopy
 from dataclasses import dataclass
-from typing import Optional, List, Dict, Any, Union
+from pathlib import Path
+from typing import Optional, List, Dict, Any, Union, Tuple
 import numpy as np
 
 import pandas as pd
+from scipy.linalg import block_diag
 
 from anml.data.data import Data
 from anml.data.data import DataSpecs
 from anml.parameter.parameter import Parameter, ParameterSet
 from anml.parameter.spline_variable import Spline
-from anml.parameter.prior import GaussianPrior
 from anml.parameter.variables import Variable, Intercept
-from anml.parameter.processors import process_all
+from anml.parameter.utils import build_linear_constraint
 from binney import BinneyException
-from binney.utils import expit
+from binney.utils import expit, identity
 from binney.data.splines import make_spline_variables
 
 
@@ -25,10 +27,155 @@ class BinomDataError(BinneyException):
     pass
 
 
+def share_columns(df: pd.DataFrame, columns: Optional[List[str]] = None,
+                  replace: Optional[Dict[str, np.ndarray]] = None) -> pd.DataFrame:
+    """
+    Builds a new data frame out of columns of an existing data frame without
+    copying them. The shared arrays are marked read-only so that the same
+    memory can be safely used by several data frames at once.
+
+    Parameters
+    ----------
+    df
+        Data frame to take the columns from.
+    columns
+        Columns to keep. Defaults to all of the columns in df.
+    replace
+        Optional dictionary of arrays that replace the columns of the same name.
+
+    Returns
+    -------
+    A new data frame that shares memory with df.
+    """
+    if columns is None:
+        columns = df.columns
+    if replace is None:
+        replace = dict()
+    arrays = dict()
+    for col in columns:
+        if col in replace:
+            array = np.asarray(replace[col]).view()
+        else:
+            array = df[col].to_numpy().view()
+        array.flags.writeable = False
+        arrays[col] = array
+    return pd.DataFrame(arrays, index=df.index, copy=False)
+
+
+DataSource = Union[pd.DataFrame, Dict[str, np.ndarray], str, Path, Any]
+
+
+def _arrow_to_numpy(column) -> np.ndarray:
+    """
+    Converts a pyarrow chunked array to numpy, without copying it
+    when it has one chunk of a primitive type without nulls.
+    """
+    if column.num_chunks == 1:
+        return column.chunk(0).to_numpy(zero_copy_only=False)
+    return column.to_numpy()
+
+
+def load_columns(data: DataSource, columns: Optional[List[str]] = None) -> pd.DataFrame:
+    """
+    Builds a data frame with only the requested columns of a data source, without
+    copying them wherever possible. The columns of the data frame are read-only.
+
+    The data source can be a pandas data frame, a dictionary of numpy arrays
+    (including memory-mapped arrays, e.g. from :code:`np.load(..., mmap_mode='r')`),
+    a pyarrow Table, or the path to a Parquet file. A Parquet file is memory-mapped
+    and only the requested columns are read. Arrow columns without nulls in a
+    single chunk are used in place; other columns are converted to numpy.
+    Reading Arrow tables and Parquet files needs pyarrow.
+
+    Parameters
+    ----------
+    data
+        Data source.
+    columns
+        Columns to keep. Defaults to all of the columns in the data source.
+
+    Returns
+    -------
+    A data frame with read-only columns.
+    """
+    if isinstance(data, (str, Path)):
+        try:
+            import pyarrow.parquet as pq
+        except ImportError:
+            raise BinomDataError("Reading Parquet files needs pyarrow. "
+                                 "Install it with pip install pyarrow.")
+        available = pq.read_schema(data).names
+        if columns is not None:
+            missing = [col for col in columns if col not in available]
+            if len(missing) > 0:
+                raise BinomDataError(f"Columns {missing} are not in the data.")
+        data = pq.read_table(data, columns=columns, memory_map=True)
+
+    if isinstance(data, pd.DataFrame):
+        available = data.columns
+    elif isinstance(data, dict):
+        available = data.keys()
+    elif hasattr(data, 'column_names'):
+        available = data.column_names
+    else:
+        raise BinomDataError(f"Unsupported type of data {type(data)}. Pass a data frame, a "
+                             f"dictionary of arrays, a pyarrow Table or a Parquet file.")
+    if columns is None:
+        columns = list(available)
+    missing = [col for col in columns if col not in available]
+    if len(missing) > 0:
+        raise BinomDataError(f"Columns {missing} are not in the data.")
+
+    if isinstance(data, pd.DataFrame):
+        return share_columns(df=data, columns=columns)
+    if isinstance(data, dict):
+        arrays = {col: np.asarray(data[col]).view() for col in columns}
+    else:
+        arrays = {col: _arrow_to_numpy(data.column(col)) for col in columns}
+    lengths = set(len(array) for array in arrays.values())
+    if len(lengths) > 1:
+        raise BinomDataError(f"Columns have different lengths {sorted(lengths)}.")
+    for array in arrays.values():
+        array.flags.writeable = False
+    return pd.DataFrame(arrays, copy=False)
+
+
+def unique_rows(df: pd.DataFrame,
+                columns: List[str]) -> Tuple[pd.DataFrame, Optional[np.ndarray]]:
+    """
+    Finds the unique combinations of values of some columns of a data frame, so
+    that something that only depends on those columns can be computed once for each
+    combination and broadcast back to the rows with :code:`values[inverse]`.
+
+    Parameters
+    ----------
+    df
+        Data frame.
+    columns
+        Columns whose combinations of values to find. Missing values are
+        treated as equal to each other.
+
+    Returns
+    -------
+    The rows of df with the first occurrence of each combination, in the order
+    that they appear in df, and an array with the position of the combination of
+    each row of df in those rows. If there are no repeated combinations, returns
+    df itself and None instead.
+    """
+    if len(df) == 0 or len(columns) == 0:
+        return df, None
+    inverse = df.groupby(list(columns), sort=False, dropna=False).ngroup().to_numpy()
+    _, first = np.unique(inverse, return_index=True)
+    if len(first) == len(df):
+        return df, None
+    return df.iloc[first], inverse
+
+
 @dataclass
 class BinomDataSpecs(DataSpecs):
 
     col_total: str = None
+    col_weight: str = None
 
     def __post_init__(self):
         pass
@@ -36,7 +183,8 @@ class BinomDataSpecs(DataSpecs):
 
 class LRSpecs:
     def __init__(self, col_success: str, col_total: str,
-                 col_group: Optional[str] = None,
+                 col_group: Optional[Union[str, List[str]]] = None,
+                 col_weight: Optional[str] = None,
                  covariates: Optional[List[str]] = None,
                  splines: Optional[Dict[str, Dict[str, Any]]] = None,
                  coefficient_priors: Optional[List[float]] = None,
@@ -52,27 +200,52 @@ class LRSpecs:
         col_total
             The column name of the total, or the number of trials.
         col_group
-            Optional grouping column.
+            Optional grouping column, or list of nested grouping
+            columns from the outermost to the innermost level.
+        col_weight
+            Optional column of observation weights that multiply each row's
+            contribution to the likelihood.
         covariates
             List of covariate names to include as fixed effects.
         splines
             A dictionary with spline specifications. Valid options include
             knots_type, knots_num, degree, r_linear (linear tail on right),
             l_linear (linear tail on left), increasing (monotonic increasing constraint),
-            decreasing (monotonic decreasing constraint), concave, and convex.
+            decreasing (monotonic decreasing constraint), concave, convex,
+            constraint_grid_size (number of points to impose the shape constraints at,
+            20 by default), and bins (number of points of a grid to snap the covariate
+            to for an approximate fit, see :code:`LRSpecs.aggregate()`).
         """
 
         self.covariates = covariates
         self.splines = splines
+        self.coefficient_priors = None if coefficient_priors is None else list(coefficient_priors)
+        self.coefficient_prior_var = coefficient_prior_var
         self.parameter_set = None
+        self.prior_mean = None
+        self.prior_std = None
+        self._df = None
+        self._design_matrix = None
+        self._constraints = None
+
+        for spline, options in (splines or dict()).items():
+            if 'bins' in options:
+                if options.get('knots_type', 'frequency') != 'domain':
+                    raise BinomDataError(f"Binning spline {spline} needs knots_type 'domain', "
+                                         f"since the aggregated data has the wrong frequencies.")
+                if options['bins'] < 2:
+                    raise BinomDataError(f"Binning spline {spline} needs at least 2 bins.")
 
-        if col_group is not None:
+        if col_group is None:
+            col_groups = None
+        elif isinstance(col_group, str):
             col_groups = [col_group]
         else:
-            col_groups = None
+            col_groups = list(col_group)
         self.data_specs = BinomDataSpecs(
             col_obs=col_success,
             col_total=col_total,
+            col_weight=col_weight,
             col_groups=col_groups
         )
         self.make_parameter_set(
@@ -84,62 +257,297 @@ class LRSpecs:
             param_set=self.parameter_set
         )
 
+    @property
+    def columns(self) -> List[str]:
+        """
+        The columns of a data frame that these specifications use.
+        """
+        columns = [self.data_specs.col_obs, self.data_specs.col_total]
+        if self.data_specs.col_weight is not None:
+            columns.append(self.data_specs.col_weight)
+        if self.data_specs.col_groups is not None:
+            columns += self.data_specs.col_groups
+        if self.covariates is not None:
+            columns += self.covariates
+        if self.splines is not None:
+            columns += list(self.splines.keys())
+        return list(dict.fromkeys(columns))
+
+    @property
+    def prediction_columns(self) -> List[str]:
+        """
+        The columns of a data frame that predictions depend on.
+        """
+        columns = []
+        if self.data_specs.col_groups is not None:
+            columns += self.data_specs.col_groups
+        if self.covariates is not None:
+            columns += self.covariates
+        if self.splines is not None:
+            columns += list(self.splines.keys())
+        return list(dict.fromkeys(columns))
+
+    def deduplicate(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, Optional[np.ndarray]]:
+        """
+        Finds the unique combinations of the prediction columns of a data frame
+        with :func:`unique_rows`, so that predictions are made once for each
+        combination.
+
+        Parameters
+        ----------
+        df
+            Data frame to make predictions for.
+
+        Returns
+        -------
+        The unique rows and the inverse index, or df and None if
+        there are no repeated rows.
+        """
+        return unique_rows(df=df, columns=self.prediction_columns)
+
+    @property
+    def binned_splines(self) -> Dict[str, int]:
+        """
+        The number of bins of each spline covariate that is binned.
+        """
+        return {
+            spline: options['bins']
+            for spline, options in (self.splines or dict()).items() if 'bins' in options
+        }
+
+    def aggregate(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Approximates the data for a faster fit. Each binned spline covariate is
+        snapped to the nearest point of an evenly spaced grid of bins points from its
+        minimum to its maximum, so the spline knots don't change, and then the rows
+        with the same values of all of the prediction columns are aggregated into one
+        row with the sum of their successes and totals, which stay integers for
+        unweighted data. Observation weights are multiplied into the successes and
+        totals, and the weights of the aggregated rows are one. Fitting then costs
+        time in the number of occupied bins rather than the number of rows.
+
+        Parameters
+        ----------
+        df
+            Data frame with all of the columns in :code:`LRSpecs.columns`.
+
+        Returns
+        -------
+        The aggregated data frame, or df if no splines are binned.
+        """
+        bins = self.binned_splines
+        if len(bins) == 0:
+            return df
+        col_obs, col_total = self.data_specs.col_obs, self.data_specs.col_total
+        col_weight = self.data_specs.col_weight
+
+        columns = {col: df[col].to_numpy() for col in self.prediction_columns}
+        for spline, n_bins in bins.items():
+            x = df[spline].to_numpy(dtype=float)
+            lower, upper = np.nanmin(x), np.nanmax(x)
+            if upper > lower:
+                grid = np.linspace(lower, upper, n_bins)
+                index = np.rint((x - lower) / (upper - lower) * (n_bins - 1))
+                columns[spline] = np.where(np.isnan(x), x, grid[np.nan_to_num(index).astype(int)])
+        obs = df[col_obs].to_numpy()
+        total = df[col_total].to_numpy()
+        if col_weight is not None:
+            obs = obs * df[col_weight].to_numpy()
+            total = total * df[col_weight].to_numpy()
+        columns[col_obs] = obs
+        columns[col_total] = total
+
+        aggregated = pd.DataFrame(columns).groupby(
+            self.prediction_columns, sort=False, dropna=False
+        )[[col_obs, col_total]].sum().reset_index()
+        if col_weight is not None:
+            aggregated[col_weight] = 1.
+        return aggregated[self.columns]
+
+    def compact(self, df: DataSource) -> pd.DataFrame:
+        """
+        Keeps only the columns that these specifications use, without
+        copying them, so that a wide data frame doesn't need to be carried
+        around through fitting and bootstrapping.
+
+        Parameters
+        ----------
+        df
+            Data frame with (at least) all of the columns in :code:`LRSpecs.columns`,
+            or any other data source that :func:`load_columns` can read.
+
+        Returns
+        -------
+        A data frame with read-only columns shared with df.
+        """
+        return load_columns(data=df, columns=self.columns)
+
+    def copy_specs(self) -> 'LRSpecs':
+        """
+        Creates a new LRSpecs with the same specifications. Unlike a deep copy,
+        this does not copy any data or design matrices, and the new specs need
+        to be configured with data before they are used.
+        """
+        col_groups = self.data_specs.col_groups
+        return LRSpecs(
+            col_success=self.data_specs.col_obs,
+            col_total=self.data_specs.col_total,
+            col_group=col_groups,
+            col_weight=self.data_specs.col_weight,
+            covariates=None if self.covariates is None else list(self.covariates),
+            splines=None if self.splines is None else deepcopy(self.splines),
+            coefficient_priors=self.coefficient_priors,
+            coefficient_prior_var=self.coefficient_prior_var
+        )
+
     def make_parameter_set(self, coefficient_priors: Optional[List[float]] = None,
                            coefficient_prior_var: Optional[float] = None):
-        if coefficient_priors is not None:
-            intercept = [Intercept(
-                fe_prior=GaussianPrior(
-                    mean=[coefficient_priors.pop(0)],
-                    std=[coefficient_prior_var**0.5]
-                )
-            )]
-        else:
-            intercept = [Intercept()]
+        """
+        Builds the parameter set with an intercept, the covariates
+        and the spline variables, and sets the coefficient priors.
+
+        Parameters
+        ----------
+        coefficient_priors
+            Optional prior means for all of the coefficients, in the order
+            of the parameter set variables.
+        coefficient_prior_var
+            Variance of the Gaussian priors on the coefficients.
+        """
+        intercept = [Intercept()]
         if self.covariates is not None:
-            if coefficient_priors is None:
-                covariate_variables = [
-                    Variable(covariate=cov) for cov in self.covariates
-                ]
-            else:
-                covariate_variables = [
-                    Variable(
-                        covariate=cov,
-                        fe_prior=GaussianPrior(
-                            mean=[coefficient_priors.pop(0)],
-                            std=[coefficient_prior_var**0.5]
-                        )
-                    ) for cov in self.covariates
-                ]
+            covariate_variables = [
+                Variable(covariate=cov) for cov in self.covariates
+            ]
         else:
             covariate_variables = list()
 
         spline_variables = list()
         if self.splines is not None:
-            spline_variables = make_spline_variables(self.splines,
-                                                     coefficient_priors,
-                                                     coefficient_prior_var)
+            spline_variables = make_spline_variables(self.splines)
 
+        variables = intercept + covariate_variables + spline_variables
+        for variable in variables:
+            # anml's default link is a lambda, which can't be pickled
+            variable.var_link_fun = identity
         parameter = Parameter(
             param_name='p',
-            variables=intercept + covariate_variables + spline_variables,
-            link_fun=lambda x: expit(x)
+            variables=variables,
+            link_fun=expit
         )
         self.parameter_set = ParameterSet(
             parameters=[parameter]
         )
+        self._reset()
+        self.prior_mean = np.zeros(self.parameter_set.num_fe)
+        self.prior_std = np.full(self.parameter_set.num_fe, np.inf)
+        if coefficient_priors is not None:
+            self.update_priors(
+                coefficient_priors=coefficient_priors,
+                coefficient_prior_var=coefficient_prior_var
+            )
+
+    def update_priors(self, coefficient_priors: Union[List[float], np.ndarray],
+                      coefficient_prior_var: Union[float, np.ndarray]):
+        """
+        Updates the Gaussian priors on the coefficients in place. Nothing
+        else about the specs changes, so the parameter set, the design matrix
+        and the constraint matrices are kept as they are.
+
+        Parameters
+        ----------
+        coefficient_priors
+            Prior means for all of the coefficients.
+        coefficient_prior_var
+            Variance of the Gaussian priors, either one for all of the
+            coefficients or one per coefficient.
+        """
+        if len(coefficient_priors) != len(self.prior_mean):
+            raise BinomDataError(f"Expected {len(self.prior_mean)} coefficient priors, "
+                                 f"got {len(coefficient_priors)}.")
+        self.prior_mean[:] = coefficient_priors
+        self.prior_std[:] = np.sqrt(coefficient_prior_var)
+
+    def _reset(self):
+        """
+        Drops the cached matrices, which are rebuilt on their next access.
+        """
+        self._design_matrix = None
+        self._constraints = None
+
+    @property
+    def has_shape_constraints(self) -> bool:
+        """
+        Whether any of the splines have shape constraints.
+        """
+        return any(
+            len(var.derivative_constr) > 0
+            for var in self.parameter_set.variables if isinstance(var, Spline)
+        )
 
     def configure_data(self, df: pd.DataFrame):
+        """
+        Attaches a data frame to fit to. The design and constraint matrices
+        are only built when they are first used, and are kept until the specs
+        are configured with another data frame or the parameter set is rebuilt.
+        Configuring the specs with the same data frame again does nothing, so
+        don't modify a data frame in place after configuring the specs with it.
 
+        Parameters
+        ----------
+        df
+            Data frame with all of the columns used by the specs.
+        """
+        if df is self._df:
+            return
         self.data.process_data(df=df)
-        for var in self.parameter_set.variables:
-            var.build_design_matrix_fe(df=df)
-            var.build_constraint_matrix_fe()
-        process_all(self.parameter_set, df)
+        self._df = df
+        self._reset()
 
-    def configure_new_data(self, df: pd.DataFrame):
+    @property
+    def design_matrix(self) -> np.ndarray:
+        """
+        Design matrix for the data frame that the specs are configured with.
+        """
+        if self._design_matrix is None:
+            for var in self.parameter_set.variables:
+                var.build_design_matrix_fe(df=self._df)
+            self._design_matrix = np.hstack([
+                var.design_matrix_fe for var in self.parameter_set.variables
+            ])
+            self.parameter_set.design_matrix_fe = self._design_matrix
+        return self._design_matrix
+
+    @property
+    def constraints(self) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Linear constraint matrix with its lower and upper bounds, for the
+        spline shape constraints on the data frame that the specs are configured with.
+        """
+        if self._constraints is None:
+            # the splines are created with the design matrix
+            self.design_matrix
+            for var in self.parameter_set.variables:
+                var.build_constraint_matrix_fe()
+            variables = self.parameter_set.variables
+            mat = block_diag(*[var.constr_matrix_fe for var in variables])
+            lb = np.hstack([var.constr_lb_fe for var in variables])
+            ub = np.hstack([var.constr_ub_fe for var in variables])
+            # variables without constraints have a row of zeros
+            rows = np.any(mat != 0, axis=1)
+            if np.any(rows):
+                mat, lb, ub = mat[rows], lb[rows], ub[rows]
+            else:
+                mat, lb, ub = np.zeros((1, mat.shape[1])), np.zeros(1), np.zeros(1)
+            self._constraints = build_linear_constraint([(mat, lb, ub)])
+        return self._constraints
+
+    def configure_new_data(self, df: pd.DataFrame) -> np.ndarray:
         """
         Processes a new data frame so that it will create
-        a new design matrix.
+        a new design matrix. Only the design matrix is built. The spline
+        columns are evaluated at the covariate values of df with the splines
+        that were created for the data that the specs are configured with.
 
         Parameters
         ----------
@@ -149,12 +557,20 @@ class LRSpecs:
 
         Returns
         -------
-
+        The design matrix for the new data frame, which is also
+        stored in :code:`self.parameter_set.design_matrix_fe`.
         """
+        if self.splines:
+            # the splines are created with the design matrix
+            self.design_matrix
+        blocks = []
         for var in self.parameter_set.variables:
             if isinstance(var, Spline):
-                var.build_design_matrix_fe(df=df, create_spline=False)
+                basis = var.spline.design_mat(df[var.covariate].to_numpy())
+                blocks.append(basis if var.include_intercept else basis[:, 1:])
             else:
                 var.build_design_matrix_fe(df=df)
-            var.build_constraint_matrix_fe()
-        process_all(self.parameter_set, df)
+                blocks.append(var.design_matrix_fe)
+        design_matrix = np.hstack(blocks)
+        self.parameter_set.design_matrix_fe = design_matrix
+        return design_matrix
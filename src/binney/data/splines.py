@@ -2,7 +2,6 @@ import numpy as np
 from typing import Dict, Union, Optional, Any, List
 
 from anml.parameter.spline_variable import SplineLinearConstr, Spline
-from anml.parameter.prior import GaussianPrior
 from binney import BinneyException
 
 
@@ -15,7 +14,9 @@ VALID_SPLINE_OPTIONS = {
     'increasing': bool,
     'decreasing': bool,
     'concave': bool,
-    'convex': bool
+    'convex': bool,
+    'constraint_grid_size': int,
+    'bins': int
 }
 
 
@@ -33,26 +34,53 @@ SPLINE_CONSTR_DICT = {
 }
 
 
-def make_spline_variables(splines: Dict[str, Dict[str, Any]],
-                          coefficient_priors: Optional[List[float]] = None,
-                          coefficient_prior_var: Optional[float] = None) -> List[Spline]:
+def make_spline_constraint(option: str, grid_size: Optional[int] = None) -> SplineLinearConstr:
     """
-    Creates spline variables with optional coefficient priors and shape constraints.
+    Creates a shape constraint for a spline.
+
+    Parameters
+    ----------
+    option
+        One of the shape constraint options in VALID_SPLINE_CONSTR_OPTIONS.
+    grid_size
+        Number of points to impose the constraint at. Defaults to the grid size in
+        SPLINE_CONSTR_DICT.
+
+    Returns
+    -------
+    A spline linear constraint.
+    """
+    constraint = SPLINE_CONSTR_DICT[option]
+    if grid_size is None:
+        return constraint
+    return SplineLinearConstr(
+        order=constraint.order,
+        y_bounds=constraint.y_bounds,
+        grid_size=grid_size
+    )
+
+
+def make_spline_variables(splines: Dict[str, Dict[str, Any]]) -> List[Spline]:
+    """
+    Creates spline variables with optional shape constraints. Their coefficient
+    priors are set by :class:`~binney.data.data.LRSpecs`.
 
     Parameters
     ----------
     splines
-    coefficient_priors
-    coefficient_prior_var
 
     Returns
     -------
     List of spline variables that can be used in a parameter.
     """
     spline_variables = []
-    for spline, options in splines.items():
+    for spline, spline_options in splines.items():
+        options = spline_options.copy()
         spline_constraints = list()
-        for option, value in options.copy().items():
+        grid_size = options.pop('constraint_grid_size', None)
+        # binning is applied to the data, see LRSpecs.aggregate
+        options.pop('bins', None)
+        for option, value in spline_options.items():
             if not type(value) == VALID_SPLINE_OPTIONS[option]:
                 raise BinneyException(
                     f"Invalid type of spline option {option}."
@@ -61,22 +89,12 @@ def make_spline_variables(splines: Dict[str, Dict[str, Any]],
             if option in VALID_SPLINE_CONSTR_OPTIONS.copy():
                 options.pop(option)
                 if value:
-                    constraint = SPLINE_CONSTR_DICT[option]
+                    constraint = make_spline_constraint(option, grid_size=grid_size)
                     spline_constraints.append(constraint)
         spline_variable = Spline(
             covariate=spline,
             **options,
             derivative_constr=spline_constraints
         )
-
-        if coefficient_priors is not None:
-            num_fe = spline_variable._count_num_fe()
-            priors = coefficient_priors[0:num_fe]
-            coefficient_priors = coefficient_priors[num_fe:]
-            fe_prior = GaussianPrior(
-                mean=priors,
-                std=[coefficient_prior_var] * num_fe
-            )
-            spline_variable.fe_prior = fe_prior
         spline_variables.append(spline_variable)
     return spline_variables
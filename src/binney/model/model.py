@@ -1,8 +1,9 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
-from typing import Optional
+from typing import Optional, Callable, Tuple, List
 from anml.models.interface import Model
 from anml.data.data import Data
-from anml.parameter.utils import build_linear_constraint
 
 from binney.data.data import LRSpecs
 from binney.utils import expit
@@ -10,13 +11,56 @@ from binney.utils import expit
 
 class BinomialModel(Model):
 
-    def __init__(self):
-
+    def __init__(self, n_threads: int = 1, block_size: int = 65536):
+        """
+        Binomial likelihood with a logit link and Gaussian priors on the coefficients.
+
+        Parameters
+        ----------
+        n_threads
+            Number of threads to evaluate the objective, gradient and Hessian with.
+            With more than one thread, the rows are split into blocks of block_size
+            rows, the contribution of each block is computed in a thread pool, and
+            the contributions are added up. Each thread keeps its own work buffers
+            between evaluations. Limit the threads of the BLAS library (e.g. with
+            OMP_NUM_THREADS) so that the two don't compete for the cores.
+        block_size
+            Number of rows in a block.
+        """
         super().__init__()
         self.lr_specs = None
         self.C = None
         self.c_lb = None
         self.c_ub = None
+        self.n_threads = n_threads
+        self.block_size = block_size
+        self._invariant_key = None
+        self._invariant_values = None
+        self._start_pool()
+
+    def _start_pool(self):
+        self._executor = None
+        if self.n_threads > 1:
+            self._executor = ThreadPoolExecutor(max_workers=self.n_threads)
+        self._local = threading.local()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_executor'], state['_local']
+        state['_invariant_key'] = None
+        state['_invariant_values'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._start_pool()
+
+    def __copy__(self):
+        # copies, e.g. for the groups of a hierarchy, share the thread pool
+        # and the per-thread work buffers rather than starting new pools
+        model = self.__class__.__new__(self.__class__)
+        model.__dict__.update(self.__dict__)
+        return model
 
     @property
     def parameter_set(self):
@@ -24,60 +68,157 @@ class BinomialModel(Model):
 
     def attach_specs(self, lr_specs: LRSpecs):
         self.lr_specs = lr_specs
-        self.C, self.c_lb, self.c_ub = build_linear_constraint([
-            (self.parameter_set.constr_matrix_fe,
-             self.parameter_set.constr_lb_fe,
-             self.parameter_set.constr_ub_fe),
-        ])
+        # only build the constraint matrices if there are shape constraints
+        if lr_specs.has_shape_constraints:
+            self.C, self.c_lb, self.c_ub = lr_specs.constraints
+        else:
+            self.C, self.c_lb, self.c_ub = None, None, None
+        self._invariants(lr_specs.data)
 
     def detach_specs(self):
         self.lr_specs = None
+        self._invariant_key = None
+        self._invariant_values = None
         self.C = None
         self.c_lb = None
         self.c_ub = None
 
     @property
     def design_matrix(self):
-        return self.parameter_set.design_matrix_fe
+        return self.lr_specs.design_matrix
 
-    @staticmethod
-    def _g(m, x, design_matrix):
-        return np.sum([
-            m[i] * np.log(1 + np.exp(design_matrix[i, :].dot(x)))
-            for i in range(len(m))
-        ])
+    def _prior_objective(self, x: np.ndarray):
+        return 0.5 * np.sum(((x - self.lr_specs.prior_mean) / self.lr_specs.prior_std)**2)
 
-    def objective(self, x: np.ndarray, data: Data):
-        y = data.data['obs']
-        m = data.data['total']
-
-        val = 0.
-        val += self._g(m, x, self.design_matrix) - y.T.dot(self.design_matrix).dot(x)
+    def _prior_gradient(self, x: np.ndarray):
+        return (x - self.lr_specs.prior_mean) / self.lr_specs.prior_std**2
 
-        i = 0
-        for variable in self.parameter_set.variables:
-            val += np.sum(variable.fe_prior.error_value(x[i:i + variable.num_fe]))
-            i += variable.num_fe
-        return val
+    def _prior_hessian(self):
+        return np.diag(1 / self.lr_specs.prior_std**2)
 
     @staticmethod
-    def _grad_g(m, x, design_matrix):
-        inner = np.array([
-            expit(design_matrix[i, :].T.dot(x))
-            for i in range(len(m))
-        ])
-        return design_matrix.T.dot(np.diag(m)).dot(inner)
-
-    def gradient(self, x: np.ndarray, data: Data):
+    def _counts(data: Data):
+        """
+        Gets the observed successes and totals, multiplied by the
+        observation weights if the data has a weight column.
+        """
         y = data.data['obs']
         m = data.data['total']
-        val = 0.
-        val += self._grad_g(m, x, self.design_matrix) - self.design_matrix.T.dot(y)
+        if 'weight' in data.data:
+            w = data.data['weight']
+            y = w * y
+            m = w * m
+        return y, m
+
+    def _buffers(self, n_rows: int, n_fe: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """
+        Work buffers of the current thread for a block of rows. They are sized
+        for the largest block seen so far, which is at most block_size rows,
+        and only grow when a larger block arrives.
+        """
+        buffers = getattr(self._local, 'buffers', None)
+        if buffers is None or buffers[2].shape[1] != n_fe or len(buffers[0]) < n_rows:
+            buffers = (
+                np.empty(n_rows),
+                np.empty(n_rows),
+                np.empty((n_rows, n_fe))
+            )
+            self._local.buffers = buffers
+        eta, work, weighted = buffers
+        return eta[:n_rows], work[:n_rows], weighted[:n_rows]
+
+    def _probabilities(self, x: np.ndarray, design_matrix: np.ndarray,
+                       eta: np.ndarray, p: np.ndarray) -> np.ndarray:
+        """
+        Computes the linear predictor into eta and the probabilities into p.
+        """
+        np.dot(design_matrix, x, out=eta)
+        np.negative(eta, out=p)
+        with np.errstate(over='ignore'):
+            np.exp(p, out=p)
+        p += 1
+        return np.reciprocal(p, out=p)
+
+    def _invariants(self, data: Data) -> Tuple[np.ndarray, np.ndarray, List[slice]]:
+        """
+        Gets the weighted totals, :math:`X^T y` and the blocks of rows for the
+        data. They are only computed again when the design matrix or the data
+        arrays change, e.g. when the specs are configured with a bootstrap sample.
+        """
+        design_matrix = self.design_matrix
+        key = (design_matrix, data.data['obs'], data.data['total'], data.data.get('weight'))
+        if self._invariant_key is None or \
+                any(a is not b for a, b in zip(key, self._invariant_key)):
+            y, m = self._counts(data)
+            m = np.asarray(m, dtype=float)
+            xty = design_matrix.T.dot(np.asarray(y, dtype=float))
+            blocks = [
+                slice(start, min(start + self.block_size, len(m)))
+                for start in range(0, len(m), self.block_size)
+            ]
+            self._invariant_key = key
+            self._invariant_values = (m, xty, blocks)
+        return self._invariant_values
+
+    def _block_objective(self, x: np.ndarray, m: np.ndarray, block: slice) -> float:
+        design_matrix = self.design_matrix[block]
+        eta, work, _ = self._buffers(len(design_matrix), design_matrix.shape[1])
+        np.dot(design_matrix, x, out=eta)
+        np.logaddexp(0., eta, out=work)
+        return m[block].dot(work)
+
+    def _block_gradient(self, x: np.ndarray, m: np.ndarray, block: slice) -> np.ndarray:
+        design_matrix = self.design_matrix[block]
+        eta, p, _ = self._buffers(len(design_matrix), design_matrix.shape[1])
+        self._probabilities(x, design_matrix, eta=eta, p=p)
+        p *= m[block]
+        return design_matrix.T.dot(p)
+
+    def _block_hessian(self, x: np.ndarray, m: np.ndarray, block: slice) -> np.ndarray:
+        design_matrix = self.design_matrix[block]
+        eta, p, weighted = self._buffers(len(design_matrix), design_matrix.shape[1])
+        self._probabilities(x, design_matrix, eta=eta, p=p)
+        # eta is free again, use it for the weights m * p * (1 - p)
+        np.subtract(1., p, out=eta)
+        eta *= p
+        eta *= m[block]
+        # column by column, since broadcasting would allocate ufunc buffers
+        for j in range(design_matrix.shape[1]):
+            np.multiply(design_matrix[:, j], eta, out=weighted[:, j])
+        return design_matrix.T.dot(weighted)
+
+    def _reduce_blocks(self, block_fun: Callable, x: np.ndarray, m: np.ndarray,
+                       blocks: List[slice]):
+        """
+        Adds up the contributions of the blocks of rows, computed
+        in the thread pool if there is one.
+        """
+        x = np.asarray(x, dtype=float)
+        if self._executor is None or len(blocks) == 1:
+            results = (block_fun(x, m, block) for block in blocks)
+        else:
+            results = self._executor.map(lambda block: block_fun(x, m, block), blocks)
+        total = 0.
+        for result in results:
+            total += result
+        return total
+
+    def objective(self, x: np.ndarray, data: Data):
+        m, xty, blocks = self._invariants(data)
+        val = self._reduce_blocks(self._block_objective, x, m, blocks) - xty.dot(x)
+        return val + self._prior_objective(x)
+
+    def gradient(self, x: np.ndarray, data: Data):
+        m, xty, blocks = self._invariants(data)
+        val = self._reduce_blocks(self._block_gradient, x, m, blocks)
+        val -= xty
+        val += self._prior_gradient(x)
+        return val
 
-        i = 0
-        for variable in self.parameter_set.variables:
-            val += np.sum(variable.fe_prior.grad(x[i:i+variable.num_fe]))
-            i += variable.num_fe
+    def hessian(self, x: np.ndarray, data: Data):
+        m, _, blocks = self._invariants(data)
+        val = self._reduce_blocks(self._block_hessian, x, m, blocks)
+        val += self._prior_hessian()
         return val
 
     def forward(self, x: np.ndarray, mat: Optional[np.ndarray] = None):
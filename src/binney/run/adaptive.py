@@ -0,0 +1,62 @@
+from typing import List, Sequence
+import numpy as np
+
+
+Z_95 = 1.959963984540054
+
+
+def flatten_parameters(parameters: List) -> np.ndarray:
+    """
+    Stacks bootstrap parameters into a (n_boots, n_parameters) array.
+    For a hierarchy, where the parameters for a replicate are a dictionary
+    of group parameters, the groups are concatenated in sorted order.
+
+    Parameters
+    ----------
+    parameters
+        List of bootstrap parameters.
+
+    Returns
+    -------
+    A 2-dimensional numpy array.
+    """
+    if len(parameters) > 0 and isinstance(parameters[0], dict):
+        groups = sorted(parameters[0].keys())
+        return np.vstack([
+            np.hstack([np.asarray(param[group]) for group in groups])
+            for param in parameters
+        ])
+    return np.vstack([np.asarray(param) for param in parameters])
+
+
+def quantile_mc_error(draws: np.ndarray, quantiles: Sequence[float]) -> np.ndarray:
+    """
+    Estimates the Monte Carlo standard error of the sample quantiles of each
+    column of draws. A distribution-free 95% confidence interval for the q quantile
+    lies between the order statistics of rank :math:`nq \\pm 1.96\\sqrt{nq(1-q)}`,
+    and the standard error is its half-width divided by 1.96.
+
+    Parameters
+    ----------
+    draws
+        A (n_draws, n_columns) array of draws.
+    quantiles
+        Quantiles to get the standard error for.
+
+    Returns
+    -------
+    A (len(quantiles), n_columns) array of standard errors. They are infinite
+    when there are not yet enough draws to estimate them.
+    """
+    n_draws = draws.shape[0]
+    sorted_draws = np.sort(draws, axis=0)
+    errors = np.empty((len(quantiles), draws.shape[1]))
+    for i, q in enumerate(quantiles):
+        half_width = Z_95 * np.sqrt(n_draws * q * (1 - q))
+        lower = int(np.floor(n_draws * q - half_width))
+        upper = int(np.ceil(n_draws * q + half_width))
+        if lower < 0 or upper > n_draws - 1:
+            errors[i] = np.inf
+        else:
+            errors[i] = (sorted_draws[upper] - sorted_draws[lower]) / (2 * Z_95)
+    return errors
@@ -0,0 +1,95 @@
+from typing import Optional
+
+import numpy as np
+
+from anml.solvers.interface import Solver
+
+from binney.model.model import BinomialModel
+from binney.run.bootstrap import Seed, make_seed_sequence
+from binney.solvers.hierarchical_solver import Hierarchy
+
+
+class AsymptoticUncertainty:
+    def __init__(self, solver: Solver, model: BinomialModel):
+        """
+        Asymptotic uncertainty for the parameters, as a fast alternative to the
+        bootstrap. The observed information matrix (the Hessian of the binomial
+        likelihood plus the priors) is computed at the optimal parameters, and
+        parameter draws are made from the multivariate normal distribution
+        that it implies. Spline shape constraints are not imposed on the draws.
+
+        For a hierarchy, the draws for each group come from the group-specific
+        information matrix, conditional on the priors from the global fit.
+
+        Parameters
+        ----------
+        solver
+            The solver that has been fit.
+        model
+            The model that the solver uses.
+
+        Attributes
+        ----------
+        self.parameters
+            List of parameter draws, in the same layout as the bootstrap
+            parameters: one array per draw, or one dictionary of group
+            arrays per draw for a hierarchy.
+        """
+        self.solver = solver
+        self.model = model
+        self.parameters = list()
+
+    @staticmethod
+    def _draw(x: np.ndarray, hessian: np.ndarray, n_draws: int, rng=np.random) -> np.ndarray:
+        """
+        Draws from a multivariate normal distribution with mean x and
+        precision matrix hessian, using one Cholesky factorization.
+
+        Returns
+        -------
+        A (n_draws, len(x)) array of draws.
+        """
+        chol = np.linalg.cholesky(hessian)
+        z = rng.standard_normal(size=(len(x), n_draws))
+        return (x[:, None] + np.linalg.solve(chol.T, z)).T
+
+    def make_draws(self, n_draws: int, seed: Optional[Seed] = None):
+        """
+        Makes parameter draws and stores them in :code:`self.parameters`.
+
+        Parameters
+        ----------
+        n_draws
+            Number of draws.
+        seed
+            An optional integer seed, numpy SeedSequence or numpy Generator.
+            If not passed, the global numpy random state is used.
+        """
+        if seed is None:
+            rng = np.random
+        else:
+            rng = np.random.default_rng(make_seed_sequence(seed))
+
+        if isinstance(self.solver, Hierarchy):
+            global_specs = self.model.lr_specs
+            draws = dict()
+            for group, x in self.solver.x_opt.items():
+                group_specs = self.solver.group_specs[group]
+                self.model.attach_specs(group_specs)
+                x = np.asarray(x)
+                draws[group] = self._draw(
+                    x=x, hessian=self.model.hessian(x, group_specs.data),
+                    n_draws=n_draws, rng=rng
+                )
+            self.model.attach_specs(global_specs)
+            self.parameters = [
+                {group: draws[group][i] for group in draws}
+                for i in range(n_draws)
+            ]
+        else:
+            x = np.asarray(self.solver.x_opt)
+            draws = self._draw(
+                x=x, hessian=self.model.hessian(x, self.model.lr_specs.data),
+                n_draws=n_draws, rng=rng
+            )
+            self.parameters = list(draws)
@@ -1,29 +1,260 @@
 from copy import deepcopy
+from typing import Optional, Union, Tuple, Sequence, List
 
 import numpy as np
 import pandas as pd
-from binney.data.data import LRSpecs
+from binney import BinneyException
+from binney.data.data import LRSpecs, share_columns
 from binney.model.model import BinomialModel
+from binney.run.weights import poisson_weights, dirichlet_weights, case_control_weights
+from binney.solvers.batch import batched_newton
 
 from anml.bootstrap.bootstrap import Bootstrap
 
 
+Seed = Union[int, np.random.SeedSequence, np.random.Generator]
+
+
+class BootstrapError(BinneyException):
+    pass
+
+
+def make_seed_sequence(seed: Optional[Seed] = None) -> Optional[np.random.SeedSequence]:
+    """
+    Turns a seed, a seed sequence or a generator into a seed sequence that
+    replicate generators can be derived from.
+
+    Parameters
+    ----------
+    seed
+        An integer seed, a numpy SeedSequence, or a numpy Generator.
+        A generator is used to draw the entropy of the new seed sequence.
+
+    Returns
+    -------
+    A seed sequence, or None if seed is None.
+    """
+    if seed is None:
+        return None
+    if isinstance(seed, np.random.SeedSequence):
+        return seed
+    if isinstance(seed, np.random.Generator):
+        return np.random.SeedSequence(seed.integers(2**63))
+    return np.random.SeedSequence(seed)
+
+
+def case_control_sample(df: pd.DataFrame, col_obs: str, col_total: str,
+                        fraction: float, rng=np.random) -> pd.DataFrame:
+    """
+    Subsamples the rows without a success of Bernoulli data with
+    :func:`~binney.run.weights.case_control_weights`. The weights are applied by
+    scaling the totals of the kept failures, since they have no successes to scale.
+
+    Parameters
+    ----------
+    df
+        Data frame to subsample.
+    col_obs
+        Column of observed successes.
+    col_total
+        Column of totals.
+    fraction
+        Probability of keeping a row without a success.
+    rng
+        A numpy Generator. Defaults to the global numpy random state.
+
+    Returns
+    -------
+    data frame with all of the successes and the weighted subsample of failures
+    """
+    index, weights = case_control_weights(obs=df[col_obs].to_numpy(), fraction=fraction, rng=rng)
+    sample = df.iloc[index]
+    return share_columns(df=sample, replace={col_total: sample[col_total].to_numpy() * weights})
+
+
 class BinneyBootstrap(Bootstrap):
-    def __init__(self, model: BinomialModel, df: pd.DataFrame, **kwargs):
+    def __init__(self, model: BinomialModel, df: pd.DataFrame,
+                 seed: Optional[Seed] = None, **kwargs):
 
         super().__init__(model=model, **kwargs)
         self.df = df
         self.lr_specs = None
+        self.seed_sequence = make_seed_sequence(seed)
 
     def attach_specs(self, lr_specs: LRSpecs):
-        self.lr_specs = deepcopy(lr_specs)
+        self.lr_specs = lr_specs.copy_specs()
 
     def detach_specs(self):
         self.lr_specs = None
 
+    def set_seed(self, seed: Optional[Seed]):
+        self.seed_sequence = make_seed_sequence(seed)
+
+    def replicate_rng(self, replicate: int):
+        """
+        Gets the random number generator for one bootstrap replicate. The generator
+        is the child of the bootstrap seed sequence with the replicate index as its
+        spawn key, so a replicate always gets the same sample, no matter which worker
+        runs it or in which order. Without a seed, the global numpy random state
+        is used.
+
+        Parameters
+        ----------
+        replicate
+            Index of the bootstrap replicate.
+
+        Returns
+        -------
+        A numpy Generator, or the numpy.random module if there is no seed.
+        """
+        if self.seed_sequence is None:
+            return np.random
+        child = np.random.SeedSequence(
+            entropy=self.seed_sequence.entropy,
+            spawn_key=self.seed_sequence.spawn_key + (replicate,),
+            pool_size=self.seed_sequence.pool_size
+        )
+        return np.random.default_rng(child)
+
+    def run_replicate(self, replicate: int, fit_callable, **kwargs):
+        """
+        Re-samples the data and fits one bootstrap replicate.
+
+        Parameters
+        ----------
+        replicate
+            Index of the bootstrap replicate.
+        fit_callable
+            Function that fits a solver to data.
+
+        Returns
+        -------
+        The optimal parameters for this replicate.
+        """
+        self._process(fit_callable=fit_callable, rng=self.replicate_rng(replicate), **kwargs)
+        return deepcopy(self.solver.x_opt)
+
+    def run_replicates(self, replicates: Sequence[int], fit_callable, **kwargs) -> List:
+        """
+        Runs a range of bootstrap replicates one at a time.
+
+        Parameters
+        ----------
+        replicates
+            Indices of the bootstrap replicates.
+        fit_callable
+            Function that fits a solver to data.
+
+        Returns
+        -------
+        List of the optimal parameters for each replicate.
+        """
+        return [
+            self.run_replicate(replicate, fit_callable=fit_callable, **kwargs)
+            for replicate in replicates
+        ]
+
+    def run_bootstraps(self, n_bootstraps: int, fit_callable,
+                       seed: Optional[Seed] = None, **kwargs):
+        """
+        Runs bootstrap replicates and stores their parameters
+        in :code:`self.parameters`.
+
+        Parameters
+        ----------
+        n_bootstraps
+            Number of bootstrap replicates.
+        fit_callable
+            Function that fits a solver to data.
+        seed
+            Optional seed, seed sequence or generator that overrides the
+            one passed in at initialization.
+        """
+        if seed is not None:
+            self.set_seed(seed)
+        self.parameters = self.run_replicates(
+            range(n_bootstraps), fit_callable=fit_callable, **kwargs
+        )
+
     def _process(self, **kwargs):
         raise NotImplementedError()
 
+    def _replicate_counts(self, replicates: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Gets the re-sampled successes and totals for several replicates at once,
+        as (len(replicates), n_rows) arrays. Only for bootstraps that keep the rows
+        of the original data, so that all replicates share its design matrix.
+        """
+        raise NotImplementedError()
+
+    def run_batched_replicates(self, replicates: Sequence[int], x_init: np.ndarray,
+                               **kwargs) -> List[np.ndarray]:
+        """
+        Runs a range of bootstrap replicates by fitting them simultaneously with
+        :func:`~binney.solvers.batch.batched_newton`, rather than one solver
+        call per replicate. Replicate i re-samples the data exactly as it
+        does when it is fit on its own. Linear constraints are not supported.
+
+        Parameters
+        ----------
+        replicates
+            Indices of the bootstrap replicates.
+        x_init
+            Initial parameters for every replicate, typically
+            the optimal parameters for the original data.
+        kwargs
+            Keyword arguments to pass to the batched solver.
+
+        Returns
+        -------
+        List of the optimal parameters for each replicate.
+        """
+        if getattr(self.lr_specs.data, '_df', None) is not self.df:
+            self.lr_specs.configure_data(df=self.df)
+        weights = self.lr_specs.data.data.get('weight', 1.)
+        obs, total = self._replicate_counts(replicates=replicates)
+        x_opt = batched_newton(
+            design_matrix=self.lr_specs.design_matrix,
+            obs=weights * obs, total=weights * total,
+            x_init=x_init,
+            prior_mean=self.lr_specs.prior_mean,
+            prior_std=self.lr_specs.prior_std,
+            **kwargs
+        )
+        return list(x_opt)
+
+    def run_batched(self, n_bootstraps: int, x_init: np.ndarray,
+                    seed: Optional[Seed] = None, batch_size: Optional[int] = None,
+                    **kwargs):
+        """
+        Runs bootstrap replicates with :code:`run_batched_replicates` and stores
+        their parameters in :code:`self.parameters`.
+
+        Parameters
+        ----------
+        n_bootstraps
+            Number of bootstrap replicates.
+        x_init
+            Initial parameters for every replicate.
+        seed
+            Optional seed, seed sequence or generator that overrides the
+            one passed in at initialization.
+        batch_size
+            Number of replicates to fit at once. Defaults to all of them.
+        kwargs
+            Keyword arguments to pass to the batched solver.
+        """
+        if seed is not None:
+            self.set_seed(seed)
+        if batch_size is None:
+            batch_size = max(n_bootstraps, 1)
+        self.parameters = list()
+        for start in range(0, n_bootstraps, batch_size):
+            self.parameters.extend(self.run_batched_replicates(
+                replicates=range(start, min(start + batch_size, n_bootstraps)),
+                x_init=x_init, **kwargs
+            ))
+
 
 class BinomialBootstrap(BinneyBootstrap):
     """
@@ -34,7 +265,19 @@ class BinomialBootstrap(BinneyBootstrap):
         super().__init__(**kwargs)
 
     @staticmethod
-    def _sample(df: pd.DataFrame, col_obs: str, col_total: str) -> pd.DataFrame:
+    def _trials(total: np.ndarray) -> np.ndarray:
+        """
+        Converts the totals to integer numbers of trials, which numpy needs,
+        and raises an error rather than truncating fractional totals.
+        """
+        n = np.rint(total).astype(int)
+        if np.any(n != total):
+            raise BootstrapError("The binomial bootstrap needs whole numbers of trials, "
+                                 "but the total column has fractional values.")
+        return n
+
+    @staticmethod
+    def _sample(df: pd.DataFrame, col_obs: str, col_total: str, rng=np.random) -> pd.DataFrame:
         """
         Creates a new data frame by sampling from the binomial distribution
         with p = k / n and n = n from the original data, where n is the sample
@@ -44,16 +287,31 @@ class BinomialBootstrap(BinneyBootstrap):
         -------
         data frame with re-sampled observations
         """
-        sample_df = df.copy()
-        p = sample_df[col_obs] / sample_df[col_total]
-        sample_df[col_obs] = np.random.binomial(n=sample_df[col_total], p=p)
-        return sample_df
+        total = df[col_total].to_numpy()
+        p = df[col_obs].to_numpy() / total
+        return share_columns(
+            df=df, replace={col_obs: rng.binomial(n=BinomialBootstrap._trials(total), p=p)}
+        )
+
+    def _replicate_counts(self, replicates: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+        total = self.df[self.lr_specs.data_specs.col_total].to_numpy()
+        p = self.df[self.lr_specs.data_specs.col_obs].to_numpy() / total
+        n = self._trials(total)
+        if self.seed_sequence is None:
+            obs = np.random.binomial(n=n, p=p, size=(len(replicates), len(total)))
+        else:
+            obs = np.vstack([
+                self.replicate_rng(replicate).binomial(n=n, p=p)
+                for replicate in replicates
+            ])
+        return obs, np.broadcast_to(total, obs.shape)
 
-    def _process(self, fit_callable, **kwargs):
+    def _process(self, fit_callable, rng=np.random, **kwargs):
         new_df = self._sample(
             df=self.df,
             col_obs=self.lr_specs.data_specs.col_obs,
-            col_total=self.lr_specs.data_specs.col_total
+            col_total=self.lr_specs.data_specs.col_total,
+            rng=rng
         )
         self.lr_specs.configure_data(df=new_df)
         self.model.detach_specs()
@@ -64,13 +322,16 @@ class BinomialBootstrap(BinneyBootstrap):
 class BernoulliBootstrap(BinneyBootstrap):
     """
     Non-parametric bootstrap implementation for a dataset with 1's and 0's
-    in a logistic regression modeling process.
+    in a logistic regression modeling process. With subsample_failures, each
+    re-sampled data set is case-control subsampled with
+    :func:`case_control_sample` before it is fit.
     """
-    def __init__(self, **kwargs):
+    def __init__(self, subsample_failures: Optional[float] = None, **kwargs):
         super().__init__(**kwargs)
+        self.subsample_failures = subsample_failures
 
     @staticmethod
-    def _sample(df: pd.DataFrame) -> pd.DataFrame:
+    def _sample(df: pd.DataFrame, rng=np.random) -> pd.DataFrame:
         """
         Creates a new data frame by sampling from the binomial distribution
         with p = k / n and n = n from the original data, where n is the sample
@@ -80,12 +341,18 @@ class BernoulliBootstrap(BinneyBootstrap):
         -------
         data frame with re-sampled observations
         """
-        sample_df = df.copy()
-        sample_df = sample_df.sample(n=len(sample_df), replace=True)
-        return sample_df
+        return df.iloc[rng.choice(len(df), size=len(df), replace=True)]
 
-    def _process(self, fit_callable, **kwargs):
-        new_df = self._sample(df=self.df)
+    def _process(self, fit_callable, rng=np.random, **kwargs):
+        new_df = self._sample(df=self.df, rng=rng)
+        if self.subsample_failures is not None:
+            new_df = case_control_sample(
+                df=new_df,
+                col_obs=self.lr_specs.data_specs.col_obs,
+                col_total=self.lr_specs.data_specs.col_total,
+                fraction=self.subsample_failures,
+                rng=rng
+            )
         self.lr_specs.configure_data(df=new_df)
         self.model.detach_specs()
         self.model.attach_specs(self.lr_specs)
@@ -102,9 +369,97 @@ class BernoulliStratifiedBootstrap(BernoulliBootstrap):
         super().__init__(**kwargs)
         self.col_group = col_group
 
-    def _sample(self, df: pd.DataFrame) -> pd.DataFrame:
-        sample_df = df.copy()
-        sample_df = sample_df.groupby(
-            self.col_group, group_keys=False
-        ).apply(lambda x: x.sample(len(x), replace=True))
-        return sample_df
+    def _sample(self, df: pd.DataFrame, rng=np.random) -> pd.DataFrame:
+        index = []
+        for group_index in df.groupby(self.col_group, sort=True).indices.values():
+            index.append(rng.choice(group_index, size=len(group_index), replace=True))
+        return df.iloc[np.concatenate(index)]
+
+
+class WeightedBootstrap(BinneyBootstrap):
+    """
+    Bootstrap implementation that re-weights the rows of the original
+    data frame rather than re-sampling them. Each replicate is fit with the
+    weighted binomial likelihood. Since the binomial likelihood is linear in the
+    observed successes and totals, the weights are applied by scaling both columns.
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+    def _make_weights(self, n_boots: int, n_obs: int, rng=np.random) -> np.ndarray:
+        raise NotImplementedError()
+
+    def replicate_weights(self, n_boots: int) -> np.ndarray:
+        """
+        Generates the weights for the first n_boots replicates in bulk,
+        as a single (n_boots, n_rows) array. Row i is the same as the
+        weights used by replicate i.
+        """
+        return self._replicate_weights(replicates=range(n_boots))
+
+    def _replicate_weights(self, replicates: Sequence[int]) -> np.ndarray:
+        if self.seed_sequence is None:
+            return self._make_weights(n_boots=len(replicates), n_obs=len(self.df))
+        return np.vstack([
+            self._make_weights(n_boots=1, n_obs=len(self.df), rng=self.replicate_rng(replicate))
+            for replicate in replicates
+        ])
+
+    def _replicate_counts(self, replicates: Sequence[int]) -> Tuple[np.ndarray, np.ndarray]:
+        weights = self._replicate_weights(replicates=replicates)
+        obs = self.df[self.lr_specs.data_specs.col_obs].to_numpy()
+        total = self.df[self.lr_specs.data_specs.col_total].to_numpy()
+        return weights * obs, weights * total
+
+    @staticmethod
+    def _sample(df: pd.DataFrame, col_obs: str, col_total: str,
+                weights: np.ndarray) -> pd.DataFrame:
+        """
+        Creates a new data frame with the observed successes and totals
+        scaled by the bootstrap weights.
+
+        Returns
+        -------
+        data frame with re-weighted observations
+        """
+        return share_columns(df=df, replace={
+            col_obs: df[col_obs].to_numpy() * weights,
+            col_total: df[col_total].to_numpy() * weights
+        })
+
+    def _process(self, fit_callable, rng=np.random, **kwargs):
+        new_df = self._sample(
+            df=self.df,
+            col_obs=self.lr_specs.data_specs.col_obs,
+            col_total=self.lr_specs.data_specs.col_total,
+            weights=self._make_weights(n_boots=1, n_obs=len(self.df), rng=rng)[0]
+        )
+        self.lr_specs.configure_data(df=new_df)
+        self.model.detach_specs()
+        self.model.attach_specs(self.lr_specs)
+        fit_callable(solver=self.solver, data=self.lr_specs.data, **kwargs)
+
+
+class PoissonBootstrap(WeightedBootstrap):
+    """
+    Poisson bootstrap, where each row gets an independent Poisson(1)
+    weight in each replicate. Works for both binomial and Bernoulli data.
+    """
+    def __init__(self, block_size: Optional[int] = None, **kwargs):
+        super().__init__(**kwargs)
+        self.block_size = block_size
+
+    def _make_weights(self, n_boots: int, n_obs: int, rng=np.random) -> np.ndarray:
+        return poisson_weights(n_boots=n_boots, n_obs=n_obs, block_size=self.block_size, rng=rng)
+
+
+class BayesianBootstrap(WeightedBootstrap):
+    """
+    Bayesian bootstrap, where the row weights in each replicate
+    are a Dirichlet(1, ..., 1) draw scaled to have mean one.
+    """
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+
+    def _make_weights(self, n_boots: int, n_obs: int, rng=np.random) -> np.ndarray:
+        return dirichlet_weights(n_boots=n_boots, n_obs=n_obs, rng=rng)
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import pickle
+from pathlib import Path
+from typing import Any, Optional, Union
+from uuid import uuid4
+
+import numpy as np
+import pandas as pd
+
+
+def hash_frame(df: pd.DataFrame) -> str:
+    """
+    Hashes the column names, types and values of a data frame, but not its index.
+    Numeric columns are hashed from their memory without copying them.
+
+    Parameters
+    ----------
+    df
+        Data frame to hash.
+
+    Returns
+    -------
+    Hexadecimal digest.
+    """
+    hasher = hashlib.sha256()
+    for col in df.columns:
+        values = df[col].to_numpy()
+        hasher.update(repr((col, str(values.dtype), values.shape)).encode())
+        if values.dtype == object:
+            values = pd.util.hash_pandas_object(df[col], index=False).to_numpy()
+        hasher.update(memoryview(np.ascontiguousarray(values)).cast('B'))
+    return hasher.hexdigest()
+
+
+def hash_key(*parts: Any) -> str:
+    """
+    Hashes JSON-serializable parts of a cache key, such as settings. Other objects
+    are hashed by their repr, and numpy arrays by their values.
+
+    Returns
+    -------
+    Hexadecimal digest.
+    """
+    def default(obj):
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        if isinstance(obj, np.generic):
+            return obj.item()
+        return repr(obj)
+
+    return hashlib.sha256(
+        json.dumps(parts, sort_keys=True, default=default).encode()
+    ).hexdigest()
+
+
+class FitCache:
+    def __init__(self, path: Union[str, Path], max_bytes: int = 2**30):
+        """
+        On-disk cache of fit results, keyed by a hash of everything that the
+        results depend on. Each result is pickled to its own file, written to a
+        temporary file and then renamed, so that several processes can share a
+        cache. Reading a result marks it as recently used, and when the cache
+        is larger than max_bytes the least recently used results are removed.
+
+        Only use a cache directory that you trust, since the results are unpickled.
+
+        Parameters
+        ----------
+        path
+            Directory for the cache.
+        max_bytes
+            Maximum total size of the cached results.
+        """
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def _file(self, key: str) -> Path:
+        return self.path / f"{key}.pkl"
+
+    def get(self, key: str) -> Optional[Any]:
+        """
+        Loads a result from the cache.
+
+        Parameters
+        ----------
+        key
+            Key of the result.
+
+        Returns
+        -------
+        The result, or None if it is not in the cache.
+        """
+        file = self._file(key)
+        try:
+            with open(file, 'rb') as f:
+                result = pickle.load(f)
+            os.utime(file)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return result
+
+    def put(self, key: str, result: Any):
+        """
+        Stores a result in the cache, then removes the least
+        recently used results if the cache is too large.
+
+        Parameters
+        ----------
+        key
+            Key of the result.
+        result
+            Result to store. Needs to be picklable.
+        """
+        tmp_file = self.path / f".{key}-{uuid4().hex}.tmp"
+        with open(tmp_file, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, self._file(key))
+        self.evict()
+
+    def evict(self):
+        """
+        Removes the least recently used results until the
+        cache is no larger than :code:`self.max_bytes`.
+        """
+        files = []
+        for file in self.path.glob('*.pkl'):
+            try:
+                stat = file.stat()
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, file))
+        files.sort()
+        total = sum(size for _, size, _ in files)
+        for _, size, file in files:
+            if total <= self.max_bytes:
+                break
+            try:
+                file.unlink()
+            except FileNotFoundError:
+                pass
+            total -= size
@@ -0,0 +1,111 @@
+import hashlib
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Union, Any
+from uuid import uuid4
+
+import numpy as np
+
+from binney import BinneyException
+from binney.run.adaptive import flatten_parameters
+
+
+class CheckpointError(BinneyException):
+    pass
+
+
+class CheckpointStore:
+    def __init__(self, path: Union[str, Path], seed_sequence: np.random.SeedSequence,
+                 key: Optional[str] = None):
+        """
+        On-disk store of bootstrap replicate results, so that a long bootstrap
+        run can be resumed. Every batch of replicates is written to its own
+        append-only shard, keyed by the replicate indices, in a directory keyed
+        by the seed. Shards are written to a temporary file and then renamed,
+        so a pre-empted run never leaves a partial shard behind, and parallel
+        workers can write shards to the same store independently.
+
+        The key of the results, e.g. a hash of the data and the model specifications,
+        is written to a manifest when the store is created, and opening the store
+        with another key raises an error rather than reusing stale replicates.
+
+        Parameters
+        ----------
+        path
+            Directory for the store.
+        seed_sequence
+            The seed sequence that the bootstrap replicates are derived from.
+        key
+            Optional key of everything else that the replicate results depend on.
+        """
+        seed_key = hashlib.sha1(
+            repr((seed_sequence.entropy, seed_sequence.spawn_key)).encode()
+        ).hexdigest()[:16]
+        self.path = Path(path) / f"seed-{seed_key}"
+        self.path.mkdir(parents=True, exist_ok=True)
+        if key is not None:
+            self._check_manifest(key)
+
+    def _check_manifest(self, key: str):
+        manifest = self.path / 'manifest.txt'
+        if not manifest.exists():
+            tmp_file = self.path / f".manifest-{uuid4().hex}.tmp"
+            tmp_file.write_text(key)
+            os.replace(tmp_file, manifest)
+        if manifest.read_text() != key:
+            raise CheckpointError(f"The checkpoint store in {self.path} holds replicates for "
+                                  "other data, specifications or fit options. "
+                                  "Use a new checkpoint directory.")
+
+    def load(self) -> Dict[int, Any]:
+        """
+        Loads all of the completed replicates in the store.
+
+        Returns
+        -------
+        Dictionary of parameters keyed by replicate index.
+        """
+        parameters = dict()
+        for shard in sorted(self.path.glob('shard-*.npz')):
+            with np.load(shard, allow_pickle=True) as contents:
+                replicates = contents['replicates']
+                values = contents['parameters']
+                if 'groups' in contents:
+                    groups = contents['groups']
+                    n_fe = values.shape[1] // len(groups)
+                    for i, replicate in enumerate(replicates):
+                        parameters[int(replicate)] = {
+                            group: values[i, j * n_fe:(j + 1) * n_fe]
+                            for j, group in enumerate(groups)
+                        }
+                else:
+                    for i, replicate in enumerate(replicates):
+                        parameters[int(replicate)] = values[i]
+        return parameters
+
+    def write(self, replicates: Sequence[int], parameters: List):
+        """
+        Writes the results for a batch of replicates to a new shard.
+
+        Parameters
+        ----------
+        replicates
+            Indices of the replicates.
+        parameters
+            Optimal parameters for each of the replicates.
+        """
+        arrays = {
+            'replicates': np.asarray(replicates),
+            'parameters': flatten_parameters(parameters)
+        }
+        if isinstance(parameters[0], dict):
+            groups = sorted(parameters[0].keys())
+            arrays['groups'] = np.empty(len(groups), dtype=object)
+            # fill one by one, since numpy would unpack tuple groups
+            for i, group in enumerate(groups):
+                arrays['groups'][i] = group
+        name = f"shard-{replicates[0]:08d}-{replicates[-1]:08d}-{uuid4().hex}.npz"
+        tmp_file = self.path / f".{name}.tmp"
+        with open(tmp_file, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_file, self.path / name)
@@ -0,0 +1,199 @@
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple, Union
+
+import numpy as np
+import pandas as pd
+
+from binney.data.data import LRSpecs, share_columns
+from binney.utils import binomial_deviance
+from binney.run.bootstrap import Seed, make_seed_sequence
+from binney.run.run import BinneyRun
+from binney.solvers.hierarchical_solver import Hierarchy
+
+
+def make_folds(df: pd.DataFrame, n_folds: int,
+               col_group: Optional[Union[str, List[str]]] = None,
+               seed: Optional[Seed] = None) -> np.ndarray:
+    """
+    Randomly assigns the rows of a data frame to folds. If there is a group
+    column, the folds are stratified by group, so each group is spread as evenly
+    as possible across the folds. A group with a single row could not be predicted
+    for once its row is held out, so its row is never held out and gets fold -1.
+
+    Parameters
+    ----------
+    df
+        Data frame to make folds for.
+    n_folds
+        Number of folds.
+    col_group
+        Optional group column, or list of group columns, to stratify by.
+    seed
+        Optional seed, seed sequence or generator.
+
+    Returns
+    -------
+    An array with the fold of each row, or -1 for rows that are always used for training.
+    """
+    rng = np.random if seed is None else np.random.default_rng(make_seed_sequence(seed))
+    folds = np.empty(len(df), dtype=int)
+    if col_group is None:
+        strata = [np.arange(len(df))]
+    else:
+        strata = list(df.groupby(col_group, sort=True).indices.values())
+    offset = 0
+    for index in strata:
+        if col_group is not None and len(index) == 1:
+            folds[index] = -1
+            continue
+        folds[rng.permutation(index)] = (np.arange(len(index)) + offset) % n_folds
+        offset += len(index)
+    return folds
+
+
+class CrossValidation:
+    def __init__(self, df: pd.DataFrame, grid: List[Dict[str, Any]], n_folds: int = 5,
+                 seed: Optional[Seed] = None, n_jobs: int = 1, **kwargs):
+        """
+        K-fold cross-validation over a grid of model specifications, for example to choose
+        the spline knots and degree or the coefficient prior variance of a hierarchy.
+        Every specification is fit on each training fold with :class:`~binney.run.run.BinneyRun`
+        and scored by the binomial deviance of its predictions for the held-out fold.
+
+        The folds are stratified by the group columns of all of the specifications,
+        and are the same for every specification. Rows of groups with a single row
+        are always used for training and are not scored, since a hierarchy can't
+        predict for a group that it wasn't fit to. The columns that the specifications
+        use are shared, read-only, by all of the fits, which run on a pool of threads.
+        The fits only run concurrently while numpy releases the GIL, e.g. in the
+        linear algebra of the solvers, and not in the pandas code. Specifications
+        that only differ in :code:`coefficient_prior_var` are fit with the same run
+        on each fold, so that the design and constraint matrices are only built once,
+        and a hierarchy is fit along a warm-started path of the variances.
+
+        Parameters
+        ----------
+        df
+            Data frame with all of the columns used by the specifications.
+        grid
+            List of specifications. Each is a dictionary of keyword arguments
+            for :class:`~binney.run.run.BinneyRun` that override :code:`kwargs`.
+        n_folds
+            Number of folds.
+        seed
+            Optional seed, seed sequence or generator for the folds.
+        n_jobs
+            Number of threads to run the fits on.
+        kwargs
+            Keyword arguments for :class:`~binney.run.run.BinneyRun` shared
+            by all of the specifications, e.g. col_success and col_total.
+
+        Attributes
+        ----------
+        self.scores
+            Data frame of the out-of-fold deviance for each specification and fold,
+            after running :code:`CrossValidation.run()`.
+        self.n_unscored
+            Number of rows that are always used for training and never scored.
+        """
+        self.grid = [{**kwargs, **spec} for spec in grid]
+        self.n_folds = n_folds
+        self.n_jobs = n_jobs
+
+        columns = []
+        for spec in self.grid:
+            columns += LRSpecs(
+                col_success=spec['col_success'],
+                col_total=spec['col_total'],
+                col_group=spec.get('col_group'),
+                col_weight=spec.get('col_weight'),
+                covariates=spec.get('covariates'),
+                splines=spec.get('splines')
+            ).columns
+        self.df = share_columns(df=df, columns=list(dict.fromkeys(columns)))
+        # stratify by the group columns of all of the specifications, so that
+        # every specification is scored on the same folds
+        col_groups = []
+        for spec in self.grid:
+            col_group = spec.get('col_group')
+            if col_group is not None:
+                col_groups += [col_group] if isinstance(col_group, str) else list(col_group)
+        self.folds = make_folds(
+            df=self.df, n_folds=n_folds,
+            col_group=list(dict.fromkeys(col_groups)) or None, seed=seed
+        )
+        self.n_unscored = int(np.sum(self.folds == -1))
+        self.scores = None
+
+    def _structures(self) -> Dict[str, List[int]]:
+        """
+        Groups the specifications that only differ in their coefficient prior variance.
+        """
+        structures = dict()
+        for i, spec in enumerate(self.grid):
+            key = repr(sorted(
+                (k, v) for k, v in spec.items() if k != 'coefficient_prior_var'
+            ))
+            structures.setdefault(key, []).append(i)
+        return structures
+
+    def _score(self, fold: int, specs: List[int]) -> List[Tuple[int, int, float]]:
+        train_df = self.df.iloc[np.where(self.folds != fold)[0]]
+        test_df = self.df.iloc[np.where(self.folds == fold)[0]]
+        run_kwargs = {
+            k: v for k, v in self.grid[specs[0]].items() if k != 'coefficient_prior_var'
+        }
+        b_run = BinneyRun(df=train_df, **run_kwargs)
+
+        if isinstance(b_run.solver, Hierarchy):
+            prior_vars = [self.grid[i].get('coefficient_prior_var', 1.) for i in specs]
+            order = np.argsort(prior_vars)
+            path = b_run.fit_path(
+                prior_vars=[prior_vars[j] for j in order], holdout_df=test_df
+            )
+            return [
+                (specs[j], fold, deviance)
+                for j, deviance in zip(order, path['deviance'])
+            ]
+
+        b_run.fit()
+        col_weight = run_kwargs.get('col_weight')
+        deviance = binomial_deviance(
+            obs=test_df[run_kwargs['col_success']].to_numpy(),
+            total=test_df[run_kwargs['col_total']].to_numpy(),
+            p=b_run.predict(new_df=test_df),
+            weights=None if col_weight is None else test_df[col_weight].to_numpy()
+        )
+        return [(i, fold, deviance) for i in specs]
+
+    def run(self) -> pd.DataFrame:
+        """
+        Runs the cross-validation.
+
+        Returns
+        -------
+        A data frame with the total out-of-fold deviance for each specification,
+        indexed by the position of the specification in the grid.
+        """
+        tasks = [
+            (fold, specs)
+            for specs in self._structures().values()
+            for fold in range(self.n_folds)
+        ]
+        with ThreadPoolExecutor(max_workers=self.n_jobs) as executor:
+            results = list(executor.map(lambda task: self._score(*task), tasks))
+        self.scores = pd.DataFrame(
+            [score for result in results for score in result],
+            columns=['spec', 'fold', 'deviance']
+        ).sort_values(['spec', 'fold'], ignore_index=True)
+        return self.scores.groupby('spec')[['deviance']].sum()
+
+    @property
+    def best_spec(self) -> Dict[str, Any]:
+        """
+        The specification with the lowest out-of-fold deviance.
+        """
+        if self.scores is None:
+            raise RuntimeError("Need to run the cross-validation first.")
+        deviance = self.scores.groupby('spec')['deviance'].sum()
+        return self.grid[int(deviance.idxmin())]
@@ -0,0 +1,136 @@
+"""
+Load test for the prediction server in :mod:`binney.run.serve`. Sends requests
+from several concurrent keep-alive connections to a running server and reports the
+throughput and the latency percentiles. For example,
+
+.. code:: bash
+
+    python -m binney.run.serve model.pkl --port 8000 &
+    python -m binney.run.loadtest rows.csv --port 8000 --concurrency 32
+
+where rows.csv has the columns that the model needs to make predictions.
+"""
+import asyncio
+import json
+import time
+from typing import Dict, Any, List
+
+import click
+import numpy as np
+import pandas as pd
+
+from binney.data.data import load_columns
+
+
+async def _client(host: str, port: int, payloads: List[bytes],
+                  n_requests: int, latencies: List[float]):
+    reader, writer = await asyncio.open_connection(host=host, port=port)
+    try:
+        for i in range(n_requests):
+            payload = payloads[i % len(payloads)]
+            start = time.perf_counter()
+            writer.write(
+                f"POST /predict HTTP/1.1\r\nHost: {host}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+            status = await reader.readline()
+            headers = dict()
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                key, _, value = line.decode('latin-1').partition(':')
+                headers[key.strip().lower()] = value.strip()
+            await reader.readexactly(int(headers.get('content-length', 0)))
+            if b' 200 ' not in status:
+                raise RuntimeError(f"Request failed with {status.decode().strip()}.")
+            latencies.append(time.perf_counter() - start)
+    finally:
+        writer.close()
+
+
+async def run_load_test(df: pd.DataFrame, host: str = '127.0.0.1', port: int = 8000,
+                        rows_per_request: int = 1, concurrency: int = 16,
+                        n_requests: int = 1000, quantiles=None) -> Dict[str, Any]:
+    """
+    Sends requests for the rows of a data frame to a prediction server.
+
+    Parameters
+    ----------
+    df
+        Rows to predict for, cycled through in chunks of rows_per_request.
+    host
+        Host of the server.
+    port
+        Port of the server.
+    rows_per_request
+        Number of rows in each request.
+    concurrency
+        Number of concurrent connections.
+    n_requests
+        Total number of requests, split evenly between the connections.
+    quantiles
+        Optional draw quantiles to ask for.
+
+    Returns
+    -------
+    Dictionary with the number of requests, the requests per second,
+    and the 50th, 95th and 99th percentiles of the latency in milliseconds.
+    """
+    payloads = []
+    for start in range(0, len(df), rows_per_request):
+        request = {'rows': df.iloc[start:start + rows_per_request].to_dict(orient='list')}
+        if quantiles is not None:
+            request['quantiles'] = list(quantiles)
+        payloads.append(json.dumps(request).encode())
+
+    latencies = []
+    per_client = max(n_requests // concurrency, 1)
+    start = time.perf_counter()
+    await asyncio.gather(*[
+        _client(host=host, port=port, payloads=payloads[i::concurrency] or payloads,
+                n_requests=per_client, latencies=latencies)
+        for i in range(concurrency)
+    ])
+    elapsed = time.perf_counter() - start
+
+    p50, p95, p99 = np.percentile(np.array(latencies) * 1e3, [50, 95, 99])
+    return {
+        'requests': len(latencies),
+        'requests_per_second': len(latencies) / elapsed,
+        'latency_ms_p50': p50,
+        'latency_ms_p95': p95,
+        'latency_ms_p99': p99,
+    }
+
+
+@click.command()
+@click.argument('data', type=click.Path(exists=True, dir_okay=False))
+@click.option('--host', default='127.0.0.1', help='Host of the server.')
+@click.option('--port', default=8000, help='Port of the server.')
+@click.option('--rows-per-request', default=1, help='Number of rows in each request.')
+@click.option('--concurrency', default=16, help='Number of concurrent connections.')
+@click.option('--requests', 'n_requests', default=1000, help='Total number of requests.')
+@click.option('--quantile', 'quantiles', type=float, multiple=True,
+              help='Draw quantile to ask for. Can be given more than once.')
+def main(data, host, port, rows_per_request, concurrency, n_requests, quantiles):
+    """
+    Load tests a prediction server with the rows in DATA, a CSV or Parquet file.
+    """
+    if data.endswith('.csv'):
+        df = pd.read_csv(data)
+    else:
+        df = load_columns(data)
+    result = asyncio.run(run_load_test(
+        df=df, host=host, port=port, rows_per_request=rows_per_request,
+        concurrency=concurrency, n_requests=n_requests,
+        quantiles=quantiles if len(quantiles) > 0 else None
+    ))
+    for key, value in result.items():
+        click.echo(f"{key}: {value:.2f}" if isinstance(value, float) else f"{key}: {value}")
+
+
+if __name__ == '__main__':
+    main()
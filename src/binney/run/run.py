@@ -1,17 +1,28 @@
+import pickle
+from pathlib import Path
+
 import pandas as pd
 import numpy as np
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Sequence, Union
 from copy import copy
 
 from anml.solvers.interface import Solver
 from anml.data.data import Data
 
 from binney.model.model import BinomialModel
-from binney.data.data import LRSpecs
+from binney.data.data import LRSpecs, DataSource
 from binney.run.bootstrap import BinomialBootstrap, BernoulliBootstrap, BernoulliStratifiedBootstrap
+from binney.run.bootstrap import PoissonBootstrap, BayesianBootstrap, WeightedBootstrap, Seed
+from binney.run.bootstrap import case_control_sample, make_seed_sequence
+from binney.run.asymptotic import AsymptoticUncertainty
+from binney.run.adaptive import flatten_parameters, quantile_mc_error
+from binney.run.cache import FitCache, hash_frame, hash_key
+from binney.run.checkpoint import CheckpointStore
 from binney.solvers.hierarchical_solver import Hierarchy
-from binney.solvers.solver import ScipySolver, IpoptSolver
+from binney.solvers.solver import ScipySolver
+from binney.utils import binomial_deviance
 from binney import BinneyException
+from binney.__about__ import __version__
 
 
 class RunException(BinneyException):
@@ -19,13 +30,20 @@ class RunException(BinneyException):
 
 
 class BinneyRun:
-    def __init__(self, df: pd.DataFrame, col_success: str, col_total: str,
+    def __init__(self, df: DataSource, col_success: str, col_total: str,
                  covariates: Optional[List[str]] = None,
                  splines: Optional[Dict[str, Dict[str, Any]]] = None,
                  solver_method: str = 'scipy', solver_options: Optional[Dict[str, Any]] = None,
-                 data_type: str = 'bernoulli', col_group: Optional[str] = None,
-                 coefficient_prior_var: float = 1.):
-        """
+                 data_type: str = 'bernoulli',
+                 col_group: Optional[Union[str, List[str]]] = None,
+                 col_weight: Optional[str] = None,
+                 coefficient_prior_var: float = 1., uncertainty: str = 'bootstrap',
+                 n_jobs: int = 1, n_threads: int = 1, lazy_constraints: bool = False,
+                 cache_dir: Optional[str] = None, cache_max_bytes: int = 2**30,
+                 subsample_failures: Optional[float] = None,
+                 subsample_seed: Optional[Seed] = None,
+                 subsample_bootstrap: bool = False):
+        r"""
         Create a model run with binney. The model can handle either binomial data or Bernoulli data.
         If you have binomial data, your data will look something like "k successes out
         of n trials" -- binney needs to know both k and n. If you have Bernoulli data,
@@ -47,7 +65,12 @@ class BinneyRun:
         This run class will create uncertainty with the bootstrap method. The particular
         type of bootstrap re-sampling will depend on whether you have binomial or Bernoulli
         type data. It is not enforced strictly, but **do not mix the two types of data**,
-        as it will give inaccurate uncertainty quantification.
+        as it will give inaccurate uncertainty quantification. Alternatively, the
+        bootstrap can re-weight rather than re-sample the rows, with either Poisson(1)
+        weights (:code:`uncertainty='poisson'`) or Dirichlet weights
+        (:code:`uncertainty='bayesian'`). For a fast approximation that doesn't refit
+        the model, :code:`uncertainty='asymptotic'` draws parameters from the normal
+        distribution implied by the observed information matrix at the optimum.
 
         If you pass in a group column name, then it will fit multiple models. First,
         it will fit a model with all of the data. Then it will use those parameter estimates
@@ -61,7 +84,9 @@ class BinneyRun:
         ----------
         df
             A pandas data frame with all of the columns in covariates, splines,
-            and col_success and col_total.
+            and col_success and col_total. It can also be a dictionary of numpy
+            (or memory-mapped) arrays, a pyarrow Table or the path to a Parquet file,
+            and only the columns that the model uses are read from it.
         col_success
             The column name of the number of successes (:math:`k`).
         col_total
@@ -94,19 +119,77 @@ class BinneyRun:
             * :code:`decreasing (bool)`: impose monotonic decreasing constraint on spline shape
             * :code:`concave (bool)`: impose concavity constraint on spline shape
             * :code:`convex (bool)`: impose convexity constraint on spline shape
+            * :code:`constraint_grid_size (int)`: number of points to impose the shape
+              constraints at, 20 by default
+            * :code:`bins (int)`: number of points of an evenly spaced grid to snap the
+              covariate to for an approximate fit. Rows with the same binned covariates
+              and groups are aggregated into binomial counts before fitting, so the
+              fit and the bootstrap scale with the number of occupied bins. Needs
+              :code:`knots_type='domain'`. Bernoulli data is bootstrapped like
+              binomial data once it is aggregated. With observation weights or
+              subsampled failures, the aggregated counts aren't whole numbers of trials,
+              so only asymptotic uncertainty is available. Compare with the exact fit
+              with :code:`BinneyRun.approximation_error()`.
 
         solver_method
             Type of solver to use, one of "ipopt" (interior point optimizer -- use this if
-            you have spline shape constraints), or "scipy".
+            you have spline shape constraints), "scipy", or "joint" (fits all of the groups
+            in one optimization, with a Gaussian penalty of variance coefficient_prior_var
+            on the group deviations from the global coefficients -- needs a col_group,
+            use this if you have many groups).
         solver_options
             A dictionary of options to pass to your desired solver.
         data_type
             The data type: one of "bernoulli" or "binomial"
         col_group
-            An optional column name to define data groups.
+            An optional column name to define data groups, or a list of column names
+            of nested groups from the outermost to the innermost level, e.g.
+            ['super_region', 'region', 'country']. The fit for each group is the prior
+            for the groups nested in it.
+        col_weight
+            An optional column name of observation weights. Each row's contribution to
+            the likelihood is multiplied by its weight, e.g. for survey weights or
+            for rows that represent counts of identical records.
         coefficient_prior_var
             An optional float to be used if you're passing in a col_group that determines the variance
             assigned to the prior when passing down priors in a hierarchy for col_group.
+        uncertainty
+            Type of uncertainty to use, one of "bootstrap" (re-sampling bootstrap
+            based on the data type), "poisson" (Poisson weight bootstrap),
+            "bayesian" (Bayesian, or Dirichlet weight, bootstrap), or "asymptotic"
+            (draws from the asymptotic normal distribution of the parameters).
+        n_jobs
+            Number of groups within a level of the hierarchy to fit concurrently.
+        n_threads
+            Number of threads to evaluate the likelihood of one fit with. The rows
+            are split into blocks that are evaluated concurrently, which speeds up
+            fits to large data sets.
+        lazy_constraints
+            Whether to add the spline shape constraints as cutting planes: the model is
+            first fit without them, and only the constraints that the fit violates are
+            added before fitting again, until none are violated. Use this with a large
+            constraint_grid_size.
+        cache_dir
+            Optional directory for a cache of fit results. The results of
+            :code:`BinneyRun.fit()` and :code:`BinneyRun.make_uncertainty()` are stored
+            under a hash of the model columns of the data, the specifications, the
+            solver settings and the seed, and a later run with the same inputs loads
+            them instead of fitting again. The bootstrap is only cached with an integer
+            seed or seed sequence. The directory can be shared between runs.
+        cache_max_bytes
+            Maximum size of the cache directory. The least recently used results
+            are removed when it is larger.
+        subsample_failures
+            Optional fraction of the rows without a success to keep, for Bernoulli data
+            with a rare outcome. All of the successes are kept, and the kept failures
+            are weighted by 1 / subsample_failures so that the fit stays consistent.
+            Fits to much less data at the cost of some efficiency.
+        subsample_seed
+            Optional seed for the subsample.
+        subsample_bootstrap
+            Whether to draw a new subsample from each bootstrap re-sample of all of the
+            data, so that the uncertainty includes the subsampling, instead of
+            re-sampling the one subsample. Only for :code:`uncertainty='bootstrap'`.
 
         Attributes
         ----------
@@ -118,7 +201,15 @@ class BinneyRun:
             Bootstrap class that creates uncertainty. After running the
             :code:`BinneyRun.make_uncertainty()` method you can access
             the parameter estimates across bootstrap replicates in
-            :code:`self.bootstrap.parameters`.
+            :code:`self.bootstrap.parameters`. With asymptotic uncertainty, this
+            is an :class:`~binney.run.asymptotic.AsymptoticUncertainty` with the
+            parameter draws in the same place.
+        self.path
+            Group parameters for each coefficient prior variance
+            after :code:`BinneyRun.fit_path()`.
+        self.mc_error
+            Monte Carlo standard error of the monitored quantiles after an
+            adaptive bootstrap.
         """
 
         # Check the data type
@@ -128,35 +219,106 @@ class BinneyRun:
 
         self.data_type = data_type
 
+        # Check the uncertainty type
+        if uncertainty not in ['bootstrap', 'poisson', 'bayesian', 'asymptotic']:
+            raise BinneyException(f"Uncertainty must be one of 'bootstrap', 'poisson', 'bayesian' "
+                                  f"or 'asymptotic'. Got {uncertainty}.")
+        self.uncertainty = uncertainty
+
+        if subsample_failures is not None:
+            if data_type != 'bernoulli':
+                raise RunException("Subsampling failures is only available for Bernoulli data.")
+            if not 0 < subsample_failures <= 1:
+                raise RunException(f"The fraction of failures to keep must be in (0, 1]. "
+                                   f"Got {subsample_failures}.")
+        if subsample_bootstrap and (subsample_failures is None or uncertainty != 'bootstrap'):
+            raise RunException("Subsampling in the bootstrap needs subsample_failures "
+                               "and uncertainty='bootstrap'.")
+        self.subsample_failures = subsample_failures
+        self.subsample_bootstrap = subsample_bootstrap
+
+        # Arguments for the same run without binning, to compare
+        # with in BinneyRun.approximation_error()
+        self._exact_kwargs = dict(
+            col_success=col_success, col_total=col_total, covariates=covariates,
+            splines=None if splines is None else {
+                spline: {key: value for key, value in options.items() if key != 'bins'}
+                for spline, options in splines.items()
+            },
+            solver_method=solver_method, solver_options=solver_options, data_type=data_type,
+            col_group=col_group, col_weight=col_weight,
+            coefficient_prior_var=coefficient_prior_var, uncertainty=uncertainty,
+            n_jobs=n_jobs, n_threads=n_threads, lazy_constraints=lazy_constraints,
+            cache_dir=cache_dir, cache_max_bytes=cache_max_bytes
+        )
+
         # Configure the data specs
         self.lr_specs = LRSpecs(
             col_success=col_success,
             col_total=col_total,
             covariates=covariates,
             splines=splines,
-            col_group=col_group
+            col_group=col_group,
+            col_weight=col_weight
         )
+        # Only keep the columns that the model needs, shared
+        # read-only by the fit and all of the bootstrap replicates
+        df = self.lr_specs.compact(df=df)
+        self._full_df = df
+        if subsample_failures is not None:
+            seed_sequence = make_seed_sequence(subsample_seed)
+            df = case_control_sample(
+                df=df, col_obs=col_success, col_total=col_total, fraction=subsample_failures,
+                rng=np.random if seed_sequence is None else np.random.default_rng(seed_sequence)
+            )
+        self._exact_df = df
+        binned = len(self.lr_specs.binned_splines) > 0
+        if binned:
+            if uncertainty in ['poisson', 'bayesian'] or subsample_bootstrap:
+                raise RunException("Binned splines are only available with the 'bootstrap' "
+                                   "and 'asymptotic' uncertainty, without subsampling "
+                                   "in the bootstrap.")
+            # the weights are multiplied into the aggregated counts, which are then
+            # pseudo-counts rather than numbers of trials to re-sample from
+            weighted = col_weight is not None or subsample_failures is not None
+            if uncertainty == 'bootstrap' and weighted:
+                raise RunException("Binned splines with observation weights or subsampled "
+                                   "failures are only available with 'asymptotic' uncertainty.")
+            df = self.lr_specs.aggregate(df=df)
         self.lr_specs.configure_data(df=df)
 
         # Set up the model
-        self.model = BinomialModel()
+        self.model = BinomialModel(n_threads=n_threads)
         self.model.attach_specs(lr_specs=self.lr_specs)
 
         # Set up the solver
-        if solver_method == 'scipy':
+        if solver_method in ['scipy', 'joint']:
             solver = ScipySolver(model_instance=self.model)
         elif solver_method == 'ipopt':
+            from binney.solvers.solver import IpoptSolver
             solver = IpoptSolver(model_instance=self.model)
         else:
             raise RunException(f"Unrecognized solver method {solver_method}."
-                               "Please pass one of 'scipy' or 'ipopt'.")
+                               "Please pass one of 'scipy', 'ipopt' or 'joint'.")
         solver.attach_lr_specs(lr_specs=self.lr_specs)
-        if col_group is None:
+        solver.lazy_constraints = lazy_constraints
+        if solver_method == 'joint':
+            if col_group is None:
+                raise RunException("The joint solver needs a col_group.")
+            if uncertainty == 'asymptotic':
+                raise RunException("Asymptotic uncertainty is not available for the joint solver.")
+            from binney.solvers.joint import JointHierarchy
+            self.solver = JointHierarchy(
+                solver=solver,
+                coefficient_prior_var=coefficient_prior_var
+            )
+        elif col_group is None:
             self.solver = solver
         else:
             self.solver = Hierarchy(
                 solver=solver,
-                coefficient_prior_var=coefficient_prior_var
+                coefficient_prior_var=coefficient_prior_var,
+                n_jobs=n_jobs
             )
         if solver_options is None:
             solver_options = dict()
@@ -165,27 +327,79 @@ class BinneyRun:
         }
 
         # Configure bootstrap object based on
-        # the data type and whether or not there should
+        # the uncertainty type, the data type and whether or not there should
         # be stratified re-sampling
-        if data_type == 'bernoulli':
+        if uncertainty == 'asymptotic':
+            self.bootstrap = AsymptoticUncertainty(
+                solver=self.solver, model=self.model
+            )
+        elif uncertainty == 'poisson':
+            self.bootstrap = PoissonBootstrap(
+                solver=self.solver, model=self.model, df=df
+            )
+        elif uncertainty == 'bayesian':
+            self.bootstrap = BayesianBootstrap(
+                solver=self.solver, model=self.model, df=df
+            )
+        elif data_type == 'bernoulli' and not binned:
+            # with subsampling in the bootstrap, each replicate
+            # re-samples all of the data and then subsamples it
+            if subsample_bootstrap:
+                df = self._full_df
             if col_group is not None:
                 self.bootstrap = BernoulliStratifiedBootstrap(
                     solver=self.solver, model=self.model, df=df,
-                    col_group=col_group
+                    col_group=col_group,
+                    subsample_failures=subsample_failures if subsample_bootstrap else None
                 )
             else:
                 self.bootstrap = BernoulliBootstrap(
-                    solver=self.solver, model=self.model, df=df
+                    solver=self.solver, model=self.model, df=df,
+                    subsample_failures=subsample_failures if subsample_bootstrap else None
                 )
-        elif data_type == 'binomial':
+        else:
+            # binomial data, or Bernoulli data aggregated into binomial counts
             self.bootstrap = BinomialBootstrap(
                 solver=self.solver, model=self.model, df=df
             )
-        self.bootstrap.attach_specs(lr_specs=self.lr_specs)
+        if uncertainty != 'asymptotic':
+            self.bootstrap.attach_specs(lr_specs=self.lr_specs)
 
         # Placeholders for parameters and initial values
         self.params_init = np.zeros(self.model.design_matrix.shape[1])
         self.params_opt = None
+        self.path = None
+        self.mc_error = None
+        self.cache = None if cache_dir is None else FitCache(path=cache_dir, max_bytes=cache_max_bytes)
+        self._data_hash = None
+
+    def _cache_key(self, *parts) -> str:
+        """
+        Hashes the data, the specifications and the solver settings,
+        together with anything else that a cached result depends on.
+        """
+        if self._data_hash is None:
+            self._data_hash = hash_frame(self.lr_specs.data._df)
+            if self._full_df is not self.lr_specs.data._df:
+                self._data_hash += hash_frame(self._full_df)
+        specs = self.lr_specs
+        solvers = [self.solver] + list(getattr(self.solver, 'solvers', []))
+        settings = [
+            {
+                key: value for key, value in vars(solver).items()
+                if key in ['coefficient_prior_var', 'max_iter', 'tol', 'linear_solver',
+                           'cg_max_iter', 'lazy_constraints', 'constraint_tol', 'max_cuts']
+            }
+            for solver in solvers
+        ]
+        return hash_key(
+            __version__, self._data_hash, self.data_type, self.uncertainty,
+            specs.columns, specs.covariates, specs.splines,
+            specs.prior_mean, specs.prior_std,
+            [type(solver).__name__ for solver in solvers], settings,
+            self.options, self.params_init,
+            self.subsample_failures, self.subsample_bootstrap, *parts
+        )
 
     def _fit(self, solver: Solver, data: Data):
         solver.fit(
@@ -197,8 +411,60 @@ class BinneyRun:
         Fit the binney model after initialization.
         Optimal parameters are stored in BinneyRun.params_opt.
         """
+        key = None
+        if self.cache is not None:
+            key = self._cache_key('fit')
+            state = self.cache.get(key)
+            if state is not None:
+                self.solver.restore(state, data=self.lr_specs.data)
+                self.params_opt = copy(self.solver.x_opt)
+                return
         self._fit(solver=self.solver, data=self.lr_specs.data)
         self.params_opt = copy(self.solver.x_opt)
+        if key is not None:
+            self.cache.put(key, self.solver.fit_state())
+
+    def fit_path(self, prior_vars: Sequence[float],
+                 holdout_df: Optional[pd.DataFrame] = None) -> pd.DataFrame:
+        """
+        Fit the hierarchy along a path of coefficient prior variances, warm-starting
+        each group from its solution for the previous variance. The model is left
+        fit with the last variance, like :code:`BinneyRun.fit()`.
+
+        Parameters
+        ----------
+        prior_vars
+            Sequence of coefficient prior variances, preferably sorted.
+        holdout_df
+            Optional data frame to score each point of the path on.
+
+        Returns
+        -------
+        A data frame with the coefficient prior variances, and the binomial deviance
+        of the predictions for the held-out data if there is any. The group
+        parameters for each variance are stored in BinneyRun.path.
+        """
+        if not isinstance(self.solver, Hierarchy):
+            raise RunException("A regularization path needs a group column.")
+        self.path = self.solver.fit_path(
+            x_init=self.params_init, options=self.options,
+            data=self.lr_specs.data, prior_vars=prior_vars
+        )
+        self.params_opt = copy(self.solver.x_opt)
+
+        result = pd.DataFrame({'coefficient_prior_var': prior_vars})
+        if holdout_df is not None:
+            col_weight = self.lr_specs.data_specs.col_weight
+            result['deviance'] = [
+                binomial_deviance(
+                    obs=holdout_df[self.lr_specs.data_specs.col_obs].to_numpy(),
+                    total=holdout_df[self.lr_specs.data_specs.col_total].to_numpy(),
+                    p=self.solver.predict(new_df=holdout_df, x=x),
+                    weights=None if col_weight is None else holdout_df[col_weight].to_numpy()
+                )
+                for x in self.path
+            ]
+        return result
 
     def predict(self, new_df: Optional[pd.DataFrame] = None) -> np.ndarray:
         """
@@ -230,28 +496,266 @@ class BinneyRun:
         -------
         A stacked numpy array of draws for each row in the :code:`df`.
         """
-        draw_matrix = []
-        for params in self.bootstrap.parameters:
-            draws = self.solver.predict(
-                x=params,
-                new_df=df
-            )
-            draw_matrix.append(draws)
-        draw_matrix = np.vstack(draw_matrix)
-        return draw_matrix
+        return self.solver.predict_draws(xs=self.bootstrap.parameters, new_df=df)
 
-    def make_uncertainty(self, n_boots: int = 100):
+    def summarize_draws(self, df: pd.DataFrame,
+                        quantiles: Sequence[float] = (0.025, 0.975),
+                        chunk_size: int = 10000) -> pd.DataFrame:
+        """
+        Summarizes the draws based on the bootstrap parameters without
+        making the full matrix of draws. The data frame is processed in chunks
+        of rows, so the memory used is proportional to the number of draws times
+        the chunk size, rather than times the number of rows.
+
+        Parameters
+        ----------
+        df
+            A pandas data frame to make predictions for. Must have all of the covariates
+            used in the fitting.
+        quantiles
+            Quantiles of the draws to compute for each row.
+        chunk_size
+            Number of rows to make draws for at once.
+
+        Returns
+        -------
+        A data frame with the same index as :code:`df`, and columns "mean" and
+        "std" and one column per quantile named like "q0.025".
+        """
+        summaries = []
+        for start in range(0, len(df), chunk_size):
+            chunk = df.iloc[start:start + chunk_size]
+            draws = self.predict_draws(df=chunk)
+            summary = {
+                'mean': draws.mean(axis=0),
+                'std': draws.std(axis=0)
+            }
+            for q, values in zip(quantiles, np.quantile(draws, q=quantiles, axis=0)):
+                summary[f'q{q:g}'] = values
+            summaries.append(pd.DataFrame(summary, index=chunk.index))
+        return pd.concat(summaries)
+
+    def _run_replicates(self, replicates: Sequence[int], batched: bool,
+                        store: Optional[CheckpointStore] = None) -> List:
+        if store is not None:
+            completed = store.load()
+            missing = [replicate for replicate in replicates if replicate not in completed]
+            if len(missing) > 0:
+                parameters = self._run_replicates(replicates=missing, batched=batched)
+                store.write(replicates=missing, parameters=parameters)
+                completed.update(zip(missing, parameters))
+            return [completed[replicate] for replicate in replicates]
+        if batched:
+            x_init = self.params_init if self.params_opt is None else self.params_opt
+            return self.bootstrap.run_batched_replicates(replicates=replicates, x_init=x_init)
+        return self.bootstrap.run_replicates(replicates=replicates, fit_callable=self._fit)
+
+    def _mc_error(self, quantiles: Sequence[float],
+                  monitor_df: Optional[pd.DataFrame] = None) -> float:
+        if monitor_df is None:
+            draws = flatten_parameters(self.bootstrap.parameters)
+        else:
+            draws = self.predict_draws(df=monitor_df)
+        return np.max(quantile_mc_error(draws=draws, quantiles=quantiles))
+
+    def make_uncertainty(self, n_boots: int = 100, seed: Optional[Seed] = None,
+                         batched: bool = False, tol: Optional[float] = None,
+                         quantiles: Sequence[float] = (0.025, 0.5, 0.975),
+                         monitor_df: Optional[pd.DataFrame] = None,
+                         batch_size: Optional[int] = None,
+                         checkpoint_dir: Optional[str] = None):
         """
         Runs bootstrap re-sampling to get uncertainty
         in the parameters. Access parameters in
-        :code:`self.bootstrap.parameters`.
+        :code:`self.bootstrap.parameters`. With asymptotic
+        uncertainty, makes parameter draws from the fitted model
+        instead, so :code:`BinneyRun.fit()` needs to be run first.
+
+        If you pass a tolerance, the bootstrap is adaptive: replicates are run
+        in batches, and it stops as soon as the Monte Carlo standard error of the
+        quantiles of the parameters (or of the predictions for :code:`monitor_df`)
+        is below the tolerance, so :code:`n_boots` is the maximum number of replicates.
+        The final Monte Carlo error is in :code:`self.mc_error`.
+
+        If you pass a checkpoint directory, the results for every batch of replicates
+        are written to disk as they finish, and replicates that are already on disk are
+        not re-run, so a run that was stopped can be resumed by running it again with
+        the same seed. Workers that share the directory skip each other's finished batches.
+        Resuming with other data, specifications or fit options raises an error.
 
         Parameters
         ----------
         n_boots
-            Number of bootstrap replicates
+            Number of bootstrap replicates, or of draws for asymptotic uncertainty
+        seed
+            An optional integer seed, numpy SeedSequence or numpy Generator.
+            Each replicate gets its own generator derived from the seed, so
+            the same seed always gives the same replicates. If not passed,
+            the global numpy random state is used.
+        batched
+            Fit all of the bootstrap replicates simultaneously with a batched Newton
+            solver instead of one solver call per replicate. Much faster, but only
+            for binomial, Poisson and Bayesian bootstraps without a group column or
+            spline shape constraints. The replicates start from the optimal
+            parameters if the model has been fit.
+        tol
+            Optional tolerance for the Monte Carlo standard error of the quantiles,
+            in the units of the parameters (or of the predictions).
+        quantiles
+            Quantiles to monitor for the adaptive bootstrap.
+        monitor_df
+            An optional (small) data frame to monitor the quantiles of the
+            predictions for, instead of the quantiles of the parameters.
+        batch_size
+            Number of replicates to run between convergence checks or checkpoints.
+            Defaults to 50 for an adaptive or checkpointed bootstrap, and otherwise
+            to all of the replicates.
+        checkpoint_dir
+            Optional directory to store the replicate results in. Needs an integer
+            seed (or seed sequence) so that the replicates can be identified.
         """
-        self.bootstrap.run_bootstraps(
-            n_bootstraps=n_boots,
-            fit_callable=self._fit
+        key = None
+        if self.cache is not None and isinstance(seed, (int, np.integer, np.random.SeedSequence)):
+            if isinstance(seed, np.random.SeedSequence):
+                seed_key = (seed.entropy, seed.spawn_key)
+            else:
+                seed_key = int(seed)
+            key = self._cache_key(
+                'uncertainty', n_boots, seed_key, batched, tol, quantiles, batch_size,
+                None if monitor_df is None else hash_frame(monitor_df),
+                None if self.params_opt is None else flatten_parameters([self.params_opt])
+            )
+            result = self.cache.get(key)
+            if result is not None:
+                if self.uncertainty != 'asymptotic':
+                    self.bootstrap.set_seed(seed)
+                self.bootstrap.parameters, self.mc_error = result
+                return
+        self._make_uncertainty(
+            n_boots=n_boots, seed=seed, batched=batched, tol=tol, quantiles=quantiles,
+            monitor_df=monitor_df, batch_size=batch_size, checkpoint_dir=checkpoint_dir
         )
+        if key is not None:
+            self.cache.put(key, (self.bootstrap.parameters, self.mc_error))
+
+    def _make_uncertainty(self, n_boots: int, seed: Optional[Seed], batched: bool,
+                          tol: Optional[float], quantiles: Sequence[float],
+                          monitor_df: Optional[pd.DataFrame], batch_size: Optional[int],
+                          checkpoint_dir: Optional[str]):
+        if self.uncertainty == 'asymptotic':
+            if self.params_opt is None:
+                raise RunException("Need to fit the model before making asymptotic uncertainty.")
+            self.bootstrap.make_draws(n_draws=n_boots, seed=seed)
+            return
+        if batched:
+            if not isinstance(self.bootstrap, (BinomialBootstrap, WeightedBootstrap)):
+                raise RunException("Batched bootstrap is only available for binomial, "
+                                   "Poisson and Bayesian bootstraps.")
+            if isinstance(self.solver, Hierarchy):
+                raise RunException("Batched bootstrap does not support a group column.")
+            if self.model.C is not None and np.any(self.model.C != 0):
+                raise RunException("Batched bootstrap does not support spline shape constraints.")
+        if batch_size is None:
+            batch_size = n_boots if tol is None and checkpoint_dir is None else 50
+        if seed is not None:
+            self.bootstrap.set_seed(seed)
+        store = None
+        if checkpoint_dir is not None:
+            if self.bootstrap.seed_sequence is None:
+                raise RunException("Need a seed to checkpoint the bootstrap.")
+            store = CheckpointStore(
+                path=checkpoint_dir, seed_sequence=self.bootstrap.seed_sequence,
+                key=self._cache_key('checkpoint')
+            )
+
+        # the replicates attach the model to the bootstrap's specs and refit the
+        # solver to re-sampled data, so keep the fit to the data to put it back afterwards
+        state = None if self.params_opt is None else self.solver.fit_state()
+
+        self.bootstrap.parameters = list()
+        self.mc_error = None
+        while len(self.bootstrap.parameters) < n_boots:
+            start = len(self.bootstrap.parameters)
+            replicates = range(start, min(start + batch_size, n_boots))
+            self.bootstrap.parameters.extend(
+                self._run_replicates(replicates=replicates, batched=batched, store=store)
+            )
+            if tol is not None:
+                self.mc_error = self._mc_error(quantiles=quantiles, monitor_df=monitor_df)
+                if self.mc_error <= tol:
+                    break
+
+        self.model.detach_specs()
+        self.model.attach_specs(lr_specs=self.lr_specs)
+        if state is not None:
+            self.solver.restore(state, data=self.lr_specs.data)
+
+    def approximation_error(self) -> Dict[str, float]:
+        """
+        Fits the same model without binning the spline covariates, and compares
+        its predictions for the data with the predictions of the binned fit.
+        :code:`BinneyRun.fit()` needs to be run first.
+
+        Returns
+        -------
+        A dictionary with the number of rows and of aggregated rows, the maximum and
+        mean absolute differences between the predicted probabilities, and the binomial
+        deviance of the binned and of the exact fits for the data.
+        """
+        if self.params_opt is None:
+            raise RunException("Need to fit the model before computing the approximation error.")
+        if len(self.lr_specs.binned_splines) == 0:
+            raise RunException("The model does not have any binned splines.")
+        exact_run = BinneyRun(df=self._exact_df, **self._exact_kwargs)
+        exact_run.fit()
+
+        df = self._exact_df
+        data_specs = self.lr_specs.data_specs
+        obs = df[data_specs.col_obs].to_numpy()
+        total = df[data_specs.col_total].to_numpy()
+        weights = None if data_specs.col_weight is None else df[data_specs.col_weight].to_numpy()
+        p_binned = self.predict(new_df=df)
+        p_exact = exact_run.predict(new_df=df)
+        return {
+            'rows': len(df),
+            'aggregated_rows': len(self.lr_specs.data._df),
+            'max_abs_error': np.max(np.abs(p_binned - p_exact)),
+            'mean_abs_error': np.mean(np.abs(p_binned - p_exact)),
+            'deviance_binned': binomial_deviance(obs=obs, total=total, p=p_binned, weights=weights),
+            'deviance_exact': binomial_deviance(obs=obs, total=total, p=p_exact, weights=weights)
+        }
+
+    def save(self, path: Union[str, Path]) -> None:
+        """
+        Saves the run, with its fitted parameters and bootstrap parameters,
+        to a file, e.g. to serve predictions from it
+        with :mod:`binney.run.serve`.
+
+        Parameters
+        ----------
+        path
+            File to save the run to.
+        """
+        with open(path, 'wb') as f:
+            pickle.dump(self, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @staticmethod
+    def load(path: Union[str, Path]) -> 'BinneyRun':
+        """
+        Loads a run saved with :code:`BinneyRun.save()`. Only load
+        files that you trust, since they are unpickled.
+
+        Parameters
+        ----------
+        path
+            File with the saved run.
+
+        Returns
+        -------
+        The run.
+        """
+        with open(path, 'rb') as f:
+            b_run = pickle.load(f)
+        if not isinstance(b_run, BinneyRun):
+            raise RunException(f"{path} does not contain a BinneyRun.")
+        return b_run
@@ -0,0 +1,357 @@
+"""
+Serves predictions from a fitted :class:`~binney.run.run.BinneyRun`, either over
+HTTP or as JSON lines on stdin and stdout. Concurrent requests are coalesced into
+micro-batches, so that each batch builds one design matrix and makes one
+vectorized prediction. For example,
+
+.. code:: bash
+
+    python -m binney.run.serve model.pkl --port 8000
+
+    curl -X POST localhost:8000/predict -d '{"rows": {"x1": [0.1, 0.2]}, "quantiles": [0.5]}'
+
+where model.pkl was saved with :code:`BinneyRun.save()`. A request has the
+covariate, spline and group columns of the rows to predict for, either as a
+dictionary of lists or as a list of records, and optionally the quantiles of the
+bootstrap draws to return. The response has the point predictions in "mean",
+and the draw quantiles in "quantiles".
+"""
+import asyncio
+import json
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+import click
+import numpy as np
+import pandas as pd
+
+from binney import BinneyException
+from binney.run.run import BinneyRun
+
+
+class PredictionError(BinneyException):
+    pass
+
+
+class PredictionServer:
+    def __init__(self, b_run: BinneyRun, max_batch_size: int = 4096, max_delay: float = 0.002):
+        """
+        Makes predictions for concurrent requests in micro-batches. A batch is
+        started by the first waiting request, and collects the requests that arrive
+        within max_delay seconds, up to max_batch_size rows. The predictions for
+        a batch are made on a worker thread, so the event loop keeps accepting
+        requests in the meantime.
+
+        Parameters
+        ----------
+        b_run
+            A fitted run.
+        max_batch_size
+            Maximum number of rows in a batch.
+        max_delay
+            Maximum number of seconds to wait for more requests to add to a batch.
+
+        Attributes
+        ----------
+        self.columns
+            Columns that a request needs to have.
+        self.n_batches
+            Number of batches predicted so far.
+        self.n_requests
+            Number of requests predicted so far.
+        """
+        if b_run.params_opt is None:
+            raise PredictionError("Need to fit the model before serving predictions.")
+        self.b_run = b_run
+        self.max_batch_size = max_batch_size
+        self.max_delay = max_delay
+
+        data_specs = b_run.lr_specs.data_specs
+        outcomes = [data_specs.col_obs, data_specs.col_total, data_specs.col_weight]
+        self.columns = [col for col in b_run.lr_specs.columns if col not in outcomes]
+        self.n_batches = 0
+        self.n_requests = 0
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._batcher: Optional[asyncio.Task] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    async def start(self):
+        """
+        Starts collecting requests into batches.
+        """
+        self._queue = asyncio.Queue()
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        self._batcher = asyncio.get_running_loop().create_task(self._batch_loop())
+
+    async def stop(self):
+        """
+        Stops collecting requests into batches.
+        """
+        self._batcher.cancel()
+        try:
+            await self._batcher
+        except asyncio.CancelledError:
+            pass
+        self._executor.shutdown(wait=True)
+
+    async def __aenter__(self) -> 'PredictionServer':
+        await self.start()
+        return self
+
+    async def __aexit__(self, *args):
+        await self.stop()
+
+    def _make_frame(self, rows) -> pd.DataFrame:
+        try:
+            df = pd.DataFrame(rows)
+        except (TypeError, ValueError) as e:
+            raise PredictionError(f"Could not read the rows of the request: {e}")
+        missing = [col for col in self.columns if col not in df.columns]
+        if len(missing) > 0:
+            raise PredictionError(f"Columns {missing} are missing from the request.")
+        return df[self.columns]
+
+    async def predict(self, rows, quantiles: Optional[Sequence[float]] = None) -> Dict[str, Any]:
+        """
+        Makes predictions for one request, as part of a batch.
+
+        Parameters
+        ----------
+        rows
+            Rows to predict for, as a dictionary of lists or a list of records.
+        quantiles
+            Optional quantiles of the bootstrap draws to return.
+
+        Returns
+        -------
+        A dictionary with the predictions in "mean" and, if there are quantiles,
+        a dictionary of the draw quantiles in "quantiles".
+        """
+        df = self._make_frame(rows)
+        if quantiles is not None and not getattr(self.b_run.bootstrap, 'parameters', None):
+            raise PredictionError("Need to make uncertainty before serving draw quantiles.")
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((df, quantiles, future))
+        return await future
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            requests = [await self._queue.get()]
+            n_rows = len(requests[0][0])
+            deadline = loop.time() + self.max_delay
+            while n_rows < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    request = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+                except asyncio.TimeoutError:
+                    break
+                requests.append(request)
+                n_rows += len(request[0])
+            try:
+                results = await loop.run_in_executor(self._executor, self._predict_batch, requests)
+            except Exception:
+                # predict the requests one at a time, so that
+                # a bad request doesn't fail the rest of the batch
+                results = []
+                for request in requests:
+                    try:
+                        results.extend(await loop.run_in_executor(
+                            self._executor, self._predict_batch, [request]
+                        ))
+                    except Exception as e:
+                        results.append(e)
+            for (_, _, future), result in zip(requests, results):
+                if future.done():
+                    continue
+                if isinstance(result, Exception):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+    def _predict_batch(self, requests: List[Tuple[pd.DataFrame, Any, Any]]) -> List[Dict[str, Any]]:
+        """
+        Makes the predictions for a batch of requests at once.
+        """
+        df = pd.concat([request[0] for request in requests], ignore_index=True)
+        mean = self.b_run.predict(new_df=df)
+        draws = None
+        if any(request[1] is not None for request in requests):
+            draws = self.b_run.predict_draws(df=df)
+
+        results = []
+        start = 0
+        for request_df, quantiles, _ in requests:
+            end = start + len(request_df)
+            result = {'mean': mean[start:end].tolist()}
+            if quantiles is not None:
+                result['quantiles'] = {
+                    f"{q:g}": np.quantile(draws[:, start:end], q, axis=0).tolist()
+                    for q in quantiles
+                }
+            results.append(result)
+            start = end
+        self.n_batches += 1
+        self.n_requests += len(requests)
+        return results
+
+    async def handle(self, request: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Handles one decoded JSON request. Errors are returned in "error".
+        """
+        try:
+            if not isinstance(request, dict) or 'rows' not in request:
+                raise PredictionError("The request needs rows to predict for.")
+            return await self.predict(rows=request['rows'], quantiles=request.get('quantiles'))
+        except Exception as e:
+            return {'error': f"{type(e).__name__}: {e}"}
+
+    @staticmethod
+    async def _respond_http(writer: asyncio.StreamWriter, status: str, response: Dict[str, Any]):
+        payload = json.dumps(response).encode()
+        writer.write(
+            f"HTTP/1.1 {status}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(payload)}\r\n\r\n".encode() + payload
+        )
+        await writer.drain()
+
+    async def _handle_http(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                parts = request_line.decode('latin-1').split()
+                headers = dict()
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                content_length = headers.get('content-length', '0')
+                # the rest of the stream can't be framed after a malformed request
+                if len(parts) != 3 or not content_length.isdigit():
+                    await self._respond_http(writer, '400 Bad Request', {
+                        'error': f"Malformed request: {request_line.decode('latin-1').strip()!r}."
+                    })
+                    break
+                method, target, _ = parts
+                body = await reader.readexactly(int(content_length))
+
+                if method == 'GET' and target == '/health':
+                    status, response = '200 OK', {
+                        'status': 'ok', 'batches': self.n_batches, 'requests': self.n_requests
+                    }
+                elif method == 'POST' and target == '/predict':
+                    try:
+                        response = await self.handle(json.loads(body))
+                    except json.JSONDecodeError as e:
+                        response = {'error': f"Invalid JSON: {e}"}
+                    status = '400 Bad Request' if 'error' in response else '200 OK'
+                else:
+                    status, response = '404 Not Found', {'error': f"No route for {method} {target}."}
+
+                await self._respond_http(writer, status, response)
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve_http(self, host: str = '127.0.0.1', port: int = 8000) -> asyncio.AbstractServer:
+        """
+        Starts an HTTP server with a POST /predict route for predictions
+        and a GET /health route. Call :code:`PredictionServer.start()` first.
+
+        Parameters
+        ----------
+        host
+            Host to listen on.
+        port
+            Port to listen on. 0 picks a free port.
+
+        Returns
+        -------
+        The asyncio server.
+        """
+        return await asyncio.start_server(self._handle_http, host=host, port=port)
+
+    async def serve_stdio(self, stdin=sys.stdin, stdout=sys.stdout):
+        """
+        Reads one JSON request per line from stdin, and writes one JSON response per
+        line to stdout, until stdin is closed. Requests are handled concurrently, so
+        responses can be written out of order; an "id" in a request is copied to
+        its response. Call :code:`PredictionServer.start()` first.
+
+        Parameters
+        ----------
+        stdin
+            Stream to read requests from.
+        stdout
+            Stream to write responses to.
+        """
+        loop = asyncio.get_running_loop()
+
+        async def respond(line: str):
+            try:
+                request = json.loads(line)
+            except json.JSONDecodeError as e:
+                request, response = dict(), {'error': f"Invalid JSON: {e}"}
+            else:
+                response = await self.handle(request)
+            if isinstance(request, dict) and 'id' in request:
+                response['id'] = request['id']
+            stdout.write(json.dumps(response) + '\n')
+            stdout.flush()
+
+        tasks = set()
+        while True:
+            line = await loop.run_in_executor(None, stdin.readline)
+            if not line:
+                break
+            if line.strip():
+                task = loop.create_task(respond(line))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+
+
+async def _serve(b_run: BinneyRun, stdio: bool, host: str, port: int,
+                 max_batch_size: int, max_delay: float):
+    async with PredictionServer(b_run, max_batch_size=max_batch_size, max_delay=max_delay) as server:
+        if stdio:
+            await server.serve_stdio()
+        else:
+            http_server = await server.serve_http(host=host, port=port)
+            async with http_server:
+                await http_server.serve_forever()
+
+
+@click.command()
+@click.argument('model', type=click.Path(exists=True, dir_okay=False))
+@click.option('--host', default='127.0.0.1', help='Host to listen on.')
+@click.option('--port', default=8000, help='Port to listen on.')
+@click.option('--stdio', is_flag=True, help='Serve JSON lines on stdin and stdout instead of HTTP.')
+@click.option('--max-batch-size', default=4096, help='Maximum number of rows in a batch.')
+@click.option('--max-delay', default=0.002, help='Maximum seconds to wait to fill a batch.')
+def main(model, host, port, stdio, max_batch_size, max_delay):
+    """
+    Serves predictions from a MODEL saved with BinneyRun.save().
+    """
+    b_run = BinneyRun.load(model)
+    asyncio.run(_serve(
+        b_run=b_run, stdio=stdio, host=host, port=port,
+        max_batch_size=max_batch_size, max_delay=max_delay
+    ))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+from typing import Iterator, Optional, Tuple
+import numpy as np
+
+
+def poisson_weight_blocks(n_boots: int, n_obs: int,
+                          block_size: Optional[int] = None,
+                          rng=np.random) -> Iterator[np.ndarray]:
+    """
+    Streams Poisson(1) bootstrap weights row-block by row-block. Every block is a
+    (n_boots, block_size) array, so each row of observations gets an independent
+    weight in each bootstrap replicate without ever having to know the full
+    number of rows up front.
+
+    Parameters
+    ----------
+    n_boots
+        Number of bootstrap replicates.
+    n_obs
+        Number of observations (rows) to generate weights for.
+    block_size
+        Number of observations per block. Defaults to all of them in one block.
+    rng
+        A numpy Generator. Defaults to the global numpy random state.
+
+    Returns
+    -------
+    An iterator over (n_boots, block_size) arrays of weights. The last block
+    may be smaller than block_size.
+    """
+    if block_size is None:
+        block_size = max(n_obs, 1)
+    for start in range(0, n_obs, block_size):
+        size = min(block_size, n_obs - start)
+        yield rng.poisson(lam=1., size=(n_boots, size)).astype(float)
+
+
+def poisson_weights(n_boots: int, n_obs: int,
+                    block_size: Optional[int] = None, rng=np.random) -> np.ndarray:
+    """
+    Generates Poisson(1) bootstrap weights for all replicates at once.
+
+    Parameters
+    ----------
+    n_boots
+        Number of bootstrap replicates.
+    n_obs
+        Number of observations (rows).
+    block_size
+        Optional number of observations generated per block.
+    rng
+        A numpy Generator. Defaults to the global numpy random state.
+
+    Returns
+    -------
+    A (n_boots, n_obs) array of weights.
+    """
+    blocks = list(poisson_weight_blocks(n_boots=n_boots, n_obs=n_obs, block_size=block_size, rng=rng))
+    if len(blocks) == 0:
+        return np.empty((n_boots, 0))
+    return np.hstack(blocks)
+
+
+def dirichlet_weights(n_boots: int, n_obs: int, rng=np.random) -> np.ndarray:
+    """
+    Generates Bayesian bootstrap weights, which are Dirichlet(1, ..., 1)
+    draws scaled by the number of observations so that the weights
+    in each replicate have mean one.
+
+    Parameters
+    ----------
+    n_boots
+        Number of bootstrap replicates.
+    n_obs
+        Number of observations (rows).
+    rng
+        A numpy Generator. Defaults to the global numpy random state.
+
+    Returns
+    -------
+    A (n_boots, n_obs) array of weights.
+    """
+    gammas = rng.exponential(scale=1., size=(n_boots, n_obs))
+    return n_obs * gammas / gammas.sum(axis=1, keepdims=True)
+
+
+def case_control_weights(obs: np.ndarray, fraction: float,
+                         rng=np.random) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Case-control subsampling of Bernoulli data: keeps all of the rows with a
+    success, and each row without a success with probability fraction. The kept
+    failures get a weight of 1 / fraction, so that the weighted likelihood
+    of the subsample is an unbiased estimate of the likelihood of all of the data,
+    and the weighted fit is consistent for all of the coefficients.
+
+    Parameters
+    ----------
+    obs
+        Observed successes of each row.
+    fraction
+        Probability of keeping a row without a success.
+    rng
+        A numpy Generator. Defaults to the global numpy random state.
+
+    Returns
+    -------
+    The indices of the kept rows, and their weights.
+    """
+    case = obs > 0
+    index = np.flatnonzero(case | (rng.random(len(obs)) < fraction))
+    weights = np.where(case[index], 1., 1. / fraction)
+    return index, weights
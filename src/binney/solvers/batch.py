@@ -0,0 +1,101 @@
+import warnings
+from typing import Optional
+import numpy as np
+from scipy.special import expit
+
+from binney import BinneyException
+
+
+class BatchSolverError(BinneyException):
+    pass
+
+
+def batched_newton(design_matrix: np.ndarray, obs: np.ndarray, total: np.ndarray,
+                   x_init: np.ndarray, prior_mean: Optional[np.ndarray] = None,
+                   prior_std: Optional[np.ndarray] = None,
+                   max_iter: int = 50, tol: float = 1e-8,
+                   max_halvings: int = 30) -> np.ndarray:
+    """
+    Fits many binomial regressions that share a design matrix, and only differ
+    in their observed successes and totals, simultaneously with Newton's method.
+    The parameters for all of the problems are stacked into one (B, p) array,
+    so each iteration takes one product with the design matrix and one batch
+    of (B, p, p) linear solves. The step of each problem is halved until its
+    penalized objective decreases. Does not handle linear constraints.
+
+    Parameters
+    ----------
+    design_matrix
+        The shared (N, p) design matrix.
+    obs
+        A (B, N) array of observed successes, one row per problem.
+    total
+        A (B, N) or (N,) array of totals.
+    x_init
+        Initial parameters, either (p,) for all of the problems or (B, p).
+    prior_mean
+        Optional (p,) array of Gaussian prior means.
+    prior_std
+        Optional (p,) array of Gaussian prior standard deviations,
+        where np.inf means no prior.
+    max_iter
+        Maximum number of Newton iterations. Warns if the
+        solver has not converged after this many.
+    tol
+        Convergence tolerance on the largest absolute Newton step.
+    max_halvings
+        Maximum number of times to halve a Newton step.
+
+    Returns
+    -------
+    A (B, p) array of optimal parameters.
+    """
+    n_boots = obs.shape[0]
+    n_fe = design_matrix.shape[1]
+    if prior_mean is None:
+        prior_mean = np.zeros(n_fe)
+    if prior_std is None:
+        prior_precision = np.zeros(n_fe)
+    else:
+        prior_precision = 1 / np.asarray(prior_std)**2
+
+    def objective(x):
+        eta = design_matrix.dot(x.T).T
+        return np.sum(total * np.logaddexp(0, eta) - obs * eta, axis=1) + \
+            0.5 * np.sum(prior_precision * (x - prior_mean)**2, axis=1)
+
+    x = np.array(np.broadcast_to(x_init, (n_boots, n_fe)), dtype=float)
+    value = objective(x)
+    hess = np.empty((n_boots, n_fe, n_fe))
+    weighted = np.empty(design_matrix.shape)
+    for _ in range(max_iter):
+        p = expit(design_matrix.dot(x.T)).T
+        mp = total * p
+        grad = (mp - obs).dot(design_matrix) + prior_precision * (x - prior_mean)
+        weights = mp * (1 - p)
+        # one BLAS product per problem, einsum over (B, N, p, p) doesn't use BLAS
+        for b in range(n_boots):
+            np.multiply(design_matrix, weights[b][:, None], out=weighted)
+            np.dot(design_matrix.T, weighted, out=hess[b])
+        hess[:, np.arange(n_fe), np.arange(n_fe)] += prior_precision
+        try:
+            step = np.linalg.solve(hess, grad[..., None])[..., 0]
+        except np.linalg.LinAlgError:
+            raise BatchSolverError("Singular Hessian in the batched Newton solver. "
+                                   "At least one replicate is not identifiable.")
+        if np.max(np.abs(step)) < tol:
+            return x - step
+        # halve the steps of the problems whose penalized objective increases
+        new_x = x - step
+        new_value = objective(new_x)
+        for _ in range(max_halvings):
+            worse = new_value > value
+            if not np.any(worse):
+                break
+            step[worse] /= 2
+            new_x[worse] = x[worse] - step[worse]
+            new_value = objective(new_x)
+        x, value = new_x, new_value
+    warnings.warn(f"The batched Newton solver did not converge in {max_iter} iterations.",
+                  RuntimeWarning)
+    return x
@@ -1,4 +1,5 @@
-from typing import Optional, Dict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, List, Sequence, Any
 import numpy as np
 import pandas as pd
 from copy import copy
@@ -6,16 +7,24 @@ from copy import copy
 from anml.solvers.composite import CompositeSolver
 from anml.data.data import Data
 
+from binney.data.data import LRSpecs
 from binney.solvers.solver import Base
 
 
 class Hierarchy(CompositeSolver):
 
-    def __init__(self, solver: Base, coefficient_prior_var: float):
+    def __init__(self, solver: Base, coefficient_prior_var: float, n_jobs: int = 1):
         """
         Hierarchical solver that first solves the problem with
         all of the data, then uses those fixed effects as priors
-        for group-specific models.
+        for group-specific models. With several nested group columns,
+        the fit for each group is used as the prior for the groups nested
+        in it, level by level, and the parameters for the groups at the last
+        level are the result.
+
+        Groups at the first level are identified by their value of the
+        first group column, and groups at deeper levels by a tuple of
+        their values of the group columns down to their level.
 
         Parameters
         ----------
@@ -24,52 +33,254 @@ class Hierarchy(CompositeSolver):
         coefficient_prior_var
             Variance of the prior to pass down to the group-specific
             models.
+        n_jobs
+            Number of groups within a level to fit concurrently.
+
+        Attributes
+        ----------
+        self.group_specs
+            Group-specific specs, configured with the group's data. They
+            are kept between fits so that only the priors need to be updated
+            when the data hasn't changed.
+        self.partitions
+            Row indices of each group in the data, for each level.
+        self.x_nodes
+            Parameters for the groups at every level.
         """
         super().__init__([solver])
 
         self.coefficient_prior_var = coefficient_prior_var
+        self.n_jobs = n_jobs
         self.x_opt = dict()
+        self.x_nodes = dict()
+        self.group_specs: Dict[object, LRSpecs] = dict()
+        self.partitions: List[Dict[object, np.ndarray]] = list()
+        self._group_df = None
 
-    def _cache_result(self):
-        return copy(self.solvers[0].x_opt).tolist()
+    def _cache_result(self, solver: Optional[Base] = None):
+        if solver is None:
+            solver = self.solvers[0]
+        return copy(solver.x_opt).tolist()
 
     @property
     def lr_specs(self):
         return self.solvers[0].lr_specs
 
-    def fit(self, x_init: np.ndarray, data: Data, **kwargs):
-        self.solvers[0].fit(x_init=x_init, data=data, **kwargs)
-        prior = self._cache_result()
-        self.lr_specs.make_parameter_set(
+    @property
+    def levels(self) -> List[str]:
+        return self.lr_specs.data_specs.col_groups
+
+    def partition(self, df: pd.DataFrame, level: int) -> Dict[object, np.ndarray]:
+        """
+        Finds the row indices of each group at a level of the hierarchy.
+
+        Parameters
+        ----------
+        df
+            Data frame with the group columns.
+        level
+            Level of the hierarchy, starting from 0.
+
+        Returns
+        -------
+        Dictionary of row indices keyed by group.
+        """
+        return df.groupby(self.levels[:level + 1], sort=True).indices
+
+    @staticmethod
+    def parent(group, level: int):
+        """
+        The group that a group at a level of the hierarchy is nested in,
+        or None for a group at the first level.
+        """
+        if level == 0:
+            return None
+        if level == 1:
+            return group[0]
+        return group[:-1]
+
+    def configure_groups(self, data: Data):
+        """
+        Partitions the data at each level and configures the group-specific
+        specs with the group's slice of the data, unless they are already
+        configured with the same data frame.
+
+        Parameters
+        ----------
+        data
+            Data for all of the groups.
+        """
+        df = data._df
+        if df is self._group_df:
+            return
+        self.partitions = [self.partition(df, level) for level in range(len(self.levels))]
+        for partition in self.partitions:
+            for group, group_index in partition.items():
+                if group not in self.group_specs:
+                    self.group_specs[group] = self.lr_specs.copy_specs()
+                self.group_specs[group].configure_data(df=df.iloc[group_index])
+        self._group_df = df
+
+    def _fit_group(self, group, prior: List[float], prior_var: float,
+                   x_init: List[float], **kwargs) -> List[float]:
+        """
+        Fits one group with its own copies of the solver and the model,
+        so that the groups within a level can be fit concurrently.
+        """
+        group_specs = self.group_specs[group]
+        group_specs.update_priors(
             coefficient_priors=prior,
-            coefficient_prior_var=self.coefficient_prior_var
+            coefficient_prior_var=prior_var
+        )
+        solver = copy(self.solvers[0])
+        solver.model = copy(self.solvers[0].model)
+        solver.model.attach_specs(group_specs)
+        solver.fit(x_init=x_init, data=group_specs.data, **kwargs)
+        return self._cache_result(solver)
+
+    def fit(self, x_init: np.ndarray, data: Data, **kwargs):
+        self.fit_path(
+            x_init=x_init, data=data,
+            prior_vars=[self.coefficient_prior_var], **kwargs
         )
-        unique_groups = np.unique(data.data['groups'].ravel())
-        group_indices = data.data['groups'].ravel()
-        df = data._df.copy()
-        for group in unique_groups:
-            group_index = np.where(group_indices == group)[0]
-            self.lr_specs.configure_data(df=df.iloc[group_index])
-            self.solvers[0].model.attach_specs(self.lr_specs)
-            self.solvers[0].fit(x_init=self._cache_result(), data=self.lr_specs.data, **kwargs)
-            self.x_opt[group] = self._cache_result()
+
+    def fit_path(self, x_init: np.ndarray, data: Data, prior_vars: Sequence[float],
+                 **kwargs) -> List[Dict[object, List[float]]]:
+        """
+        Fits the group-specific models for a sequence of coefficient prior
+        variances. The global model is only fit once, the group specs are
+        only configured once, and the fit for each group is warm-started
+        from its solution for the previous variance, so order the variances
+        so that neighbouring solutions are close, e.g. increasing.
+
+        After the path, :code:`self.coefficient_prior_var` and :code:`self.x_opt`
+        are those of the last variance.
+
+        Parameters
+        ----------
+        x_init
+            Initial values for the global model.
+        data
+            Data for all of the groups.
+        prior_vars
+            Sequence of coefficient prior variances.
+
+        Returns
+        -------
+        A list with the dictionary of parameters for the groups at the
+        last level for each variance.
+        """
+        self.solvers[0].fit(x_init=x_init, data=data, **kwargs)
+        root = self._cache_result()
+        self.configure_groups(data=data)
+
+        x_start = dict()
+        path = []
+        with ThreadPoolExecutor(max_workers=self.n_jobs) as executor:
+            for prior_var in prior_vars:
+                x_nodes = dict()
+                for level, partition in enumerate(self.partitions):
+                    groups = list(partition.keys())
+                    priors = [
+                        root if level == 0 else x_nodes[self.parent(group, level)]
+                        for group in groups
+                    ]
+                    results = executor.map(
+                        lambda group, prior: self._fit_group(
+                            group=group, prior=prior, prior_var=prior_var,
+                            x_init=x_start.get(group, prior), **kwargs
+                        ),
+                        groups, priors
+                    )
+                    x_nodes.update(zip(groups, results))
+                path.append({group: x_nodes[group] for group in self.partitions[-1]})
+                x_start = x_nodes
+
+        self.coefficient_prior_var = prior_vars[-1]
+        self.x_nodes = x_start
+        self.x_opt = path[-1]
+        return path
+
+    def fit_state(self) -> Dict[str, Any]:
+        """
+        The results of the last fit, which :code:`Hierarchy.restore()` can restore.
+        """
+        return {
+            'root': self.solvers[0].fit_state(),
+            'x_nodes': self.x_nodes,
+            'coefficient_prior_var': self.coefficient_prior_var
+        }
+
+    def restore(self, state: Dict[str, Any], data: Data):
+        """
+        Restores the results of a fit from :code:`Hierarchy.fit_state()` without
+        refitting. The group specs are configured with the data and get the priors
+        that they were fit with, so that they can be used for predictions and
+        for asymptotic uncertainty.
+
+        Parameters
+        ----------
+        state
+            Results of the fit.
+        data
+            Data for all of the groups.
+        """
+        self.solvers[0].restore(state['root'])
+        self.coefficient_prior_var = state['coefficient_prior_var']
+        self.configure_groups(data=data)
+        x_nodes = state['x_nodes']
+        root = self._cache_result()
+        for level, partition in enumerate(self.partitions):
+            for group in partition:
+                self.group_specs[group].update_priors(
+                    coefficient_priors=root if level == 0 else x_nodes[self.parent(group, level)],
+                    coefficient_prior_var=self.coefficient_prior_var
+                )
+        self.x_nodes = x_nodes
+        self.x_opt = {group: x_nodes[group] for group in self.partitions[-1]}
 
     def predict(self, new_df: pd.DataFrame, x: Optional[Dict[str, np.ndarray]] = None):
         if x is None:
             x = self.x_opt
-        predictions = np.empty(len(new_df))
-        self.lr_specs.configure_data(new_df)
-        unique_groups = np.unique(self.lr_specs.data.data['groups'].ravel())
-        group_indices = self.lr_specs.data.data['groups'].ravel()
-        for group in unique_groups:
-            group_index = np.where(group_indices == group)[0]
-            if group not in self.x_opt:
+        unique_df, inverse = self.lr_specs.deduplicate(df=new_df)
+        predictions = np.empty(len(unique_df))
+        for group, group_index in self.partition(unique_df, len(self.levels) - 1).items():
+            if group not in x:
                 raise RuntimeError(f"Could not find group identifier {group} in the original fit."
-                                   f"Available groups are {self.x_opt.keys()}.")
-            group_preds = self.solvers[0].predict(
-                x=x[group],
-                new_df=self.lr_specs.data._df.iloc[group_index]
+                                   f"Available groups are {x.keys()}.")
+            predictions[group_index] = self.solvers[0].model.forward(
+                x=np.asarray(x[group]),
+                mat=self.group_specs[group].configure_new_data(df=unique_df.iloc[group_index])
             )
-            predictions[group_indices == group] = group_preds
 
-        return predictions
+        return predictions if inverse is None else predictions[inverse]
+
+    def predict_draws(self, xs: List[Dict[str, np.ndarray]], new_df: pd.DataFrame) -> np.ndarray:
+        """
+        Makes predictions for many sets of group parameters at once, building
+        the design matrix for each group only once. Predictions are only made
+        for the unique rows of the new data frame.
+
+        Parameters
+        ----------
+        xs
+            List of dictionaries of group parameters.
+        new_df
+            Data frame to make predictions for.
+
+        Returns
+        -------
+        A (len(xs), len(new_df)) array of predictions.
+        """
+        unique_df, inverse = self.lr_specs.deduplicate(df=new_df)
+        draws = np.empty((len(xs), len(unique_df)))
+        for group, group_index in self.partition(unique_df, len(self.levels) - 1).items():
+            if group not in xs[0]:
+                raise RuntimeError(f"Could not find group identifier {group} in the original fit."
+                                   f"Available groups are {xs[0].keys()}.")
+            params = np.vstack([np.asarray(x[group]) for x in xs])
+            draws[:, group_index] = self.solvers[0].model.forward(
+                params.T,
+                mat=self.group_specs[group].configure_new_data(df=unique_df.iloc[group_index])
+            ).T
+        return draws if inverse is None else draws[:, inverse]
@@ -0,0 +1,277 @@
+import warnings
+from typing import Optional, Dict, List, Sequence, Any
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scipy.sparse.linalg import spsolve, cg, LinearOperator
+
+from anml.data.data import Data
+
+from binney import BinneyException
+from binney.model.model import BinomialModel
+from binney.solvers.hierarchical_solver import Hierarchy
+from binney.solvers.solver import Base
+from binney.utils import expit
+
+
+class JointSolverError(BinneyException):
+    pass
+
+
+class JointHierarchy(Hierarchy):
+
+    def __init__(self, solver: Base, coefficient_prior_var: float,
+                 max_iter: int = 100, tol: float = 1e-8, linear_solver: str = 'direct',
+                 max_halvings: int = 30, cg_max_iter: Optional[int] = None):
+        """
+        Hierarchical solver that fits all of the groups in one optimization.
+        The coefficients for a group are the global coefficients plus a
+        deviation for the group and for each group that it is nested in, with a
+        Gaussian penalty of variance :code:`coefficient_prior_var` on each deviation.
+        The global coefficients and all of the deviations are stacked into one
+        parameter vector with a sparse block design matrix and fit with Newton's
+        method, where each step solves one sparse linear system and is halved
+        until the penalized objective decreases.
+
+        Unlike :class:`~binney.solvers.hierarchical_solver.Hierarchy`, every group
+        uses the global design matrix, so splines have the same knots in all of
+        the groups. Does not handle spline shape constraints.
+
+        Parameters
+        ----------
+        solver
+            Solver with the model and the specs for all of the data. Only its
+            model and specs are used.
+        coefficient_prior_var
+            Variance of the Gaussian penalty on the group deviations.
+        max_iter
+            Maximum number of Newton iterations. Warns if the
+            solver has not converged after this many.
+        tol
+            Convergence tolerance on the largest absolute Newton step.
+        linear_solver
+            How to solve for the Newton steps, one of "direct" (sparse LU
+            factorization) or "cg" (conjugate gradient with a Jacobi preconditioner).
+        max_halvings
+            Maximum number of times to halve a Newton step.
+        cg_max_iter
+            Maximum number of conjugate gradient iterations for a Newton step.
+            Defaults to scipy's, ten times the number of parameters.
+        """
+        super().__init__(solver=solver, coefficient_prior_var=coefficient_prior_var)
+        if linear_solver not in ['direct', 'cg']:
+            raise JointSolverError(f"Linear solver must be one of 'direct' or 'cg'. "
+                                   f"Got {linear_solver}.")
+        self.max_iter = max_iter
+        self.tol = tol
+        self.linear_solver = linear_solver
+        self.max_halvings = max_halvings
+        self.cg_max_iter = cg_max_iter
+        self.theta = None
+        self._design = None
+
+    def configure_groups(self, data: Data):
+        """
+        Partitions the data at each level and builds the sparse block design
+        matrix, unless they were already built for the same data frame.
+
+        Parameters
+        ----------
+        data
+            Data for all of the groups.
+        """
+        df = data._df
+        if df is self._group_df:
+            return
+        self.partitions = [self.partition(df, level) for level in range(len(self.levels))]
+
+        design_matrix = np.asarray(self.solvers[0].model.design_matrix)
+        n_obs, n_fe = design_matrix.shape
+        rows = np.repeat(np.arange(n_obs), n_fe)
+        blocks = [sparse.csr_matrix(design_matrix)]
+        for partition in self.partitions:
+            node = np.empty(n_obs, dtype=int)
+            for j, group_index in enumerate(partition.values()):
+                node[group_index] = j
+            cols = (node[:, None] * n_fe + np.arange(n_fe)).ravel()
+            blocks.append(sparse.csr_matrix(
+                (design_matrix.ravel(), (rows, cols)),
+                shape=(n_obs, len(partition) * n_fe)
+            ))
+        self._design = sparse.hstack(blocks, format='csr')
+        self._group_df = df
+
+    def _solve(self, hessian: sparse.spmatrix, gradient: np.ndarray) -> np.ndarray:
+        if self.linear_solver == 'direct':
+            step = spsolve(hessian.tocsc(), gradient)
+            if not np.all(np.isfinite(step)):
+                raise JointSolverError("Could not solve for the Newton step in the joint solver. "
+                                       "At least one group is not identifiable.")
+            return step
+        diagonal = hessian.diagonal()
+        preconditioner = LinearOperator(hessian.shape, matvec=lambda v: v / diagonal)
+        n_iter = 0
+
+        def count(_):
+            nonlocal n_iter
+            n_iter += 1
+
+        step, info = cg(hessian, gradient, M=preconditioner, maxiter=self.cg_max_iter,
+                        callback=count)
+        if info != 0:
+            raise JointSolverError(f"Conjugate gradient did not converge for the Newton step "
+                                   f"in the joint solver after {n_iter} iterations (info {info}). "
+                                   f"Increase cg_max_iter or use linear_solver='direct'.")
+        return step
+
+    def _newton(self, theta: np.ndarray, data: Data, prior_var: float) -> np.ndarray:
+        model = self.solvers[0].model
+        obs, total = BinomialModel._counts(data)
+        n_fe = model.design_matrix.shape[1]
+
+        prior_mean = np.zeros(len(theta))
+        prior_mean[:n_fe] = model.lr_specs.prior_mean
+        precision = np.full(len(theta), 1 / prior_var)
+        precision[:n_fe] = 1 / model.lr_specs.prior_std**2
+
+        def objective(eta, theta):
+            return np.sum(total * np.logaddexp(0, eta) - obs * eta) + \
+                0.5 * np.sum(precision * (theta - prior_mean)**2)
+
+        eta = self._design.dot(theta)
+        value = objective(eta, theta)
+        for _ in range(self.max_iter):
+            p = expit(eta)
+            mp = total * p
+            gradient = self._design.T.dot(mp - obs) + precision * (theta - prior_mean)
+            hessian = self._design.T.dot(self._design.multiply((mp * (1 - p))[:, None]))
+            hessian = hessian + sparse.diags(precision)
+            step = self._solve(hessian, gradient)
+            if np.max(np.abs(step)) < self.tol:
+                return theta - step
+            # halve the step until the penalized objective decreases
+            for _ in range(self.max_halvings):
+                new_theta = theta - step
+                new_eta = self._design.dot(new_theta)
+                new_value = objective(new_eta, new_theta)
+                if new_value <= value:
+                    break
+                step = step / 2
+            theta, eta, value = new_theta, new_eta, new_value
+        warnings.warn(f"The joint solver did not converge in {self.max_iter} iterations "
+                      f"for coefficient prior variance {prior_var}.", RuntimeWarning)
+        return theta
+
+    def fit_path(self, x_init: np.ndarray, data: Data, prior_vars: Sequence[float],
+                 **kwargs) -> List[Dict[object, List[float]]]:
+        """
+        Fits all of the groups jointly for a sequence of penalty variances,
+        warm-starting each fit from the solution for the previous variance.
+
+        Parameters
+        ----------
+        x_init
+            Initial values for the global coefficients.
+        data
+            Data for all of the groups.
+        prior_vars
+            Sequence of variances of the penalty on the group deviations.
+
+        Returns
+        -------
+        A list with the dictionary of parameters for the groups at the
+        last level for each variance.
+        """
+        C = self.solvers[0].model.C
+        if C is not None and np.any(C != 0):
+            raise JointSolverError("The joint solver does not support spline shape constraints.")
+        self.configure_groups(data=data)
+        n_fe = self.solvers[0].model.design_matrix.shape[1]
+
+        theta = np.zeros(self._design.shape[1])
+        theta[:n_fe] = x_init
+        path = []
+        for prior_var in prior_vars:
+            theta = self._newton(theta=theta, data=data, prior_var=prior_var)
+            path.append(self._group_parameters(theta, n_fe))
+        self.theta = theta
+
+        self.coefficient_prior_var = prior_vars[-1]
+        self.x_opt = path[-1]
+        return path
+
+    def _group_parameters(self, theta: np.ndarray, n_fe: int) -> Dict[object, List[float]]:
+        """
+        Adds up the global coefficients and the deviations of
+        each group and of the groups that it is nested in.
+        """
+        x_nodes = dict()
+        offset = n_fe
+        for level, partition in enumerate(self.partitions):
+            for group in partition:
+                parent = self.parent(group, level)
+                base = theta[:n_fe] if parent is None else x_nodes[parent]
+                x_nodes[group] = base + theta[offset:offset + n_fe]
+                offset += n_fe
+        self.x_nodes = {group: x.tolist() for group, x in x_nodes.items()}
+        return {group: self.x_nodes[group] for group in self.partitions[-1]}
+
+    def fit_state(self) -> Dict[str, Any]:
+        """
+        The results of the last fit, which :code:`JointHierarchy.restore()` can restore.
+        """
+        return {'theta': self.theta, 'coefficient_prior_var': self.coefficient_prior_var}
+
+    def restore(self, state: Dict[str, Any], data: Data):
+        """
+        Restores the results of a fit from :code:`JointHierarchy.fit_state()`
+        without refitting.
+
+        Parameters
+        ----------
+        state
+            Results of the fit.
+        data
+            Data for all of the groups.
+        """
+        self.configure_groups(data=data)
+        self.theta = state['theta']
+        self.coefficient_prior_var = state['coefficient_prior_var']
+        self.x_opt = self._group_parameters(
+            self.theta, self.solvers[0].model.design_matrix.shape[1]
+        )
+
+    def predict(self, new_df: pd.DataFrame, x: Optional[Dict[str, np.ndarray]] = None):
+        if x is None:
+            x = self.x_opt
+        return self.predict_draws(xs=[x], new_df=new_df)[0]
+
+    def predict_draws(self, xs: List[Dict[str, np.ndarray]], new_df: pd.DataFrame) -> np.ndarray:
+        """
+        Makes predictions for many sets of group parameters at once with
+        the global design matrix for the unique rows of the new data frame.
+
+        Parameters
+        ----------
+        xs
+            List of dictionaries of group parameters.
+        new_df
+            Data frame to make predictions for.
+
+        Returns
+        -------
+        A (len(xs), len(new_df)) array of predictions.
+        """
+        unique_df, inverse = self.lr_specs.deduplicate(df=new_df)
+        design_matrix = self.lr_specs.configure_new_data(df=unique_df)
+        draws = np.empty((len(xs), len(unique_df)))
+        for group, group_index in self.partition(unique_df, len(self.levels) - 1).items():
+            if group not in xs[0]:
+                raise RuntimeError(f"Could not find group identifier {group} in the original fit."
+                                   f"Available groups are {xs[0].keys()}.")
+            params = np.vstack([np.asarray(x[group]) for x in xs])
+            draws[:, group_index] = self.solvers[0].model.forward(
+                params.T,
+                mat=design_matrix[group_index]
+            ).T
+        return draws if inverse is None else draws[:, inverse]
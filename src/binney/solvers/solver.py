@@ -1,17 +1,102 @@
 import numpy as np
-from typing import Optional
+from typing import Optional, List, Dict, Any
 import pandas as pd
 
+from anml.data.data import Data
 from anml.solvers.interface import Solver
-from anml.solvers.base import ScipyOpt, IPOPTSolver
+from anml.solvers.utils import has_bounds, has_constraints
 
 from binney.data.data import LRSpecs
 
 
 class Base(Solver):
-    def __init__(self, **kwargs):
+    def __init__(self, lazy_constraints: bool = False, constraint_tol: float = 1e-6,
+                 max_cuts: int = 20, **kwargs):
+        """
+        Solver for the binney model.
+
+        Parameters
+        ----------
+        lazy_constraints
+            Whether to add the linear constraints of the model as cutting planes.
+            The model is first fit without any constraints, then the constraints that
+            the solution violates are added and the model is fit again, starting from
+            the previous solution, until no constraints are violated.
+        constraint_tol
+            Tolerance for a constraint to count as violated.
+        max_cuts
+            Maximum number of rounds of adding constraints. If constraints are
+            still violated after this many, the model is fit with all of them.
+
+        Attributes
+        ----------
+        self.active_constraints
+            Which of the constraints were imposed in the last fit with lazy constraints.
+        """
         super().__init__(**kwargs)
         self.lr_specs = None
+        self.lazy_constraints = lazy_constraints
+        self.constraint_tol = constraint_tol
+        self.max_cuts = max_cuts
+        self.active_constraints = None
+
+    def fit(self, x_init: np.ndarray, data: Optional[Data] = None,
+            options: Optional[Dict[str, Any]] = None, **kwargs):
+        model = self.model
+        if not self.lazy_constraints or model.C is None or not np.any(model.C != 0):
+            return super().fit(x_init=x_init, data=data, options=options, **kwargs)
+
+        C, c_lb, c_ub = model.C, np.asarray(model.c_lb), np.asarray(model.c_ub)
+        active = np.zeros(len(C), dtype=bool)
+        x = x_init
+        try:
+            for _ in range(self.max_cuts):
+                if np.any(active):
+                    model.C, model.c_lb, model.c_ub = C[active], c_lb[active], c_ub[active]
+                else:
+                    model.C, model.c_lb, model.c_ub = None, None, None
+                super().fit(x_init=x, data=data, options=options, **kwargs)
+                x = self.x_opt
+                value = C.dot(x)
+                violated = ~active & (
+                    (value < c_lb - self.constraint_tol) | (value > c_ub + self.constraint_tol)
+                )
+                if not np.any(violated):
+                    break
+                active |= violated
+            else:
+                # out of rounds with constraints still violated, so impose all of them
+                model.C, model.c_lb, model.c_ub = C, c_lb, c_ub
+                super().fit(x_init=x, data=data, options=options, **kwargs)
+                active[:] = True
+        finally:
+            model.C, model.c_lb, model.c_ub = C, c_lb, c_ub
+        self.active_constraints = active
+
+    def fit_state(self) -> Dict[str, Any]:
+        """
+        The results of the last fit, which :code:`Base.restore()` can restore.
+        """
+        return {
+            'x_opt': self.x_opt,
+            'fun_val_opt': self.fun_val_opt,
+            'active_constraints': self.active_constraints
+        }
+
+    def restore(self, state: Dict[str, Any], data: Optional[Data] = None):
+        """
+        Restores the results of a fit from :code:`Base.fit_state()` without refitting.
+
+        Parameters
+        ----------
+        state
+            Results of the fit.
+        data
+            Data that the model was fit to. Not needed for a single model.
+        """
+        self.x_opt = state['x_opt']
+        self.fun_val_opt = state['fun_val_opt']
+        self.active_constraints = state['active_constraints']
 
     def attach_lr_specs(self, lr_specs: LRSpecs):
         self.lr_specs = lr_specs
@@ -26,18 +111,102 @@ class Base(Solver):
         if new_df is None:
             return self.model.forward(x)
         else:
-            self.lr_specs.configure_new_data(df=new_df)
-            return self.model.forward(
+            unique_df, inverse = self.lr_specs.deduplicate(df=new_df)
+            predictions = self.model.forward(
                 x,
-                mat=self.lr_specs.parameter_set.design_matrix_fe
+                mat=self.lr_specs.configure_new_data(df=unique_df)
             )
+            return predictions if inverse is None else predictions[inverse]
 
+    def predict_draws(self, xs: List[np.ndarray], new_df: pd.DataFrame) -> np.ndarray:
+        """
+        Makes predictions for many parameter vectors at once, building
+        the design matrix for the new data frame only once. Predictions are
+        only made for the unique rows of the new data frame.
 
-class ScipySolver(Base, ScipyOpt):
+        Parameters
+        ----------
+        xs
+            List of parameter vectors.
+        new_df
+            Data frame to make predictions for.
+
+        Returns
+        -------
+        A (len(xs), len(new_df)) array of predictions.
+        """
+        unique_df, inverse = self.lr_specs.deduplicate(df=new_df)
+        draws = self.model.forward(
+            np.vstack(xs).T,
+            mat=self.lr_specs.configure_new_data(df=unique_df)
+        ).T
+        return draws if inverse is None else draws[:, inverse]
+
+
+class ScipyOpt(Solver):
+    """
+    Fits a model with :code:`scipy.optimize.minimize`, like the scipy solver
+    in anml, which can't be imported without the IPOPT bindings. scipy.optimize
+    is only imported when a model is fit.
+    """
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+        self.success = None
+        self.status = None
+        self.hess_inv = None
+
+    def fit(self, x_init: np.ndarray, data: Optional[Data] = None,
+            options: Optional[Dict[str, Any]] = None):
+        from scipy.optimize import minimize, Bounds, LinearConstraint
+
+        self.assert_model_defined()
+        bounds = None
+        if has_bounds(self.model):
+            bounds = Bounds(self.model.lb, self.model.ub)
+        constraints = None
+        if has_constraints(self.model):
+            constraints = LinearConstraint(self.model.C, self.model.c_lb, self.model.c_ub)
+
+        if 'method' in options:
+            method = options['method']
+        elif constraints is not None:
+            method = 'trust-constr'
+        else:
+            method = None
+
+        result = minimize(
+            fun=lambda x: self.model.objective(x, data),
+            x0=x_init,
+            jac=lambda x: self.model.gradient(x, data),
+            bounds=bounds,
+            method=method,
+            options=options['solver_options'],
+            constraints=constraints,
+        )
+        self.success = result.success
+        self.x_opt = result.x
+        self.fun_val_opt = result.fun
+        self.status = result.message
+        self.hess_inv = getattr(result, 'hess_inv', None)
 
 
-class IpoptSolver(Base, IPOPTSolver):
+class ScipySolver(Base, ScipyOpt):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
+
+
+def __getattr__(name: str):
+    # The IPOPT solver is only created on first use, so that
+    # the IPOPT bindings aren't imported unless they are needed.
+    if name == 'IpoptSolver':
+        from anml.solvers.base import IPOPTSolver
+
+        class IpoptSolver(Base, IPOPTSolver):
+            def __init__(self, **kwargs):
+                super().__init__(**kwargs)
+
+        IpoptSolver.__module__ = __name__
+        IpoptSolver.__qualname__ = 'IpoptSolver'
+        globals()['IpoptSolver'] = IpoptSolver
+        return IpoptSolver
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
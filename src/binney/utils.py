@@ -1,3 +1,4 @@
+from typing import Optional
 import numpy as np
 
 
@@ -5,5 +6,41 @@ def expit(x):
     return np.exp(x) / (1 + np.exp(x))
 
 
+def identity(x):
+    return x
+
+
 def logit(x):
     return np.log(x / (1 - x))
+
+
+def binomial_deviance(obs: np.ndarray, total: np.ndarray, p: np.ndarray,
+                      weights: Optional[np.ndarray] = None) -> float:
+    """
+    Binomial deviance of predicted probabilities p for observed
+    successes obs out of total trials.
+
+    Parameters
+    ----------
+    obs
+        Observed number of successes.
+    total
+        Number of trials.
+    p
+        Predicted probabilities.
+    weights
+        Optional observation weights.
+
+    Returns
+    -------
+    The deviance.
+    """
+    obs = np.asarray(obs, dtype=float)
+    total = np.asarray(total, dtype=float)
+    fail = total - obs
+    with np.errstate(divide='ignore', invalid='ignore'):
+        dev = np.where(obs > 0, obs * np.log(obs / (total * p)), 0.) + \
+            np.where(fail > 0, fail * np.log(fail / (total * (1 - p))), 0.)
+    if weights is not None:
+        dev = weights * dev
+    return 2 * np.sum(dev)
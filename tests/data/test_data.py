@@ -1,5 +1,9 @@
+import pickle
+
 import numpy as np
-from binney.data.data import LRSpecs, BinomDataSpecs
+import pandas as pd
+import pytest
+from binney.data.data import LRSpecs, BinomDataSpecs, BinomDataError, load_columns, unique_rows
 
 
 def test_binom_data_specs():
@@ -11,6 +15,7 @@ def test_binom_data_specs():
     assert specs.col_obs == 'success'
     assert specs.col_obs_se is None
     assert specs.col_groups is None
+    assert specs.col_weight is None
 
 
 def test_lr_specs(df, n):
@@ -20,7 +25,7 @@ def test_lr_specs(df, n):
         covariates=['x1']
     )
     specs.configure_data(df)
-    dd = specs.data._param_set[0].design_matrix_fe
+    dd = specs.design_matrix
     assert dd.shape == (n, 2)
     np.testing.assert_array_equal(
         dd[:, 0],
@@ -41,5 +46,229 @@ def test_lr_specs_with_prior(df, n):
         coefficient_prior_var=1.
     )
     specs.configure_data(df)
-    dd = specs.data._param_set[0].design_matrix_fe
+    dd = specs.design_matrix
+
+
+def test_lr_specs_columns(group_data_2):
+    specs = LRSpecs(
+        col_success='success',
+        col_total='total',
+        col_group='g',
+        covariates=['x1'],
+        splines={'x2': {'knots_num': 3, 'degree': 3, 'convex': True}}
+    )
+    assert specs.columns == ['success', 'total', 'g', 'x1', 'x2']
+    compact_df = specs.compact(group_data_2)
+    assert list(compact_df.columns) == specs.columns
+    assert np.shares_memory(compact_df['x1'].to_numpy(), group_data_2['x1'].to_numpy())
+    assert not compact_df['x1'].to_numpy().flags.writeable
+
+
+def test_lr_specs_copy_specs(df):
+    specs = LRSpecs(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        splines={'x1': {'knots_num': 3, 'degree': 3, 'convex': True}}
+    )
+    specs.configure_data(df)
+    new_specs = specs.copy_specs()
+    assert new_specs.splines == {'x1': {'knots_num': 3, 'degree': 3, 'convex': True}}
+    assert new_specs.data.data == dict()
+    new_specs.configure_data(df)
+    np.testing.assert_array_equal(
+        new_specs.design_matrix,
+        specs.design_matrix
+    )
+
+
+def test_lr_specs_update_priors(df):
+    specs = LRSpecs(
+        col_success='success',
+        col_total='total',
+        covariates=['x1']
+    )
+    assert (specs.prior_std == np.inf).all()
+    specs.configure_data(df)
+    design_matrix = specs.design_matrix
+    constraints = specs.constraints
+    variables = specs.parameter_set.variables
+    specs.update_priors(coefficient_priors=[1., 2.], coefficient_prior_var=4.)
+    np.testing.assert_array_equal(specs.prior_mean, [1., 2.])
+    np.testing.assert_array_equal(specs.prior_std, [2., 2.])
+    assert specs.design_matrix is design_matrix
+    assert specs.constraints is constraints
+    assert specs.parameter_set.variables is variables
+
+
+def test_col_group_levels(df):
+    df = df.assign(r=0, g=1)
+    lr_specs = LRSpecs(
+        col_success='success',
+        col_total='total',
+        col_group=['r', 'g']
+    )
+    assert lr_specs.data_specs.col_groups == ['r', 'g']
+    assert lr_specs.columns == ['success', 'total', 'r', 'g']
+    assert lr_specs.copy_specs().data_specs.col_groups == ['r', 'g']
+
+
+def test_constraint_grid_size():
+    splines = {
+        'x1': {
+            'knots_type': 'domain',
+            'knots_num': 3,
+            'degree': 3,
+            'increasing': True,
+            'constraint_grid_size': 50
+        }
+    }
+    lr_specs = LRSpecs(col_success='success', col_total='total', splines=splines)
+    spline = lr_specs.parameter_set.variables[1]
+    assert spline.derivative_constr[0].grid_size == 50
+    assert spline.derivative_constr[0].y_bounds == [0.0, np.inf]
+    assert 'constraint_grid_size' in splines['x1']
+
+
+def test_lr_specs_lazy(df, new_df):
+    specs = LRSpecs(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        splines={'x1': {'knots_num': 3, 'degree': 3, 'convex': True}}
+    )
+    specs.configure_data(df)
+    assert specs._design_matrix is None
+    assert specs._constraints is None
+    design_matrix = specs.design_matrix
+    assert specs._constraints is None
+    assert specs.design_matrix is design_matrix
+    assert specs.data._param_set[0].design_matrix_fe is design_matrix
+
+    new_design_matrix = specs.configure_new_data(new_df)
+    assert new_design_matrix.shape == (len(new_df), design_matrix.shape[1])
+    assert specs._constraints is None
+
+    specs.configure_data(df)
+    assert specs.design_matrix is design_matrix
+    specs.configure_data(df.copy())
+    assert specs.design_matrix is not design_matrix
+    np.testing.assert_array_equal(specs.design_matrix, design_matrix)
+
+
+def test_lr_specs_new_data_subset(df):
+    specs = LRSpecs(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        splines={'x1': {'knots_num': 3, 'degree': 3}}
+    )
+    specs.configure_data(df)
+    design_matrix = specs.design_matrix
+    np.testing.assert_array_almost_equal(
+        specs.configure_new_data(df.iloc[:50]),
+        design_matrix[:50]
+    )
+    order = np.random.default_rng(0).permutation(len(df))
+    np.testing.assert_array_almost_equal(
+        specs.configure_new_data(df.iloc[order]),
+        design_matrix[order]
+    )
+    assert specs.design_matrix is design_matrix
+
+
+def test_lr_specs_pickle(df):
+    specs = LRSpecs(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        splines={'x1': {'knots_num': 3, 'degree': 3}}
+    )
+    specs.configure_data(df)
+    loaded = pickle.loads(pickle.dumps(specs))
+    np.testing.assert_array_equal(loaded.design_matrix, specs.design_matrix)
+    np.testing.assert_array_almost_equal(
+        loaded.configure_new_data(df.iloc[:10]), specs.configure_new_data(df.iloc[:10])
+    )
+
+
+def test_load_columns_arrays(df, tmp_path):
+    np.save(tmp_path / 'x1.npy', df['x1'].to_numpy())
+    x1 = np.load(tmp_path / 'x1.npy', mmap_mode='r')
+    arrays = {
+        'success': df['success'].to_numpy(),
+        'total': df['total'].to_numpy(),
+        'x1': x1
+    }
+    loaded = load_columns(arrays, columns=['success', 'x1'])
+    assert list(loaded.columns) == ['success', 'x1']
+    assert np.shares_memory(loaded['x1'].to_numpy(), x1)
+    assert not loaded['success'].to_numpy().flags.writeable
+    with pytest.raises(BinomDataError):
+        load_columns(arrays, columns=['x2'])
+    with pytest.raises(BinomDataError):
+        load_columns({'success': np.ones(3), 'total': np.ones(4)})
+
+
+def test_load_columns_parquet(df, tmp_path):
+    pa = pytest.importorskip('pyarrow')
+    pq = pytest.importorskip('pyarrow.parquet')
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    loaded = load_columns(table, columns=['success', 'x1'])
+    np.testing.assert_array_equal(loaded['x1'], df['x1'])
+
+    pq.write_table(table, tmp_path / 'df.parquet')
+    specs = LRSpecs(col_success='success', col_total='total', covariates=['x1'])
+    compact_df = specs.compact(str(tmp_path / 'df.parquet'))
+    assert list(compact_df.columns) == ['success', 'total', 'x1']
+    np.testing.assert_array_equal(compact_df['total'], df['total'])
+    with pytest.raises(BinomDataError):
+        load_columns(tmp_path / 'df.parquet', columns=['x2'])
+
+
+def test_unique_rows():
+    df = pd.DataFrame({
+        'x1': [1., 2., 1., np.nan, 2., np.nan],
+        'g': [0, 0, 0, 1, 1, 1],
+        'y': np.arange(6)
+    })
+    unique_df, inverse = unique_rows(df, columns=['x1', 'g'])
+    assert list(unique_df['y']) == [0, 1, 3, 4]
+    np.testing.assert_array_equal(inverse, [0, 1, 0, 2, 3, 2])
+    np.testing.assert_array_equal(unique_df['g'].to_numpy()[inverse], df['g'])
+    same_df, inverse = unique_rows(df, columns=['y'])
+    assert same_df is df
+    assert inverse is None
+
+
+def test_lr_specs_deduplicate(df):
+    specs = LRSpecs(col_success='success', col_total='total', covariates=['x1'])
+    assert specs.prediction_columns == ['x1']
+    new_df = pd.concat([df, df], ignore_index=True)
+    unique_df, inverse = specs.deduplicate(new_df)
+    assert len(unique_df) == len(df)
+    np.testing.assert_array_equal(unique_df['x1'].to_numpy()[inverse], new_df['x1'])
+
+
+def test_lr_specs_aggregate(group_data_2):
+    specs = LRSpecs(
+        col_success='success',
+        col_total='total',
+        col_group='g',
+        covariates=['x1'],
+        splines={'x2': {'knots_type': 'domain', 'knots_num': 3, 'degree': 3, 'bins': 20}}
+    )
+    assert specs.binned_splines == {'x2': 20}
+    df = group_data_2.assign(x1=np.round(group_data_2['x1']))
+    aggregated = specs.aggregate(df)
+    assert list(aggregated.columns) == specs.columns
+    assert len(aggregated) < len(df)
+    assert aggregated['x2'].nunique() <= 20
+    assert aggregated['x2'].min() == df['x2'].min()
+    assert aggregated['x2'].max() == df['x2'].max()
+    assert aggregated['success'].sum() == df['success'].sum()
+    assert aggregated['total'].sum() == df['total'].sum()
+    assert aggregated['total'].dtype == df['total'].dtype
 
+    with pytest.raises(BinomDataError):
+        LRSpecs(col_success='success', col_total='total', splines={'x2': {'bins': 20}})
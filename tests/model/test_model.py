@@ -1,4 +1,8 @@
+import tracemalloc
+from copy import copy
+
 import numpy as np
+import pandas as pd
 
 from binney.data.data import LRSpecs
 from binney.model.model import BinomialModel
@@ -31,3 +35,173 @@ def test_lr_binom_one_cov(df):
     grad = model.gradient(x=np.array([0, 2]), data=specs.data)
     assert isinstance(objective, float)
     assert grad.shape == (2,)
+
+
+def test_lr_binom_constraints(df):
+    specs = LRSpecs(
+        col_success='success',
+        col_total='total',
+        splines={'x1': {'knots_num': 3, 'degree': 3}}
+    )
+    specs.configure_data(df)
+    model = BinomialModel()
+    model.attach_specs(lr_specs=specs)
+    assert model.C is None
+    assert specs._constraints is None
+
+    specs = LRSpecs(
+        col_success='success',
+        col_total='total',
+        splines={'x1': {'knots_num': 3, 'degree': 3, 'convex': True}}
+    )
+    specs.configure_data(df)
+    model.detach_specs()
+    model.attach_specs(lr_specs=specs)
+    assert model.C is specs.constraints[0]
+
+
+def test_lr_binom_weights(df):
+    weighted_df = df.copy()
+    weighted_df['w'] = 2.
+    specs = LRSpecs(
+        col_success='success',
+        col_total='total',
+        col_weight='w',
+        covariates=['x1']
+    )
+    specs.configure_data(weighted_df)
+    model = BinomialModel()
+    model.attach_specs(lr_specs=specs)
+
+    stacked_df = pd.concat([df, df])
+    stacked_specs = LRSpecs(
+        col_success='success',
+        col_total='total',
+        covariates=['x1']
+    )
+    stacked_specs.configure_data(stacked_df)
+    stacked_model = BinomialModel()
+    stacked_model.attach_specs(lr_specs=stacked_specs)
+
+    x = np.array([0.5, 1.5])
+    np.testing.assert_almost_equal(
+        model.objective(x=x, data=specs.data),
+        stacked_model.objective(x=x, data=stacked_specs.data)
+    )
+    np.testing.assert_array_almost_equal(
+        model.gradient(x=x, data=specs.data),
+        stacked_model.gradient(x=x, data=stacked_specs.data)
+    )
+    np.testing.assert_array_almost_equal(
+        model.hessian(x=x, data=specs.data),
+        stacked_model.hessian(x=x, data=stacked_specs.data)
+    )
+
+
+def test_lr_binom_hessian(df):
+    specs = LRSpecs(
+        col_success='success',
+        col_total='total',
+        covariates=['x1']
+    )
+    specs.configure_data(df)
+    model = BinomialModel()
+    model.attach_specs(lr_specs=specs)
+    x = np.array([0.5, 1.5])
+    hessian = model.hessian(x=x, data=specs.data)
+    assert hessian.shape == (2, 2)
+    eps = 1e-6
+    for i in range(2):
+        step = np.zeros(2)
+        step[i] = eps
+        fd = (model.gradient(x=x + step, data=specs.data) -
+              model.gradient(x=x - step, data=specs.data)) / (2 * eps)
+        np.testing.assert_allclose(hessian[:, i], fd, rtol=1e-4)
+
+
+def test_lr_binom_threads(df):
+    specs = LRSpecs(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        splines={'x1': {'knots_num': 3, 'degree': 3}}
+    )
+    specs.configure_data(df)
+    model = BinomialModel()
+    model.attach_specs(lr_specs=specs)
+    threaded_model = BinomialModel(n_threads=3, block_size=300)
+    threaded_model.attach_specs(lr_specs=specs)
+
+    x = np.linspace(-1, 1, specs.design_matrix.shape[1])
+    np.testing.assert_almost_equal(
+        threaded_model.objective(x=x, data=specs.data),
+        model.objective(x=x, data=specs.data)
+    )
+    np.testing.assert_array_almost_equal(
+        threaded_model.gradient(x=x, data=specs.data),
+        model.gradient(x=x, data=specs.data)
+    )
+    np.testing.assert_array_almost_equal(
+        threaded_model.hessian(x=x, data=specs.data),
+        model.hessian(x=x, data=specs.data)
+    )
+
+    copied_model = copy(threaded_model)
+    assert copied_model._executor is threaded_model._executor
+    np.testing.assert_almost_equal(
+        copied_model.objective(x=x, data=specs.data),
+        model.objective(x=x, data=specs.data)
+    )
+
+
+def test_lr_binom_allocations():
+    # large enough that one temporary with a value per row
+    # dwarfs the small allocations of numpy and the interpreter
+    n = 200000
+    rng = np.random.default_rng(0)
+    df = pd.DataFrame({
+        'success': rng.binomial(n=10, p=0.5, size=n),
+        'total': np.repeat(10, n),
+        'x1': rng.normal(size=n)
+    })
+    specs = LRSpecs(
+        col_success='success',
+        col_total='total',
+        covariates=['x1']
+    )
+    specs.configure_data(df)
+    model = BinomialModel()
+    model.attach_specs(lr_specs=specs)
+    x = np.array([0.5, 1.5])
+    # the first evaluation allocates the work buffers
+    model.objective(x=x, data=specs.data)
+    model.gradient(x=x, data=specs.data)
+    model.hessian(x=x, data=specs.data)
+
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        for _ in range(10):
+            model.objective(x=x, data=specs.data)
+            model.gradient(x=x, data=specs.data)
+            model.hessian(x=x, data=specs.data)
+        end, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    # less than one temporary with a value per row
+    assert peak - start < x.itemsize * n
+    assert end - start < x.itemsize * n // 100
+
+
+def test_lr_binom_buffers(df):
+    specs = LRSpecs(
+        col_success='success',
+        col_total='total',
+        covariates=['x1']
+    )
+    specs.configure_data(df)
+    model = BinomialModel(block_size=10 * len(df))
+    model.attach_specs(lr_specs=specs)
+    model.hessian(x=np.array([0.5, 1.5]), data=specs.data)
+    # sized for the data rather than for a whole block
+    assert model._local.buffers[2].shape == (len(df), 2)
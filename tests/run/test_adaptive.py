@@ -0,0 +1,40 @@
+import numpy as np
+
+from binney.run.adaptive import flatten_parameters, quantile_mc_error
+from binney.run.run import BinneyRun
+
+
+def test_flatten_parameters():
+    parameters = [np.array([1., 2.]), np.array([3., 4.])]
+    np.testing.assert_array_equal(flatten_parameters(parameters), [[1., 2.], [3., 4.]])
+    parameters = [{1: [1., 2.], 0: [3., 4.]}, {0: [5., 6.], 1: [7., 8.]}]
+    np.testing.assert_array_equal(
+        flatten_parameters(parameters), [[3., 4., 1., 2.], [5., 6., 7., 8.]]
+    )
+
+
+def test_quantile_mc_error():
+    rng = np.random.default_rng(0)
+    draws = rng.standard_normal(size=(10000, 2))
+    errors = quantile_mc_error(draws=draws, quantiles=[0.5])
+    # Asymptotic standard error of the median of a standard normal
+    expected = np.sqrt(0.25 / 10000) / (1 / np.sqrt(2 * np.pi))
+    np.testing.assert_allclose(errors, expected, rtol=0.2)
+    assert np.isinf(quantile_mc_error(draws=draws[:10], quantiles=[0.025])).all()
+
+
+def test_adaptive_bootstrap(df):
+    b_run = BinneyRun(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        df=df,
+        solver_method='scipy',
+        data_type='binomial'
+    )
+    b_run.fit()
+    b_run.make_uncertainty(n_boots=400, seed=0, batched=True, tol=0.01,
+                           quantiles=[0.5], batch_size=50)
+    assert len(b_run.bootstrap.parameters) < 400
+    assert len(b_run.bootstrap.parameters) % 50 == 0
+    assert b_run.mc_error <= 0.01
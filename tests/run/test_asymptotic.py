@@ -0,0 +1,63 @@
+from typing import Dict
+
+import numpy as np
+import pytest
+
+from binney.run.run import BinneyRun, RunException
+from binney.run.asymptotic import AsymptoticUncertainty
+
+
+def test_draw():
+    x = np.array([1., 2.])
+    hessian = np.array([[4., 1.], [1., 2.]])
+    draws = AsymptoticUncertainty._draw(
+        x=x, hessian=hessian, n_draws=100000, rng=np.random.default_rng(0)
+    )
+    assert draws.shape == (100000, 2)
+    np.testing.assert_array_almost_equal(draws.mean(axis=0), x, decimal=2)
+    np.testing.assert_array_almost_equal(np.cov(draws.T), np.linalg.inv(hessian), decimal=2)
+
+
+def test_asymptotic_run(df, n):
+    b_run = BinneyRun(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        df=df,
+        solver_method='scipy',
+        data_type='binomial',
+        uncertainty='asymptotic'
+    )
+    with pytest.raises(RunException):
+        b_run.make_uncertainty(n_boots=10)
+    b_run.fit()
+    b_run.make_uncertainty(n_boots=500, seed=0)
+    parameters = np.vstack(b_run.bootstrap.parameters)
+    assert parameters.shape == (500, 2)
+    np.testing.assert_array_almost_equal(parameters.mean(axis=0), b_run.params_opt, decimal=2)
+    uis = np.quantile(parameters, q=[0.025, 0.975], axis=0)
+    assert all(b_run.params_opt > uis[0, :])
+    assert all(b_run.params_opt < uis[1, :])
+    draws = b_run.predict_draws(df=df)
+    assert draws.shape == (500, n)
+
+
+def test_asymptotic_hierarchy(group_data, n):
+    b_run = BinneyRun(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        df=group_data,
+        col_group='g',
+        solver_method='scipy',
+        data_type='binomial',
+        uncertainty='asymptotic'
+    )
+    b_run.fit()
+    b_run.make_uncertainty(n_boots=20, seed=0)
+    assert len(b_run.bootstrap.parameters) == 20
+    for param in b_run.bootstrap.parameters:
+        assert isinstance(param, Dict)
+        assert param.keys() == b_run.params_opt.keys()
+    draws = b_run.predict_draws(df=group_data)
+    assert draws.shape == (20, n)
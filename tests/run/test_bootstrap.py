@@ -2,7 +2,10 @@ import numpy as np
 import pytest
 from binney.model.model import BinomialModel
 from binney.run.run import BinneyRun
-from binney.run.bootstrap import BinomialBootstrap, BernoulliBootstrap
+from binney.run.bootstrap import BinomialBootstrap, BernoulliBootstrap, PoissonBootstrap
+from binney.run.bootstrap import BootstrapError
+from binney.run.weights import poisson_weights, poisson_weight_blocks, dirichlet_weights
+from binney.run.weights import case_control_weights
 
 from anml.solvers.interface import Solver
 
@@ -29,6 +32,17 @@ def test_binomial_sampling(df, seed):
     assert not (sample['success'].values == df['success'].values).all()
 
 
+def test_binomial_sampling_float_total(df):
+    mod = BinomialModel()
+    sol = Solver()
+    boot = BinomialBootstrap(model=mod, solver=sol, df=df)
+    float_df = df.assign(total=df['total'] * 1.)
+    sample = boot._sample(df=float_df, col_obs='success', col_total='total')
+    assert len(sample) == len(df)
+    with pytest.raises(BootstrapError):
+        boot._sample(df=df.assign(total=df['total'] + 0.5), col_obs='success', col_total='total')
+
+
 def test_bernoulli_sampling(bernoulli_df):
     mod = BinomialModel()
     sol = Solver()
@@ -37,6 +51,183 @@ def test_bernoulli_sampling(bernoulli_df):
     assert len(sample) == len(bernoulli_df)
 
 
+def test_poisson_weights():
+    np.random.seed(0)
+    weights = poisson_weights(n_boots=10, n_obs=1000, block_size=300)
+    assert weights.shape == (10, 1000)
+    assert (weights >= 0).all()
+    np.testing.assert_almost_equal(weights.mean(), 1., decimal=1)
+    blocks = list(poisson_weight_blocks(n_boots=10, n_obs=1000, block_size=300))
+    assert [b.shape[1] for b in blocks] == [300, 300, 300, 100]
+
+
+def test_dirichlet_weights():
+    np.random.seed(0)
+    weights = dirichlet_weights(n_boots=10, n_obs=1000)
+    assert weights.shape == (10, 1000)
+    assert (weights > 0).all()
+    np.testing.assert_array_almost_equal(weights.sum(axis=1), np.repeat(1000., 10))
+
+
+def test_poisson_sampling(df):
+    mod = BinomialModel()
+    sol = Solver()
+    boot = PoissonBootstrap(model=mod, solver=sol, df=df)
+    weights = boot._make_weights(n_boots=1, n_obs=len(df))[0]
+    sample = boot._sample(df=df, col_obs='success', col_total='total', weights=weights)
+    np.testing.assert_array_equal(sample['total'], df['total'] * weights)
+    np.testing.assert_array_equal(sample['success'], df['success'] * weights)
+    np.testing.assert_array_equal(sample['x1'], df['x1'])
+
+
+@pytest.mark.parametrize("uncertainty", ['poisson', 'bayesian'])
+def test_weighted_bootstrap_run(df, n, uncertainty):
+    np.random.seed(99)
+    b_run = BinneyRun(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        df=df,
+        solver_method='scipy',
+        data_type='binomial',
+        uncertainty=uncertainty
+    )
+    b_run.fit()
+    b_run.make_uncertainty(n_boots=15)
+    assert np.vstack(b_run.bootstrap.parameters).shape == (15, 2)
+    np.testing.assert_array_almost_equal(
+        np.vstack(b_run.bootstrap.parameters).mean(axis=0),
+        b_run.params_opt,
+        decimal=1
+    )
+    draws = b_run.predict_draws(df=df)
+    assert draws.shape == (15, n)
+
+
+def test_replicate_rng(df):
+    mod = BinomialModel()
+    sol = Solver()
+    boot = BinomialBootstrap(model=mod, solver=sol, df=df, seed=123)
+    children = np.random.SeedSequence(123).spawn(4)
+    for replicate in [3, 0, 2, 1]:
+        np.testing.assert_array_equal(
+            boot.replicate_rng(replicate).random(5),
+            np.random.default_rng(children[replicate]).random(5)
+        )
+    sample_1 = boot._sample(df=df, col_obs='success', col_total='total', rng=boot.replicate_rng(7))
+    sample_2 = boot._sample(df=df, col_obs='success', col_total='total', rng=boot.replicate_rng(7))
+    np.testing.assert_array_equal(sample_1['success'], sample_2['success'])
+
+
+def test_seeded_bernoulli_sampling(bernoulli_df):
+    mod = BinomialModel()
+    sol = Solver()
+    boot = BernoulliBootstrap(model=mod, solver=sol, df=bernoulli_df, seed=np.random.default_rng(0))
+    sample_1 = boot._sample(df=bernoulli_df, rng=boot.replicate_rng(1))
+    sample_2 = boot._sample(df=bernoulli_df, rng=boot.replicate_rng(1))
+    sample_3 = boot._sample(df=bernoulli_df, rng=boot.replicate_rng(2))
+    np.testing.assert_array_equal(sample_1.index, sample_2.index)
+    assert not (sample_1.index == sample_3.index).all()
+
+
+def test_seeded_weights(df):
+    mod = BinomialModel()
+    sol = Solver()
+    boot = PoissonBootstrap(model=mod, solver=sol, df=df, seed=5)
+    weights = boot.replicate_weights(n_boots=3)
+    assert weights.shape == (3, len(df))
+    np.testing.assert_array_equal(
+        weights[2],
+        boot._make_weights(n_boots=1, n_obs=len(df), rng=boot.replicate_rng(2))[0]
+    )
+
+
+def test_bootstrap_run_seed(df):
+    parameters = []
+    for i in range(2):
+        b_run = BinneyRun(
+            col_success='success',
+            col_total='total',
+            covariates=['x1'],
+            df=df,
+            solver_method='scipy',
+            data_type='binomial'
+        )
+        b_run.fit()
+        b_run.make_uncertainty(n_boots=3, seed=11)
+        parameters.append(np.vstack(b_run.bootstrap.parameters))
+    np.testing.assert_array_equal(parameters[0], parameters[1])
+
+
+@pytest.mark.parametrize("uncertainty", ['bootstrap', 'poisson'])
+def test_batched_bootstrap_run(df, uncertainty):
+    parameters = []
+    for batched in [False, True]:
+        b_run = BinneyRun(
+            col_success='success',
+            col_total='total',
+            covariates=['x1'],
+            df=df,
+            solver_method='ipopt',
+            data_type='binomial',
+            uncertainty=uncertainty
+        )
+        b_run.fit()
+        b_run.make_uncertainty(n_boots=5, seed=3, batched=batched)
+        parameters.append(np.vstack(b_run.bootstrap.parameters))
+    np.testing.assert_array_almost_equal(parameters[0], parameters[1], decimal=4)
+
+
+def test_batched_bootstrap_float_total(df):
+    float_df = df.assign(total=df['total'].astype(float))
+    parameters = []
+    for batched in [False, True]:
+        b_run = BinneyRun(
+            col_success='success',
+            col_total='total',
+            covariates=['x1'],
+            df=float_df,
+            solver_method='ipopt',
+            data_type='binomial'
+        )
+        b_run.fit()
+        b_run.make_uncertainty(n_boots=3, seed=3, batched=batched)
+        parameters.append(np.vstack(b_run.bootstrap.parameters))
+    np.testing.assert_array_almost_equal(parameters[0], parameters[1], decimal=4)
+
+    b_run = BinneyRun(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        df=float_df.assign(total=float_df['total'] + 0.5),
+        solver_method='ipopt',
+        data_type='binomial'
+    )
+    b_run.fit()
+    with pytest.raises(BootstrapError):
+        b_run.make_uncertainty(n_boots=3, seed=3, batched=True)
+
+
+def test_summarize_draws(df):
+    b_run = BinneyRun(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        df=df,
+        solver_method='scipy',
+        data_type='binomial'
+    )
+    b_run.fit()
+    b_run.make_uncertainty(n_boots=10, seed=0, batched=True)
+    draws = b_run.predict_draws(df=df)
+    summary = b_run.summarize_draws(df=df, quantiles=[0.025, 0.5], chunk_size=300)
+    assert list(summary.columns) == ['mean', 'std', 'q0.025', 'q0.5']
+    assert summary.index.equals(df.index)
+    np.testing.assert_array_almost_equal(summary['mean'], draws.mean(axis=0))
+    np.testing.assert_array_almost_equal(summary['std'], draws.std(axis=0))
+    np.testing.assert_array_almost_equal(summary['q0.5'], np.quantile(draws, q=0.5, axis=0))
+
+
 def test_bootstrap_run(df, n):
     np.random.seed(99)
     b_run = BinneyRun(
@@ -95,3 +286,12 @@ def test_bernoulli_run(bernoulli_df, n):
     draws = b_run.predict_draws(df=bernoulli_df)
     assert draws.shape == (15, n)
     assert all(draws.var(axis=1) > 0)
+
+
+def test_case_control_weights():
+    obs = np.array([1, 0, 0, 0, 1, 0, 0, 0] * 1000)
+    index, weights = case_control_weights(obs=obs, fraction=0.25, rng=np.random.default_rng(0))
+    assert np.all(np.isin(np.flatnonzero(obs), index))
+    np.testing.assert_array_equal(weights[obs[index] == 1], 1.)
+    np.testing.assert_array_equal(weights[obs[index] == 0], 4.)
+    assert abs(weights.sum() - len(obs)) < 0.05 * len(obs)
@@ -0,0 +1,74 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from binney.run.cache import FitCache, hash_frame
+from binney.run.run import BinneyRun
+
+
+def test_hash_frame(df):
+    assert hash_frame(df) == hash_frame(df.copy())
+    assert hash_frame(df) != hash_frame(df.assign(x1=df['x1'] + 1e-12))
+    assert hash_frame(df) == hash_frame(df.set_index('x1', drop=False))
+    strings = pd.DataFrame({'g': ['a', 'b']})
+    assert hash_frame(strings) != hash_frame(pd.DataFrame({'g': ['a', 'c']}))
+
+
+def test_fit_cache_lru(tmp_path):
+    cache = FitCache(path=tmp_path)
+    cache.put('a', np.zeros(100))
+    cache.max_bytes = 3 * (tmp_path / 'a.pkl').stat().st_size
+    for i, key in enumerate(['a', 'b', 'c']):
+        cache.put(key, np.zeros(100))
+        os.utime(tmp_path / f"{key}.pkl", (i, i))
+    assert cache.get('a') is not None
+    cache.put('d', np.zeros(100))
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('e') is None
+
+
+def make_run(df, cache_dir, **kwargs):
+    return BinneyRun(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        df=df,
+        solver_method='scipy',
+        data_type='binomial',
+        cache_dir=cache_dir,
+        **kwargs
+    )
+
+
+def test_run_cache(df, tmp_path, monkeypatch):
+    b_run = make_run(df, tmp_path)
+    b_run.fit()
+    b_run.make_uncertainty(n_boots=5, seed=0)
+
+    cached_run = make_run(df.copy(), tmp_path)
+    monkeypatch.setattr(BinneyRun, '_fit', lambda *args, **kwargs: pytest.fail("Refit"))
+    cached_run.fit()
+    cached_run.make_uncertainty(n_boots=5, seed=0)
+    np.testing.assert_array_equal(cached_run.params_opt, b_run.params_opt)
+    np.testing.assert_array_equal(cached_run.predict(new_df=df), b_run.predict(new_df=df))
+    np.testing.assert_array_equal(
+        np.vstack(cached_run.bootstrap.parameters), np.vstack(b_run.bootstrap.parameters)
+    )
+
+    with pytest.raises(pytest.fail.Exception):
+        make_run(df.assign(success=df['total'] - df['success']), tmp_path).fit()
+
+
+def test_hierarchy_run_cache(group_data, tmp_path):
+    kwargs = dict(col_group='g', coefficient_prior_var=5.)
+    b_run = make_run(group_data, tmp_path, **kwargs)
+    b_run.fit()
+    cached_run = make_run(group_data, tmp_path, **kwargs)
+    cached_run.fit()
+    assert cached_run.params_opt == b_run.params_opt
+    np.testing.assert_array_equal(
+        cached_run.predict(new_df=group_data), b_run.predict(new_df=group_data)
+    )
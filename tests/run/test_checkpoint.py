@@ -0,0 +1,98 @@
+import numpy as np
+import pytest
+
+from binney.run.checkpoint import CheckpointStore, CheckpointError
+from binney.run.run import BinneyRun
+
+
+def test_checkpoint_store(tmp_path):
+    store = CheckpointStore(path=tmp_path, seed_sequence=np.random.SeedSequence(1))
+    assert store.load() == dict()
+    store.write(replicates=[0, 1], parameters=[np.array([1., 2.]), np.array([3., 4.])])
+    store.write(replicates=[2], parameters=[np.array([5., 6.])])
+    loaded = store.load()
+    assert sorted(loaded.keys()) == [0, 1, 2]
+    np.testing.assert_array_equal(loaded[2], [5., 6.])
+    other_store = CheckpointStore(path=tmp_path, seed_sequence=np.random.SeedSequence(2))
+    assert other_store.load() == dict()
+
+
+def test_checkpoint_store_key(tmp_path):
+    store = CheckpointStore(path=tmp_path, seed_sequence=np.random.SeedSequence(1), key='a')
+    store.write(replicates=[0], parameters=[np.array([1., 2.])])
+    same_store = CheckpointStore(path=tmp_path, seed_sequence=np.random.SeedSequence(1), key='a')
+    assert sorted(same_store.load().keys()) == [0]
+    with pytest.raises(CheckpointError):
+        CheckpointStore(path=tmp_path, seed_sequence=np.random.SeedSequence(1), key='b')
+
+
+def test_checkpoint_store_groups(tmp_path):
+    store = CheckpointStore(path=tmp_path, seed_sequence=np.random.SeedSequence(1))
+    store.write(replicates=[4], parameters=[{'b': [1., 2.], 'a': [3., 4.]}])
+    loaded = store.load()
+    np.testing.assert_array_equal(loaded[4]['a'], [3., 4.])
+    np.testing.assert_array_equal(loaded[4]['b'], [1., 2.])
+
+
+def test_checkpoint_store_nested_groups(tmp_path):
+    store = CheckpointStore(path=tmp_path, seed_sequence=np.random.SeedSequence(1))
+    parameters = {('a', 'x'): [1., 2.], ('a', 'y'): [3., 4.], ('b', 'x'): [5., 6.]}
+    store.write(replicates=[0], parameters=[parameters])
+    loaded = store.load()
+    assert sorted(loaded[0].keys()) == sorted(parameters.keys())
+    for group, values in parameters.items():
+        np.testing.assert_array_equal(loaded[0][group], values)
+
+
+def test_checkpointed_bootstrap(df, tmp_path):
+    b_run = BinneyRun(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        df=df,
+        solver_method='scipy',
+        data_type='binomial'
+    )
+    b_run.fit()
+    b_run.make_uncertainty(n_boots=4, seed=0, batch_size=2, checkpoint_dir=tmp_path)
+    parameters = np.vstack(b_run.bootstrap.parameters)
+    assert len(list(tmp_path.glob('*/shard-*.npz'))) == 2
+
+    b_run.make_uncertainty(n_boots=6, seed=0, batch_size=2, checkpoint_dir=tmp_path)
+    assert len(list(tmp_path.glob('*/shard-*.npz'))) == 3
+    np.testing.assert_array_equal(np.vstack(b_run.bootstrap.parameters)[:4], parameters)
+
+    other_run = BinneyRun(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        df=df.iloc[:1000],
+        solver_method='scipy',
+        data_type='binomial'
+    )
+    other_run.fit()
+    with pytest.raises(CheckpointError):
+        other_run.make_uncertainty(n_boots=4, seed=0, batch_size=2, checkpoint_dir=tmp_path)
+
+
+def test_checkpointed_nested_bootstrap(group_data, tmp_path):
+    group_data = group_data.copy()
+    group_data['h'] = np.arange(len(group_data)) % 2
+    b_run = BinneyRun(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        df=group_data,
+        col_group=['g', 'h'],
+        solver_method='scipy',
+        data_type='bernoulli'
+    )
+    b_run.fit()
+    b_run.make_uncertainty(n_boots=2, seed=0, batch_size=2, checkpoint_dir=tmp_path)
+    parameters = list(b_run.bootstrap.parameters)
+    b_run.make_uncertainty(n_boots=2, seed=0, batch_size=2, checkpoint_dir=tmp_path)
+    for restored, param in zip(b_run.bootstrap.parameters, parameters):
+        assert restored.keys() == param.keys()
+        for group in param:
+            assert isinstance(group, tuple)
+            np.testing.assert_array_equal(restored[group], param[group])
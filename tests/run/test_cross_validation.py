@@ -0,0 +1,100 @@
+import numpy as np
+import pandas as pd
+
+from binney.run.cross_validation import CrossValidation, make_folds
+from binney.utils import binomial_deviance
+
+
+def test_make_folds(group_data):
+    folds = make_folds(df=group_data, n_folds=4, col_group='g', seed=0)
+    assert folds.shape == (len(group_data),)
+    counts = pd.crosstab(group_data['g'], folds).values
+    assert counts.max() - counts.min() <= 1
+    np.testing.assert_array_equal(folds, make_folds(df=group_data, n_folds=4, col_group='g', seed=0))
+
+
+def test_make_folds_single_row_groups(group_data):
+    df = group_data.copy()
+    df.loc[df.index[:3], 'g'] = [10, 11, 12]
+    folds = make_folds(df=df, n_folds=4, col_group='g', seed=0)
+    np.testing.assert_array_equal(folds[:3], -1)
+    assert (folds[3:] >= 0).all()
+
+
+def test_binomial_deviance():
+    obs = np.array([3, 0, 5])
+    total = np.array([5, 4, 5])
+    assert binomial_deviance(obs=obs, total=total, p=obs / total) == 0.
+    assert binomial_deviance(obs=obs, total=total, p=np.repeat(0.5, 3)) > 0.
+    np.testing.assert_almost_equal(
+        binomial_deviance(obs=obs, total=total, p=np.repeat(0.5, 3), weights=np.repeat(2., 3)),
+        2 * binomial_deviance(obs=obs, total=total, p=np.repeat(0.5, 3))
+    )
+
+
+def test_cross_validation(df):
+    cv = CrossValidation(
+        df=df,
+        grid=[{'covariates': None}, {'covariates': ['x1']}],
+        n_folds=3,
+        seed=0,
+        n_jobs=2,
+        col_success='success',
+        col_total='total',
+        solver_method='scipy'
+    )
+    deviance = cv.run()
+    assert deviance.shape == (2, 1)
+    assert cv.scores.shape == (6, 3)
+    assert cv.best_spec['covariates'] == ['x1']
+
+
+def test_cross_validation_priors(group_data):
+    cv = CrossValidation(
+        df=group_data,
+        grid=[{'coefficient_prior_var': 1e-6}, {'coefficient_prior_var': 1.}],
+        n_folds=3,
+        seed=0,
+        n_jobs=3,
+        col_success='success',
+        col_total='total',
+        col_group='g',
+        covariates=['x1'],
+        solver_method='scipy'
+    )
+    assert len(cv._structures()) == 1
+    cv.run()
+    assert cv.best_spec['coefficient_prior_var'] == 1.
+
+
+def test_cross_validation_grid_groups(group_data):
+    cv = CrossValidation(
+        df=group_data,
+        grid=[{}, {'col_group': 'g'}],
+        n_folds=3,
+        seed=0,
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        solver_method='scipy'
+    )
+    counts = pd.crosstab(group_data['g'], cv.folds).values
+    assert counts.max() - counts.min() <= 1
+
+
+def test_cross_validation_single_row_groups(group_data):
+    df = group_data.copy()
+    df.loc[df.index[:2], 'g'] = [10, 11]
+    cv = CrossValidation(
+        df=df,
+        grid=[{}, {'col_group': 'g'}],
+        n_folds=3,
+        seed=0,
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        solver_method='scipy'
+    )
+    assert cv.n_unscored == 2
+    deviance = cv.run()
+    assert np.isfinite(deviance['deviance']).all()
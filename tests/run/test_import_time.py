@@ -0,0 +1,43 @@
+import json
+import subprocess
+import sys
+
+# Seconds that a cold import of binney.run.run may take. This is a loose
+# guard against regressions; the deferred modules below are the strict one.
+IMPORT_BUDGET = 10.
+
+DEFERRED_MODULES = [
+    'ipopt',
+    'cyipopt',
+    'anml.solvers.base',
+    'binney.solvers.joint',
+]
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import binney.run.run
+elapsed = time.perf_counter() - start
+print(json.dumps({{
+    'elapsed': elapsed,
+    'loaded': [name for name in {modules!r} if name in sys.modules]
+}}))
+"""
+
+
+def cold_import():
+    result = subprocess.run(
+        [sys.executable, '-c', SCRIPT.format(modules=DEFERRED_MODULES)],
+        capture_output=True, text=True, check=True
+    )
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def test_import_defers_backends():
+    result = cold_import()
+    assert result['loaded'] == []
+
+
+def test_import_time():
+    result = cold_import()
+    assert result['elapsed'] < IMPORT_BUDGET
@@ -3,6 +3,7 @@ import pytest
 import pandas as pd
 
 from binney.run.run import BinneyRun, RunException
+from binney.run.bootstrap import BinomialBootstrap
 
 REL_TOL = 1e-2
 
@@ -160,6 +161,61 @@ def test_new_data(df, new_df):
     assert all(predict_1 != predict_2)
 
 
+def test_predict_after_uncertainty(spline_df):
+    b_run = BinneyRun(
+        col_success='success',
+        col_total='total',
+        df=spline_df,
+        splines={'x1': {'knots_num': 4, 'degree': 3}},
+        solver_method='scipy',
+        data_type='binomial'
+    )
+    b_run.fit()
+    predictions = b_run.predict(new_df=spline_df)
+    b_run.make_uncertainty(n_boots=3, seed=0)
+    np.testing.assert_array_equal(b_run.solver.x_opt, b_run.params_opt)
+    np.testing.assert_array_almost_equal(b_run.predict(new_df=spline_df), predictions)
+
+
+def test_predict_and_refit_after_uncertainty(df):
+    b_run = BinneyRun(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        df=df,
+        solver_method='scipy',
+        data_type='binomial'
+    )
+    b_run.fit()
+    params_opt = b_run.params_opt
+    predictions = b_run.predict()
+    b_run.make_uncertainty(n_boots=3, seed=0)
+    assert b_run.model.lr_specs is b_run.lr_specs
+    np.testing.assert_array_almost_equal(b_run.predict(), predictions)
+    b_run.fit()
+    np.testing.assert_array_almost_equal(b_run.params_opt, params_opt)
+
+
+def test_predict_repeated_rows(group_data):
+    b_run = BinneyRun(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        df=group_data,
+        solver_method='scipy',
+        col_group='g',
+        coefficient_prior_var=5.
+    )
+    b_run.fit()
+    new_df = group_data.iloc[np.tile(np.arange(0, len(group_data), 7), 3)]
+    preds = b_run.predict(new_df=new_df)
+    np.testing.assert_array_equal(preds, np.tile(preds[:len(new_df) // 3], 3))
+    np.testing.assert_array_almost_equal(
+        preds[:len(new_df) // 3],
+        b_run.predict(new_df=group_data.iloc[::7])
+    )
+
+
 def test_hierarchy_run(group_data):
     b_run = BinneyRun(
         col_success='success',
@@ -209,3 +265,213 @@ def test_hierarchy_spline(group_data_2):
     )
     b_run_grp.fit()
     b_run_grp.predict(group_data_2)
+
+
+def test_hierarchy_fit_path(group_data):
+    b_run_grp = BinneyRun(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        df=group_data,
+        solver_method='scipy',
+        col_group='g'
+    )
+    path = b_run_grp.fit_path(prior_vars=[1e-5, 1e-2, 5.], holdout_df=group_data)
+    assert list(path.columns) == ['coefficient_prior_var', 'deviance']
+    assert len(b_run_grp.path) == 3
+    assert path['deviance'].iloc[-1] < path['deviance'].iloc[0]
+    assert b_run_grp.params_opt == b_run_grp.path[-1]
+
+
+def test_fit_path_no_groups(df):
+    b_run = BinneyRun(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        df=df,
+        solver_method='scipy'
+    )
+    with pytest.raises(RunException):
+        b_run.fit_path(prior_vars=[1.])
+
+
+def test_hierarchy_levels_run(group_data):
+    df = group_data.assign(r=group_data['g'] // 3)
+    b_run_grp = BinneyRun(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        df=df,
+        solver_method='scipy',
+        data_type='binomial',
+        col_group=['r', 'g'],
+        coefficient_prior_var=5.,
+        n_jobs=2
+    )
+    b_run_grp.fit()
+    assert len(b_run_grp.params_opt) == 5
+    preds = b_run_grp.predict(new_df=df)
+    np.testing.assert_array_almost_equal(preds, df['p'], decimal=1)
+    b_run_grp.make_uncertainty(n_boots=2, seed=0)
+    assert b_run_grp.predict_draws(df=df).shape == (2, len(df))
+
+
+def test_joint_run(group_data):
+    b_run_grp = BinneyRun(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        df=group_data,
+        data_type='binomial',
+        solver_method='joint',
+        col_group='g',
+        coefficient_prior_var=5.
+    )
+    b_run_grp.fit()
+    preds = b_run_grp.predict(new_df=group_data)
+    np.testing.assert_array_almost_equal(preds, group_data['p'], decimal=1)
+    b_run_grp.make_uncertainty(n_boots=2, seed=0)
+    assert b_run_grp.predict_draws(df=group_data).shape == (2, len(group_data))
+
+    with pytest.raises(RunException):
+        BinneyRun(
+            col_success='success',
+            col_total='total',
+            df=group_data,
+            solver_method='joint'
+        )
+
+
+def test_lazy_spline_constraints(spline_concave_df):
+    splines = {
+        'x1': {
+            'degree': 3,
+            'knots_num': 4,
+            'knots_type': 'frequency',
+            'convex': True,
+            'constraint_grid_size': 200
+        }
+    }
+    fits = []
+    for lazy_constraints in [False, True]:
+        b_run = BinneyRun(
+            col_success='success',
+            col_total='total',
+            df=spline_concave_df,
+            splines=splines,
+            solver_method='ipopt',
+            lazy_constraints=lazy_constraints
+        )
+        b_run.fit()
+        fits.append(b_run)
+    assert len(fits[1].model.C) == 200
+    active = fits[1].solver.active_constraints
+    assert len(active) == 200 and active.any()
+    C, c_lb, c_ub = fits[1].lr_specs.constraints
+    assert np.all(C.dot(fits[1].params_opt) >= c_lb - 1e-6)
+    np.testing.assert_array_almost_equal(
+        fits[0].predict(), fits[1].predict(), decimal=3
+    )
+
+    fits[1].solver.max_cuts = 1
+    fits[1].fit()
+    assert fits[1].solver.active_constraints.all()
+    np.testing.assert_array_almost_equal(
+        fits[0].predict(), fits[1].predict(), decimal=3
+    )
+
+
+def test_array_data(df):
+    b_run = BinneyRun(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        df=df,
+        data_type='binomial'
+    )
+    b_run.fit()
+    b_run_arrays = BinneyRun(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        df={col: df[col].to_numpy() for col in df.columns},
+        data_type='binomial'
+    )
+    b_run_arrays.fit()
+    np.testing.assert_array_almost_equal(b_run.params_opt, b_run_arrays.params_opt)
+
+
+def test_subsample_failures():
+    rng = np.random.default_rng(1)
+    x = rng.standard_normal(20000)
+    p = 1 / (1 + np.exp(4 - x))
+    df = pd.DataFrame({
+        'success': rng.binomial(n=1, p=p),
+        'total': 1,
+        'x1': x
+    })
+    b_run = BinneyRun(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        df=df,
+        subsample_failures=0.1,
+        subsample_seed=0,
+        subsample_bootstrap=True
+    )
+    fit_df = b_run.lr_specs.data._df
+    assert len(fit_df) < len(df) / 5
+    assert fit_df['success'].sum() == df['success'].sum()
+    np.testing.assert_almost_equal(fit_df['total'].sum(), len(df), decimal=-3)
+    b_run.fit()
+    np.testing.assert_allclose(b_run.params_opt, [-4., 1.], atol=0.2)
+
+    b_run.make_uncertainty(n_boots=2, seed=0)
+    assert len(b_run.bootstrap.parameters) == 2
+
+    with pytest.raises(RunException):
+        BinneyRun(col_success='success', col_total='total', df=df,
+                  data_type='binomial', subsample_failures=0.1)
+    with pytest.raises(RunException):
+        BinneyRun(col_success='success', col_total='total', df=df,
+                  subsample_failures=0.1, subsample_bootstrap=True, uncertainty='poisson')
+
+
+def test_binned_splines():
+    rng = np.random.default_rng(2)
+    x = rng.uniform(-2, 2, size=50000)
+    p = 1 / (1 + np.exp(-np.sin(x)))
+    df = pd.DataFrame({
+        'success': rng.binomial(n=1, p=p),
+        'total': 1,
+        'x1': x
+    })
+    b_run = BinneyRun(
+        col_success='success',
+        col_total='total',
+        df=df,
+        splines={'x1': {'knots_type': 'domain', 'knots_num': 4, 'degree': 3, 'bins': 200}}
+    )
+    assert len(b_run.lr_specs.data._df) <= 200
+    assert isinstance(b_run.bootstrap, BinomialBootstrap)
+    b_run.fit()
+    error = b_run.approximation_error()
+    assert error['rows'] == len(df)
+    assert error['aggregated_rows'] <= 200
+    assert error['max_abs_error'] < 1e-2
+    assert abs(error['deviance_binned'] - error['deviance_exact']) < 1e-3 * error['deviance_exact']
+
+
+def test_binned_splines_weights(df):
+    weighted_df = df.assign(w=0.5)
+    splines = {'x1': {'knots_type': 'domain', 'knots_num': 4, 'degree': 3, 'bins': 50}}
+    with pytest.raises(RunException):
+        BinneyRun(col_success='success', col_total='total', df=weighted_df,
+                  col_weight='w', splines=splines)
+    bernoulli_df = df.assign(success=(df['success'] > 50).astype(int), total=1)
+    with pytest.raises(RunException):
+        BinneyRun(col_success='success', col_total='total', df=bernoulli_df,
+                  data_type='bernoulli', subsample_failures=0.5, splines=splines)
+    b_run = BinneyRun(col_success='success', col_total='total', df=weighted_df,
+                      col_weight='w', splines=splines, uncertainty='asymptotic')
+    assert (b_run.lr_specs.data._df['w'] == 1.).all()
@@ -0,0 +1,100 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+from binney.run.run import BinneyRun
+from binney.run.serve import PredictionServer, PredictionError
+
+
+@pytest.fixture
+def b_run(df):
+    b_run = BinneyRun(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        df=df,
+        solver_method='scipy',
+        data_type='binomial'
+    )
+    b_run.fit()
+    return b_run
+
+
+def test_save_load(b_run, df, tmp_path):
+    b_run.save(tmp_path / 'model.pkl')
+    loaded = BinneyRun.load(tmp_path / 'model.pkl')
+    np.testing.assert_array_equal(loaded.params_opt, b_run.params_opt)
+    np.testing.assert_array_almost_equal(loaded.predict(new_df=df), b_run.predict(new_df=df))
+
+
+def test_prediction_server_batches(b_run, df):
+    rows = [df.iloc[i:i + 3] for i in range(0, 30, 3)]
+
+    async def predict():
+        async with PredictionServer(b_run, max_delay=0.05) as server:
+            results = await asyncio.gather(*[
+                server.predict(rows=r[['x1']].to_dict(orient='list')) for r in rows
+            ])
+            return results, server.n_batches
+
+    results, n_batches = asyncio.run(predict())
+    assert n_batches == 1
+    for r, result in zip(rows, results):
+        np.testing.assert_array_almost_equal(result['mean'], b_run.predict(new_df=r))
+
+
+def test_prediction_server_errors(b_run):
+    async def handle():
+        async with PredictionServer(b_run) as server:
+            with pytest.raises(PredictionError):
+                await server.predict(rows={'x2': [1.]})
+            return await server.handle({'rows': [{'x1': 0.}], 'quantiles': [0.5]})
+
+    assert 'error' in asyncio.run(handle())
+
+
+def test_prediction_server_http(b_run, df):
+    async def request():
+        async with PredictionServer(b_run) as server:
+            http_server = await server.serve_http(port=0)
+            port = http_server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            payload = json.dumps({'rows': {'x1': df['x1'][:5].tolist()}}).encode()
+            writer.write(
+                f"POST /predict HTTP/1.1\r\nContent-Length: {len(payload)}\r\n"
+                f"Connection: close\r\n\r\n".encode() + payload
+            )
+            await writer.drain()
+            response = await reader.read()
+            http_server.close()
+            await http_server.wait_closed()
+            return response
+
+    response = asyncio.run(request())
+    status, _, body = response.partition(b'\r\n\r\n')
+    assert status.startswith(b'HTTP/1.1 200')
+    np.testing.assert_array_almost_equal(
+        json.loads(body)['mean'], b_run.predict(new_df=df[:5])
+    )
+
+
+@pytest.mark.parametrize("request_line", [b"\r\n", b"GARBAGE\r\n", b"GET /health HTTP/1.1 x\r\n"])
+def test_prediction_server_http_malformed(b_run, request_line):
+    async def request():
+        async with PredictionServer(b_run) as server:
+            http_server = await server.serve_http(port=0)
+            port = http_server.sockets[0].getsockname()[1]
+            reader, writer = await asyncio.open_connection('127.0.0.1', port)
+            writer.write(request_line + b"\r\n")
+            await writer.drain()
+            response = await reader.read()
+            http_server.close()
+            await http_server.wait_closed()
+            return response
+
+    response = asyncio.run(request())
+    status, _, body = response.partition(b'\r\n\r\n')
+    assert status.startswith(b'HTTP/1.1 400')
+    assert 'error' in json.loads(body)
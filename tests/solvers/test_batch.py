@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+
+from binney.solvers.batch import batched_newton, BatchSolverError
+
+
+def test_batched_newton():
+    rng = np.random.default_rng(0)
+    n = 1000
+    design_matrix = np.column_stack([np.ones(n), rng.standard_normal(n)])
+    p = 1 / (1 + np.exp(-design_matrix.dot([1., 2.])))
+    total = np.repeat(100., n)
+    obs = rng.binomial(n=100, p=p, size=(5, n)).astype(float)
+    x_opt = batched_newton(
+        design_matrix=design_matrix, obs=obs, total=total, x_init=np.zeros(2)
+    )
+    assert x_opt.shape == (5, 2)
+    for b in range(5):
+        mp = total / (1 + np.exp(-design_matrix.dot(x_opt[b])))
+        np.testing.assert_array_almost_equal((mp - obs[b]).dot(design_matrix), np.zeros(2))
+    np.testing.assert_array_almost_equal(x_opt.mean(axis=0), [1., 2.], decimal=1)
+
+
+def test_batched_newton_prior():
+    rng = np.random.default_rng(0)
+    n = 100
+    design_matrix = np.column_stack([np.ones(n), rng.standard_normal(n)])
+    obs = rng.binomial(n=10, p=0.5, size=(2, n)).astype(float)
+    x_opt = batched_newton(
+        design_matrix=design_matrix, obs=obs, total=np.repeat(10., n), x_init=np.zeros(2),
+        prior_mean=np.array([3., 3.]), prior_std=np.array([1e-4, 1e-4])
+    )
+    np.testing.assert_array_almost_equal(x_opt, np.full((2, 2), 3.), decimal=2)
+
+
+def test_batched_newton_singular():
+    design_matrix = np.ones((10, 2))
+    with pytest.raises(BatchSolverError):
+        batched_newton(
+            design_matrix=design_matrix, obs=np.ones((1, 10)), total=np.repeat(2., 10),
+            x_init=np.zeros(2)
+        )
+
+
+def test_batched_newton_max_iter():
+    rng = np.random.default_rng(0)
+    n = 100
+    design_matrix = np.column_stack([np.ones(n), rng.standard_normal(n)])
+    obs = rng.binomial(n=10, p=0.5, size=(2, n)).astype(float)
+    with pytest.warns(RuntimeWarning, match='did not converge'):
+        x_opt = batched_newton(
+            design_matrix=design_matrix, obs=obs, total=np.repeat(10., n),
+            x_init=np.full(2, 10.), max_iter=1
+        )
+    assert np.all(np.isfinite(x_opt))
+
+
+def test_batched_newton_far_start():
+    rng = np.random.default_rng(0)
+    n = 1000
+    design_matrix = np.column_stack([np.ones(n), rng.standard_normal(n)])
+    obs = rng.binomial(n=10, p=0.5, size=(3, n)).astype(float)
+    total = np.repeat(10., n)
+    x_opt = batched_newton(
+        design_matrix=design_matrix, obs=obs, total=total, x_init=np.full(2, 30.)
+    )
+    for b in range(3):
+        mp = total / (1 + np.exp(-design_matrix.dot(x_opt[b])))
+        np.testing.assert_array_almost_equal((mp - obs[b]).dot(design_matrix), np.zeros(2))
@@ -66,3 +66,114 @@ def test_hierarchy_tight(group_data):
         slopes.append(value[1])
     u_hat = intercepts - np.mean(intercepts)
     np.testing.assert_almost_equal(u_hat, np.zeros(u_hat.shape), decimal=1)
+
+
+def test_hierarchy_reuses_group_specs(group_data):
+    lr_specs = LRSpecs(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        col_group='g'
+    )
+    lr_specs.configure_data(df=group_data)
+    model = BinomialModel()
+    model.attach_specs(lr_specs)
+    solver = ScipySolver(model_instance=model)
+    solver.attach_lr_specs(lr_specs)
+    h = Hierarchy(solver=solver, coefficient_prior_var=1.)
+    options = {'solver_options': {}}
+
+    h.fit(x_init=np.zeros(2), options=options, data=lr_specs.data)
+    design_matrices = {
+        group: specs.design_matrix for group, specs in h.group_specs.items()
+    }
+    assert model.lr_specs is lr_specs
+    x_loose = dict(h.x_opt)
+
+    h.coefficient_prior_var = 1e-5
+    h.fit(x_init=np.zeros(2), options=options, data=lr_specs.data)
+    for group, specs in h.group_specs.items():
+        assert specs.design_matrix is design_matrices[group]
+        np.testing.assert_array_almost_equal(specs.prior_std, np.repeat(1e-5**0.5, 2))
+    assert any(x_loose[group] != h.x_opt[group] for group in x_loose)
+
+
+def test_hierarchy_fit_path(group_data):
+    lr_specs = LRSpecs(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        col_group='g'
+    )
+    lr_specs.configure_data(df=group_data)
+    model = BinomialModel()
+    model.attach_specs(lr_specs)
+    solver = ScipySolver(model_instance=model)
+    solver.attach_lr_specs(lr_specs)
+    h = Hierarchy(solver=solver, coefficient_prior_var=1.)
+    options = {'solver_options': {}}
+
+    path = h.fit_path(
+        x_init=np.zeros(2), options=options, data=lr_specs.data,
+        prior_vars=[1e-5, 1e-2, 1.]
+    )
+    assert len(path) == 3
+    assert h.coefficient_prior_var == 1.
+    assert h.x_opt is path[-1]
+    spread = [np.std([x[0] for x in xs.values()]) for xs in path]
+    assert spread[0] < spread[1] < spread[2]
+
+    h.fit(x_init=np.zeros(2), options=options, data=lr_specs.data)
+    for group, x in h.x_opt.items():
+        np.testing.assert_array_almost_equal(x, path[-1][group], decimal=3)
+
+
+def test_hierarchy_levels(group_data):
+    df = group_data.assign(r=group_data['g'] // 3)
+    lr_specs = LRSpecs(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        col_group=['r', 'g']
+    )
+    lr_specs.configure_data(df=df)
+    model = BinomialModel()
+    model.attach_specs(lr_specs)
+    solver = ScipySolver(model_instance=model)
+    solver.attach_lr_specs(lr_specs)
+    h = Hierarchy(solver=solver, coefficient_prior_var=1., n_jobs=2)
+    options = {'solver_options': {}}
+
+    h.fit(x_init=np.zeros(2), options=options, data=lr_specs.data)
+    assert [sorted(partition.keys()) for partition in h.partitions] == [
+        [0, 1], [(0, 0), (0, 1), (0, 2), (1, 3), (1, 4)]
+    ]
+    assert sorted(h.x_opt.keys()) == sorted(h.partitions[1].keys())
+    for group in h.x_opt:
+        np.testing.assert_array_almost_equal(
+            h.group_specs[group].prior_mean, h.x_nodes[Hierarchy.parent(group, 1)]
+        )
+    assert model.lr_specs is lr_specs
+    predictions = h.predict(new_df=df)
+    np.testing.assert_array_almost_equal(predictions, df['p'], decimal=1)
+
+
+def test_hierarchy_n_jobs(group_data):
+    x_opt = []
+    for n_jobs in [1, 3]:
+        lr_specs = LRSpecs(
+            col_success='success',
+            col_total='total',
+            covariates=['x1'],
+            col_group='g'
+        )
+        lr_specs.configure_data(df=group_data)
+        model = BinomialModel()
+        model.attach_specs(lr_specs)
+        solver = ScipySolver(model_instance=model)
+        solver.attach_lr_specs(lr_specs)
+        h = Hierarchy(solver=solver, coefficient_prior_var=1., n_jobs=n_jobs)
+        h.fit(x_init=np.zeros(2), options={'solver_options': {}}, data=lr_specs.data)
+        x_opt.append(h.x_opt)
+    for group in x_opt[0]:
+        np.testing.assert_array_almost_equal(x_opt[0][group], x_opt[1][group])
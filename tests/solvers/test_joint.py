@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+
+from binney.solvers.solver import ScipySolver
+from binney.solvers.hierarchical_solver import Hierarchy
+from binney.solvers.joint import JointHierarchy, JointSolverError
+from binney.data.data import LRSpecs
+from binney.model.model import BinomialModel
+
+
+def make_solver(df, col_group='g'):
+    lr_specs = LRSpecs(
+        col_success='success',
+        col_total='total',
+        covariates=['x1'],
+        col_group=col_group
+    )
+    lr_specs.configure_data(df=df)
+    model = BinomialModel()
+    model.attach_specs(lr_specs)
+    solver = ScipySolver(model_instance=model)
+    solver.attach_lr_specs(lr_specs)
+    return solver, lr_specs
+
+
+def test_joint_hierarchy(group_data):
+    solver, lr_specs = make_solver(group_data)
+    h = JointHierarchy(solver=solver, coefficient_prior_var=1.)
+    h.fit(x_init=np.zeros(2), data=lr_specs.data)
+
+    intercepts = np.array([value[0] for value in h.x_opt.values()])
+    u_hat = intercepts - np.mean(intercepts)
+    np.testing.assert_array_almost_equal(u_hat, group_data.u.unique(), decimal=1)
+    predictions = h.predict(new_df=group_data)
+    np.testing.assert_array_almost_equal(predictions, group_data['p'], decimal=1)
+
+
+def test_joint_hierarchy_tight(group_data):
+    solver, lr_specs = make_solver(group_data)
+    h = JointHierarchy(solver=solver, coefficient_prior_var=1e-8)
+    h.fit(x_init=np.zeros(2), data=lr_specs.data)
+
+    solver.fit(x_init=np.zeros(2), data=lr_specs.data, options={'solver_options': {}})
+    for value in h.x_opt.values():
+        np.testing.assert_array_almost_equal(value, solver.x_opt, decimal=3)
+
+
+def test_joint_hierarchy_cg(group_data):
+    solver, lr_specs = make_solver(group_data)
+    h_direct = JointHierarchy(solver=solver, coefficient_prior_var=1.)
+    h_direct.fit(x_init=np.zeros(2), data=lr_specs.data)
+    h_cg = JointHierarchy(solver=solver, coefficient_prior_var=1., linear_solver='cg')
+    h_cg.fit(x_init=np.zeros(2), data=lr_specs.data)
+    for group in h_direct.x_opt:
+        np.testing.assert_array_almost_equal(h_direct.x_opt[group], h_cg.x_opt[group])
+
+    with pytest.raises(JointSolverError):
+        JointHierarchy(solver=solver, coefficient_prior_var=1., linear_solver='lu')
+
+
+def test_joint_hierarchy_levels(group_data):
+    df = group_data.assign(r=group_data['g'] // 3)
+    solver, lr_specs = make_solver(df, col_group=['r', 'g'])
+    h = JointHierarchy(solver=solver, coefficient_prior_var=1.)
+    path = h.fit_path(x_init=np.zeros(2), data=lr_specs.data, prior_vars=[1e-2, 1.])
+    assert len(path) == 2
+    assert h._design.shape == (len(df), 2 * (1 + 2 + 5))
+    assert sorted(h.x_opt.keys()) == [(0, 0), (0, 1), (0, 2), (1, 3), (1, 4)]
+    assert {0, 1} <= set(h.x_nodes.keys())
+    assert isinstance(h, Hierarchy)
+
+
+def test_joint_hierarchy_max_iter(group_data):
+    solver, lr_specs = make_solver(group_data)
+    h = JointHierarchy(solver=solver, coefficient_prior_var=1., max_iter=1)
+    with pytest.warns(RuntimeWarning, match='did not converge'):
+        h.fit(x_init=np.full(2, 10.), data=lr_specs.data)
+
+
+def test_joint_hierarchy_cg_max_iter(group_data):
+    solver, lr_specs = make_solver(group_data)
+    h = JointHierarchy(solver=solver, coefficient_prior_var=1., linear_solver='cg',
+                       cg_max_iter=1)
+    with pytest.raises(JointSolverError, match='did not converge.*after 1 iterations'):
+        h.fit(x_init=np.zeros(2), data=lr_specs.data)